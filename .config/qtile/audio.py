@@ -0,0 +1,252 @@
+"""One in-process PulseAudio connection shared by the volume keys and the bar."""
+
+import asyncio
+import os
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+from qtile_extras import widget
+
+
+class AudioControl:
+    # Holds a single pulsectl_asyncio connection for the session. Volume
+    # key presses only add to a pending delta; one task applies it, and any
+    # presses (or auto-repeats) that land while a change is in flight are
+    # folded into the next one. New levels go straight to listeners, with
+    # no re-query.
+    #
+    # ``server`` (or QTILE_PULSE_SERVER) may point at any pulse socket, e.g.
+    # "unix:/tmp/mock-pulse.sock", for running against a mock server.
+
+    # Seconds between applied changes while a key is held.
+    coalesce = 0.03
+    # Server events this soon after our own change are echoes of it.
+    echo_window = 0.2
+    # Seconds before reconnecting a lost event subscription, doubling up
+    # to reconnect_max while the server stays away.
+    reconnect_min = 0.5
+    reconnect_max = 30
+
+    def __init__(self, server=None, limit_max_volume=True, client_name="qtile"):
+        self.server = server or os.environ.get("QTILE_PULSE_SERVER")
+        self.limit_max_volume = limit_max_volume
+        self.client_name = client_name
+        self.volume = None
+        self.muted = None
+        self.applied = 0
+        self.requested = 0
+        self.syncs = 0
+        self._pulse = None
+        self._sink = None
+        self._pending_delta = 0.0
+        self._pending_mute = False
+        self._busy = False
+        self._echo_until = 0.0
+        self._dirty = False
+        self._syncing = False
+        self._lock = None
+        self._watcher = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+        if self.volume is not None:
+            callback(self.volume, self.muted)
+        if self._pulse is None and not self._busy:
+            self._busy = True
+            create_task(self._run())
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+        # The last widget was finalized (a reload or shutdown). A key press
+        # connects again.
+        if not self._listeners:
+            self.stop()
+
+    def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        self._disconnect()
+        self._pending_delta, self._pending_mute = 0.0, False
+
+    def _disconnect(self):
+        if self._pulse is not None:
+            try:
+                self._pulse.disconnect()
+            except Exception:
+                logger.exception("Unable to close the PulseAudio connection")
+            self._pulse = None
+
+    def _publish(self, volume, muted):
+        if (volume, muted) == (self.volume, self.muted):
+            return
+        self.volume, self.muted = volume, muted
+        for callback in list(self._listeners):
+            callback(volume, muted)
+
+    async def _connect(self):
+        # Key presses and the watcher may both find the connection gone;
+        # only the first makes a new one.
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._pulse is None:
+                await self._open()
+
+    async def _open(self):
+        from pulsectl_asyncio import PulseAsync
+
+        pulse = PulseAsync(self.client_name, server=self.server)
+        await pulse.connect()
+        self._pulse = pulse
+        try:
+            await self._sync()
+        except Exception:
+            self._disconnect()
+            raise
+        if self._watcher is None:
+            self._watcher = create_task(self._watch())
+
+    async def _sync(self):
+        self.syncs += 1
+        pulse = self._pulse
+        info = await pulse.server_info()
+        self._sink = await pulse.get_sink_by_name(info.default_sink_name)
+        self._publish(round(self._sink.volume.value_flat, 2), bool(self._sink.mute))
+
+    async def _watch(self):
+        # Changes made elsewhere (pavucontrol, headphones) still reach the
+        # bar. Events only mark the state dirty, so none are lost to a sync
+        # or a change in flight. If the subscription ends, the connection is
+        # made again.
+        delay = self.reconnect_min
+        while True:
+            try:
+                if self._pulse is None:
+                    await self._connect()
+                async for _event in self._pulse.subscribe_events("sink", "server"):
+                    delay = self.reconnect_min
+                    self._changed_elsewhere()
+                logger.warning("PulseAudio event subscription ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost PulseAudio event subscription, reconnecting in %ss", delay)
+            self._disconnect()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+    def _changed_elsewhere(self):
+        self._dirty = True
+        if not self._syncing and not self._busy:
+            self._syncing = True
+            create_task(self._resync())
+
+    async def _resync(self):
+        # One sync at a time; whatever arrives during it is read by one
+        # more. Echoes of our own change are waited out, then read once.
+        loop = asyncio.get_event_loop()
+        try:
+            while self._dirty and not self._busy and self._pulse is not None:
+                wait = self._echo_until - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                self._dirty = False
+                await self._sync()
+        except Exception:
+            logger.exception("Unable to read PulseAudio state")
+        finally:
+            self._syncing = False
+
+    def change(self, delta):
+        self.requested += 1
+        self._pending_delta += delta
+        self._kick()
+
+    def toggle_mute(self):
+        self.requested += 1
+        self._pending_mute = not self._pending_mute
+        self._kick()
+
+    def _kick(self):
+        if not self._busy:
+            self._busy = True
+            create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        try:
+            if self._pulse is None:
+                await self._connect()
+            while self._pending_delta or self._pending_mute:
+                delta, self._pending_delta = self._pending_delta, 0.0
+                mute, self._pending_mute = self._pending_mute, False
+                volume, muted = self.volume, self.muted
+                if delta:
+                    ceiling = 1.0 if self.limit_max_volume else 1.5
+                    volume = round(min(max(volume + delta, 0.0), ceiling), 2)
+                    await self._pulse.volume_set_all_chans(self._sink, volume)
+                if mute:
+                    muted = not muted
+                    await self._pulse.mute(self._sink, muted)
+                self.applied += 1
+                self._echo_until = loop.time() + self.echo_window
+                self._publish(volume, muted)
+                await asyncio.sleep(self.coalesce)
+        except Exception:
+            logger.exception("Unable to talk to PulseAudio")
+            self._disconnect()
+            self._pending_delta, self._pending_mute = 0.0, False
+        finally:
+            self._busy = False
+            # Events that came in meanwhile, held back until now.
+            if self._dirty:
+                self._changed_elsewhere()
+
+
+audio = AudioControl()
+
+
+# Callables for lazy.function
+def change_volume(qtile, delta):
+    audio.change(delta)
+
+
+def toggle_mute(qtile):
+    audio.toggle_mute()
+
+
+class VolumeStatus(widget.TextBox):
+    # Renders the shared AudioControl state; replaces widget.PulseVolume and
+    # its separate connection.
+    defaults = [
+        ("step", 0.02, "Volume change per scroll step"),
+        ("mute_text", "M", "Text shown when muted"),
+        ("fmt_volume", "{}%", "Format for the volume percentage"),
+    ]
+
+    def __init__(self, control=None, **config):
+        widget.TextBox.__init__(self, "", **config)
+        self.add_defaults(VolumeStatus.defaults)
+        self.control = control or audio
+        self.add_callbacks(
+            {
+                "Button1": self.control.toggle_mute,
+                "Button4": lambda: self.control.change(self.step),
+                "Button5": lambda: self.control.change(-self.step),
+            }
+        )
+
+    def _configure(self, qtile, bar):
+        widget.TextBox._configure(self, qtile, bar)
+        self.control.subscribe(self._changed)
+
+    def _changed(self, volume, muted):
+        self.update(self.mute_text if muted else self.fmt_volume.format(round(volume * 100)))
+
+    def finalize(self):
+        self.control.unsubscribe(self._changed)
+        widget.TextBox.finalize(self)
@@ -0,0 +1,163 @@
+"""Concurrent, supervised autostart of session daemons on qtile's event loop."""
+
+import asyncio
+import time
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+
+class Service:
+    # cmd:          argv to run
+    # after:        names of services that must be ready first
+    # ready:        callable returning a bool or awaitable bool; polled until
+    #               true (or ready_timeout) before dependents are started
+    # oneshot:      a clean exit is success, not a crash (e.g. self-forking
+    #               daemons such as ``playerctld daemon``)
+    # max_restarts: restarts allowed before giving up on a crashing daemon
+
+    def __init__(
+        self,
+        name,
+        cmd,
+        after=(),
+        ready=None,
+        ready_timeout=10.0,
+        oneshot=False,
+        max_restarts=5,
+        backoff=1.0,
+        max_backoff=60.0,
+    ):
+        self.name = name
+        self.cmd = cmd
+        self.after = tuple(after)
+        self.ready = ready
+        self.ready_timeout = ready_timeout
+        self.oneshot = oneshot
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+
+class Autostart:
+    # A run that stays up this long resets the backoff.
+    stable_after = 30.0
+
+    def __init__(self, services):
+        self.services = {service.name: service for service in services}
+        self.timings = {}
+        self.restarts = {}
+        self._ready = {}
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.monotonic()
+        self._ready = {name: asyncio.Event() for name in self.services}
+        for service in self.services.values():
+            create_task(self._supervise(service))
+        create_task(self._report())
+
+    def _since_start(self):
+        return (time.monotonic() - self._started_at) * 1000
+
+    # Returns None once the service is ready, otherwise why it is not.
+    async def _wait_ready(self, service, proc):
+        if service.ready is None:
+            return None
+        deadline = time.monotonic() + service.ready_timeout
+        while time.monotonic() < deadline:
+            if proc.returncode is not None and not service.oneshot:
+                return "exited with {}".format(proc.returncode)
+            try:
+                result = service.ready()
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except Exception as e:
+                return "ready check raised {!r}".format(e)
+            if result:
+                return None
+            await asyncio.sleep(0.05)
+        return "not ready after {:.1f}s".format(service.ready_timeout)
+
+    async def _supervise(self, service):
+        for dep in service.after:
+            if dep in self._ready:
+                await self._ready[dep].wait()
+            else:
+                logger.warning("autostart: %s depends on unknown service %s", service.name, dep)
+
+        timing = self.timings[service.name] = {"queued_ms": self._since_start()}
+        attempt = 0
+        while True:
+            launched = time.monotonic()
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    *service.cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    start_new_session=True,
+                )
+            except OSError as e:
+                logger.warning("autostart: unable to start %s: %s", service.name, e)
+                timing["failed"] = str(e)
+                # Dependents still get their turn rather than waiting forever.
+                self._ready[service.name].set()
+                return
+
+            if "spawned_ms" not in timing:
+                timing["spawned_ms"] = self._since_start()
+                failure = await self._wait_ready(service, proc)
+                if failure is None:
+                    timing["ready_ms"] = self._since_start()
+                else:
+                    logger.warning("autostart: %s did not become ready: %s", service.name, failure)
+                    timing["failed"] = failure
+                # Dependents are released either way, as for a failed spawn.
+                self._ready[service.name].set()
+
+            returncode = await proc.wait()
+            if service.oneshot and returncode == 0:
+                return
+            if time.monotonic() - launched > self.stable_after:
+                attempt = 0
+            if attempt >= service.max_restarts:
+                logger.warning(
+                    "autostart: %s exited with %s, giving up after %d restarts",
+                    service.name,
+                    returncode,
+                    attempt,
+                )
+                return
+            delay = min(service.backoff * 2**attempt, service.max_backoff)
+            attempt += 1
+            self.restarts[service.name] = self.restarts.get(service.name, 0) + 1
+            logger.info(
+                "autostart: %s exited with %s, restarting in %.1fs",
+                service.name,
+                returncode,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    async def _report(self):
+        await asyncio.gather(*(event.wait() for event in self._ready.values()))
+        for line in self.report():
+            logger.info("autostart: %s", line)
+
+    def report(self):
+        lines = []
+        for name, timing in self.timings.items():
+            if "failed" in timing:
+                lines.append("{}: failed ({})".format(name, timing["failed"]))
+                continue
+            lines.append(
+                "{}: queued {:.1f}ms, spawned {:.1f}ms, ready {:.1f}ms, restarts {}".format(
+                    name,
+                    timing["queued_ms"],
+                    timing.get("spawned_ms", 0.0),
+                    timing.get("ready_ms", 0.0),
+                    self.restarts.get(name, 0),
+                )
+            )
+        return lines
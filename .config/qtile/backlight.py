@@ -0,0 +1,129 @@
+"""In-process sysfs backlight control with coalesced, ramped changes."""
+
+import asyncio
+import os
+
+from libqtile import qtile
+from libqtile.log_utils import logger
+
+
+class Backlight:
+    # Key presses only move ``target``; one ramp walks the real brightness
+    # there over ``ramp_frames`` frames, so a held key is a single smooth
+    # change instead of a write (or a brightnessctl fork) per repeat.
+    # Listeners get the new level as a 0..1 fraction after every write.
+    #
+    # ``sysfs`` may be a fake directory laid out like /sys/class/backlight.
+
+    def __init__(self, sysfs="/sys/class/backlight", device=None, ramp_frames=4, frame=1 / 60):
+        self.sysfs = sysfs
+        self.device = self._device = device
+        self.ramp_frames = ramp_frames
+        self.frame = frame
+        self.max = None
+        self.current = None
+        self.target = None
+        self.writes = 0
+        self._handle = None
+        self._listeners = []
+        self._use_brightnessctl = False
+
+    def _dir(self):
+        if self.device is None:
+            try:
+                self.device = sorted(os.listdir(self.sysfs))[0]
+            except (OSError, IndexError):
+                return None
+        return os.path.join(self.sysfs, self.device)
+
+    def _load(self):
+        directory = self._dir()
+        if directory is None:
+            return False
+        try:
+            with open(os.path.join(directory, "max_brightness")) as f:
+                self.max = int(f.read())
+            with open(os.path.join(directory, "brightness")) as f:
+                self.current = int(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning("Unable to read backlight %s: %s", directory, e)
+            return False
+        return True
+
+    @property
+    def level(self):
+        if self.current is None and not self._load():
+            return None
+        return self.current / self.max if self.max else None
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+        if self.level is not None:
+            callback(self.level)
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def change(self, fraction):
+        # Re-read when idle so changes made by other tools are picked up.
+        if self._handle is None and not self._load():
+            return
+        base = self.target if self.target is not None else self.current
+        self.target = min(max(round(base + fraction * self.max), 0), self.max)
+        if self._handle is None:
+            self._frames_left = self.ramp_frames
+            self._handle = asyncio.get_event_loop().call_soon(self._step)
+        else:
+            # A new press during a ramp restarts the frame budget from here.
+            self._frames_left = self.ramp_frames
+
+    def _step(self):
+        # Whatever happens, a ramp that stops here must clear _handle, or
+        # change() would never schedule another one.
+        self._handle = None
+        remaining = self.target - self.current
+        frames = max(self._frames_left, 1)
+        value = self.current + int(remaining / frames) if frames > 1 else self.target
+        self._frames_left -= 1
+        if self._write(value) and self.current != self.target:
+            self._handle = asyncio.get_event_loop().call_later(self.frame, self._step)
+        else:
+            self.target = None
+
+    def _write(self, value):
+        if not self._use_brightnessctl:
+            try:
+                directory = self._dir()
+                if directory is None:
+                    raise FileNotFoundError("no device under {}".format(self.sysfs))
+                with open(os.path.join(directory, "brightness"), "w") as f:
+                    f.write(str(value))
+            except PermissionError:
+                # No udev rule granting write access; fall back to
+                # brightnessctl, which only ever gets the final value.
+                logger.warning("Backlight not writable, falling back to brightnessctl")
+                self._use_brightnessctl = True
+            except OSError as e:
+                # The device went away (ENOENT after a hotplug) or refused the
+                # value; drop the ramp and look the device up again next time.
+                logger.warning("Unable to set backlight: %s", e)
+                self.device = self._device
+                self.current = None
+                return False
+        if self._use_brightnessctl:
+            value = self.target
+            qtile.cmd_spawn(["brightnessctl", "-q", "s", str(value)])
+        self.writes += 1
+        self.current = value
+        for callback in list(self._listeners):
+            callback(value / self.max)
+        return True
+
+
+backlight = Backlight()
+
+
+# Callable for lazy.function
+def change_brightness(qtile, fraction):
+    backlight.change(fraction)
@@ -0,0 +1,37 @@
+"""Bars whose widgets are only built once the bar is placed on a screen."""
+
+from libqtile import bar, qtile
+
+
+class LazyBar(bar.Bar):
+    # Takes a factory returning the widget list instead of the list itself.
+    # Screens that never get an output never construct their widgets, and
+    # reloading the config does not build anything until qtile places it.
+
+    def __init__(self, factory, size, **config):
+        bar.Bar.__init__(self, [], size, **config)
+        self.factory = factory
+
+    def _configure(self, qtile, screen, *args, **kwargs):
+        if not self.widgets:
+            self.widgets = self.factory()
+        bar.Bar._configure(self, qtile, screen, *args, **kwargs)
+
+
+def detect_outputs():
+    # Output geometries as qtile's core reports them; a single output when
+    # there is no running qtile to ask (e.g. under harness.py).
+    try:
+        return qtile.core.get_screen_info() or [None]
+    except AttributeError:
+        return [None]
+
+
+def screens_per_output(template, outputs=None):
+    # One Screen per output from the same template(primary) definition.
+    # Only the first output is primary, which is where single-instance
+    # widgets like the systray go. The status sources behind the widgets
+    # (audio, power_supply, dunst_state, scheduler) are shared singletons,
+    # so each extra bar adds renderers, not pollers.
+    outputs = outputs or detect_outputs()
+    return [template(primary=index == 0) for index in range(len(outputs))]
@@ -0,0 +1,270 @@
+"""Battery state pushed by power-supply uevents, with adaptive fallback polling."""
+
+import asyncio
+import os
+import socket
+from collections import namedtuple
+
+from libqtile.log_utils import logger
+from qtile_extras import widget
+
+
+NETLINK_KOBJECT_UEVENT = 15
+
+BatteryState = namedtuple("BatteryState", "status percent hours minutes watts")
+
+
+def _read(directory, name):
+    try:
+        with open(os.path.join(directory, name)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _read_int(directory, *names):
+    for name in names:
+        value = _read(directory, name)
+        if value is not None:
+            try:
+                return int(value)
+            except ValueError:
+                pass
+    return None
+
+
+class PowerSupply:
+    # Reads /sys/class/power_supply (or a fake tree passed as ``sysfs``) on
+    # kernel power_supply uevents. Between events it polls on an interval
+    # that doubles while the reading is steady, up to max_interval, and
+    # drops back to min_interval on any change or when the charge is low.
+
+    def __init__(
+        self,
+        sysfs="/sys/class/power_supply",
+        min_interval=15,
+        max_interval=300,
+        low_percentage=0.15,
+        uevents=True,
+    ):
+        self.sysfs = sysfs
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.low_percentage = low_percentage
+        self.uevents = uevents
+        self.interval = min_interval
+        self.state = None
+        self.events = 0
+        self.polls = 0
+        self._listeners = []
+        self._handle = None
+        self._socket = None
+        self._loop = None
+        self._pending = False
+
+    def battery_dir(self):
+        try:
+            names = sorted(os.listdir(self.sysfs))
+        except OSError:
+            return None
+        for name in names:
+            directory = os.path.join(self.sysfs, name)
+            if _read(directory, "type") == "Battery":
+                return directory
+        return None
+
+    def read(self):
+        directory = self.battery_dir()
+        if directory is None:
+            return None
+        status = _read(directory, "status") or "Unknown"
+        # energy_* (uWh) pairs with power_now (uW), charge_* (uAh) with
+        # current_now (uA); a time left only comes out of a matching pair.
+        if _read(directory, "energy_now") is not None:
+            now = _read_int(directory, "energy_now")
+            full = _read_int(directory, "energy_full")
+            rate = _read_int(directory, "power_now") or 0
+        else:
+            now = _read_int(directory, "charge_now")
+            full = _read_int(directory, "charge_full")
+            rate = _read_int(directory, "current_now") or 0
+        if now is not None and full:
+            percent = now / full
+        else:
+            percent = (_read_int(directory, "capacity") or 0) / 100
+        seconds = 0
+        if rate > 0 and now is not None and full:
+            if status == "Discharging":
+                seconds = now / rate * 3600
+            elif status == "Charging":
+                seconds = (full - now) / rate * 3600
+        watts = (_read_int(directory, "power_now") or 0) / 1e6
+        if not watts:
+            # uA * uV
+            current = _read_int(directory, "current_now") or 0
+            watts = current * (_read_int(directory, "voltage_now") or 0) / 1e12
+        return BatteryState(
+            status, percent, int(seconds // 3600), int(seconds % 3600 // 60), watts
+        )
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+        if self.state is not None:
+            callback(self.state)
+        if self._handle is None and self._socket is None:
+            self.start()
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+        # The last widget was finalized (a reload or shutdown); the socket
+        # and the poll timer go with it, and the next subscriber starts them
+        # again.
+        if not self._listeners:
+            self.stop()
+
+    def start(self):
+        if self.uevents:
+            self._listen()
+        self.refresh()
+
+    def _listen(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, 1))
+            sock.setblocking(False)
+        except (AttributeError, OSError) as e:
+            logger.warning("No power_supply uevents, polling only: %s", e)
+            return
+        self._socket = sock
+        self._loop = asyncio.get_event_loop()
+        self._loop.add_reader(sock.fileno(), self._on_uevent)
+
+    def _on_uevent(self):
+        # Drain everything queued, so a burst is one read even when its
+        # datagrams straddle loop iterations.
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except OSError:
+                return
+            fields = dict(
+                item.split("=", 1) for item in data.decode("utf-8", "replace").split("\0") if "=" in item
+            )
+            self.inject(fields)
+
+    def inject(self, event):
+        # Entry point for both real uevents and injected ones.
+        if event.get("SUBSYSTEM") != "power_supply" or self._pending:
+            return
+        # A plug/unplug sends a burst of uevents (AC and battery); read once.
+        self._pending = True
+        self.events += 1
+        # The read replaces the next poll, so stop() only has one handle to cancel.
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = asyncio.get_event_loop().call_soon(self._event_refresh)
+
+    def _event_refresh(self):
+        self._pending = False
+        self.interval = self.min_interval
+        self.refresh()
+
+    def refresh(self):
+        self.polls += 1
+        state = self.read()
+        previous, self.state = self.state, state
+        if state is not None and (
+            previous is None
+            or previous.status != state.status
+            or abs(previous.percent - state.percent) >= 0.01
+        ):
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+        if state is not None and state.status == "Discharging" and state.percent <= self.low_percentage:
+            self.interval = self.min_interval
+        if state != previous:
+            for callback in list(self._listeners):
+                callback(state)
+        self._schedule()
+
+    def _schedule(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = asyncio.get_event_loop().call_later(self.interval, self.refresh)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._socket is not None:
+            self._loop.remove_reader(self._socket.fileno())
+            self._socket.close()
+            self._socket = None
+        self._pending = False
+
+
+power_supply = PowerSupply()
+
+
+class BatteryStatus(widget.TextBox):
+    # Renders PowerSupply state with the same options as widget.Battery.
+    defaults = [
+        ("format", "{char} {percent:2.0%} {hour:d}:{min:02d} {watt:.2f} W", "Display format"),
+        ("charge_char", "^", "Character to indicate the battery is charging"),
+        ("discharge_char", "V", "Character to indicate the battery is discharging"),
+        ("full_char", "=", "Character to indicate the battery is full"),
+        ("empty_char", "x", "Character to indicate the battery is empty"),
+        ("not_charging_char", "*", "Character to indicate the battery is not charging"),
+        ("unknown_char", "?", "Character to indicate the battery status is unknown"),
+        ("show_short_text", True, "Show only 'Full' or 'Empty' in those states"),
+        ("full_short_text", "Full", "Short text to indicate the battery is full"),
+        ("empty_short_text", "Empty", "Short text to indicate the battery is empty"),
+        ("low_percentage", 0.10, "Fraction at which low_foreground is used"),
+        ("low_foreground", "FF0000", "Font colour on low battery"),
+    ]
+
+    def __init__(self, source=None, **config):
+        widget.TextBox.__init__(self, "", **config)
+        self.add_defaults(BatteryStatus.defaults)
+        self.source = source or power_supply
+        self.normal_foreground = self.foreground
+
+    def _configure(self, qtile, bar):
+        widget.TextBox._configure(self, qtile, bar)
+        self.source.subscribe(self._changed)
+
+    def build_string(self, state):
+        if state is None:
+            return "N/A"
+        empty = state.status == "Discharging" and state.percent <= 0.01
+        full = state.status == "Full"
+        if self.show_short_text and (full or empty):
+            return self.full_short_text if full else self.empty_short_text
+        char = {
+            "Charging": self.charge_char,
+            "Discharging": self.discharge_char,
+            "Full": self.full_char,
+            "Not charging": self.not_charging_char,
+        }.get(state.status, self.unknown_char)
+        if empty:
+            char = self.empty_char
+        return self.format.format(
+            char=char,
+            percent=state.percent,
+            hour=state.hours,
+            min=state.minutes,
+            watt=state.watts,
+        )
+
+    def _changed(self, state):
+        low = state is not None and state.status == "Discharging" and state.percent <= self.low_percentage
+        self.foreground = self.low_foreground if low else self.normal_foreground
+        if self.layout is not None:
+            self.layout.colour = self.foreground
+        self.update(self.build_string(state))
+
+    def finalize(self):
+        self.source.unsubscribe(self._changed)
+        widget.TextBox.finalize(self)
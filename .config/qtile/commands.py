@@ -0,0 +1,13 @@
+"""Commands this config adds to qtile, for ``qtile cmd-obj -o cmd``."""
+
+
+def expose(qtile, name, method):
+    # qtile 0.24 and later dispatch only what is in the class's _commands
+    # table (built from @expose_command methods when Qtile is created), and
+    # call bound methods as they are. Earlier versions look up cmd_<name>
+    # on the object itself.
+    commands = getattr(type(qtile), "_commands", None)
+    if isinstance(commands, dict):
+        commands[name] = method
+    else:
+        setattr(qtile, "cmd_" + name, method)
@@ -26,9 +26,11 @@
 
 
 import os
-import subprocess
 from typing import List  # noqa: F401
-import psutil
+
+from startup import SectionTimer
+
+load_timer = SectionTimer()
 
 from libqtile.config import (
     Key,
@@ -40,12 +42,39 @@ from libqtile.config import (
     DropDown,
     Match,
 )
-from libqtile import layout, bar, widget, hook
+from libqtile import layout, bar, hook
 from libqtile.lazy import lazy
 from libqtile import qtile
 from qtile_extras import widget
-from qtile_extras.widget.decorations import BorderDecoration
-from qtile_extras.widget.decorations import RectDecoration
+
+from audio import VolumeStatus, change_volume, toggle_mute
+from autostart import Autostart, Service
+from backlight import change_brightness
+from bars import LazyBar, screens_per_output
+from commands import expose
+from battery import BatteryStatus
+from focus import focus_intent
+from livereload import reload_incremental
+from loopwatch import toggle_watchdog, watchdog
+from notifications import DunstStatus, dunst_state, notification_center, notification_history
+from pipeline import hook_pipeline
+from prewarm import DropdownPrewarm, TerminalPool
+from profiling import profiler, toggle_profiling
+from reloads import replace
+from rules import RuleEngine
+from scheduler import ScheduledClock, scheduler
+from sessiontrace import session_trace, toggle_trace
+from swallow import SwallowIndex, swallow_registry
+from textcache import text_cache
+from theme import next_theme, theme_engine
+from tiling import Columns, Spiral
+from wallpaper import wallpaper_cache
+from windowname import StableWindowName
+
+load_timer.mark("imports")
+
+# Bar text is rendered once per (font, text, colour) and blitted after that.
+text_cache.install()
 
 # from plasma import Plasma
 
@@ -53,6 +82,16 @@ from qtile_extras.widget.decorations import RectDecoration
 mod = "mod4"
 terminal = "kitty"
 
+# Hidden terminals kept ready for mod+Return; handed out where a freshly
+# spawned terminal would have been routed.
+terminal_pool = TerminalPool.get(
+    qtile,
+    terminal,
+    size=2,
+    route=lambda window: router.route(window)[0],
+)
+dropdown_prewarm = DropdownPrewarm("scratchpad", "term")
+
 
 keys = [
     # A list of available commands that can be bound to keys can be found
@@ -100,30 +139,36 @@ keys = [
     ),
    
    
-    Key([mod], "Return", lazy.spawn(terminal), desc="Launch terminal"),
+    Key([mod], "Return", lazy.function(terminal_pool.open), desc="Launch terminal"),
     Key([mod], "a", lazy.spawn("./.config/rofi/launchers/text/launcher.sh"), desc="Rofi app launcher"),
     Key([mod], "p", lazy.spawn("./.config/rofi/powermenu/powermenu.sh"), desc="Rofi powermenu"),    
     Key([mod], "f", lazy.spawn("firefox"), desc="Launch firefox"),
     Key([mod], "t", lazy.spawn("thunar"), desc="Launch thunar"),
     Key([], "Print", lazy.spawn("flameshot screen"), desc="Print Screen"),
-    Key([], "XF86AudioRaiseVolume", lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ +10%"), desc="Increase volume",),
-    Key([], "XF86AudioLowerVolume", lazy.spawn("pactl set-sink-volume @DEFAULT_SINK@ -10%"), desc="Decrease volume",),
-    Key([], "XF86AudioMute", lazy.spawn("pactl set-sink-mute @DEFAULT_SINK@ toggle"), desc="Toggle mute",),
-    Key([], "XF86MonBrightnessUp", lazy.spawn("brightnessctl s 5%+"), desc="Increase brightness",),
-    Key([], "XF86MonBrightnessDown", lazy.spawn("brightnessctl s 5%-"), desc="Decrease Volume",),
+    Key([], "XF86AudioRaiseVolume", lazy.function(change_volume, 0.10), desc="Increase volume",),
+    Key([], "XF86AudioLowerVolume", lazy.function(change_volume, -0.10), desc="Decrease volume",),
+    Key([], "XF86AudioMute", lazy.function(toggle_mute), desc="Toggle mute",),
+    Key([], "XF86MonBrightnessUp", lazy.function(change_brightness, 0.05), desc="Increase brightness",),
+    Key([], "XF86MonBrightnessDown", lazy.function(change_brightness, -0.05), desc="Decrease brightness",),
     Key([mod], "v", lazy.spawn("code"), desc="Launch vs code"),
     
     # Toggle between different layouts as defined below
     Key([mod], "Tab", lazy.next_layout(), desc="Toggle between layouts"),
     Key([mod], "q", lazy.window.kill(), desc="Kill focused window"),
-    Key([mod], "r", lazy.reload_config(), desc="Reload the config"),
+    Key([mod], "r", lazy.function(reload_incremental), desc="Reload only what changed in the config"),
+    Key([mod, "control"], "r", lazy.reload_config(), desc="Reload the whole config"),
     Key([mod, "shift"], "r", lazy.restart(), desc="Restart Qtile"),
     Key([mod, "shift"], "q", lazy.shutdown(), desc="Shutdown Qtile"),
+    Key([mod, "control"], "p", lazy.function(toggle_profiling), desc="Toggle bar widget profiling"),
+    Key([mod, "shift"], "t", lazy.function(next_theme), desc="Switch to the next theme"),
+    Key([mod, "control"], "w", lazy.function(toggle_watchdog), desc="Toggle the event loop stall watchdog"),
+    Key([mod, "control"], "t", lazy.function(toggle_trace), desc="Start or stop recording a session trace"),
 
     #Key( [mod, "shift"],"e",lazy.spawn("power"),desc="Power Menu"),
     
  
 ]
+load_timer.mark("keys")
 
 
 workspaces = [
@@ -146,7 +191,8 @@ groups = [
             # define a drop down terminal.
             DropDown(
                 "term",
-                "kitty",
+                "kitty --class kitty-dropdown",
+                match=Match(wm_class="kitty-dropdown"),
                 height=0.6,
                 on_focus_lost_hide=False,
                 opacity=1,
@@ -156,9 +202,9 @@ groups = [
     ),
 ]
 
+# Matches are routed by the rule engine below rather than by each Group.
 for workspace in workspaces:
-    matches = workspace["matches"] if "matches" in workspace else None
-    groups.append(Group(workspace["name"], matches=matches, layout=workspace["lay"]))
+    groups.append(Group(workspace["name"], layout=workspace["lay"]))
     keys.append(
         Key(
             [mod],
@@ -175,42 +221,32 @@ for workspace in workspaces:
             desc="Move focused window to another group",
         )
     )
+load_timer.mark("groups")
 
 
 # Define colors
 
-colors = [
-    ["#121216", "#121216"],  # 0 background
-    ["#EAF4F4", "#EAF4F4"],  # 1 foreground
-    ["#333D47", "#333D47"],  # 2 background lighter
-    ["#FE3D20", "#FE3D20"],  # 3 red
-    ["#39FF14", "#39FF14"],  # 4 green
-    ["#FFFC47", "#FFFC47"],  # 5 yellow
-    ["#90E0EF", "#90E0EF"],  # 6 blue
-    ["#E2B6CF", "#E2B6CF"],  # 7 magenta
-    ["#79A9D1", "#79A9D1"],  # 8 cyan
-    ["#FDFFFC", "#FDFFFC"],  # 9 white
-    ["#7A7D90", "#7A7D90"],  # 10 grey
-    ["#FA8638", "#FA8638"],  # 11 orange
-    ["#86E9CB", "#86E9CB"],  # 12 super cyan
-    ["#30A3E0", "#30A3E0"],  # 13 super blue
-    ["#242831", "#242831"],  # 14 super dark background
-]
+# Slots are listed in theme.SLOTS: 0 background, 1 foreground, 2 background
+# lighter, 3 red, 4 green, 5 yellow, 6 blue, 7 magenta, 8 cyan, 9 white,
+# 10 grey, 11 orange, 12 super cyan, 13 super blue, 14 super dark
+# background, 15 bar border. The entries are refilled in place on a theme
+# switch, so keep passing them around rather than copying the hex strings.
+colors = theme_engine.colors
 
 
 layout_theme = {
     "border_width": 2,
     "margin": 4,
-    "border_focus": "30A3E0",
-    "border_normal": "333D47",
+    "border_focus": colors[13][0],
+    "border_normal": colors[2][0],
     "font": "FiraCode Nerd Font",
     "grow_amount": 2,
 }
 
 layouts = [
-    layout.Columns(**layout_theme, border_on_single=True,
-        border_focus_stack="#30A3E0",
-        border_normal_stack="#333D47"),
+    Columns(**layout_theme, border_on_single=True,
+        border_focus_stack=colors[13][0],
+        border_normal_stack=colors[2][0]),
     # Try more layouts by unleashing below layouts.
     # layout.Stack(num_stacks=2),
     # layout.Bsp(),
@@ -222,10 +258,11 @@ layouts = [
     # layout.TreeTab(),
     # layout.VerticalTile(),
     # layout.Zoomy(),
-    layout.Spiral(**layout_theme, main_pane='left', clockwise=True, new_client_position='bottom'),
+    Spiral(**layout_theme, main_pane='left', clockwise=True, new_client_position='bottom'),
     layout.Max(**layout_theme),
     layout.Floating(**layout_theme),
 ]
+load_timer.mark("layouts")
 
 # Setup bar
 
@@ -234,16 +271,29 @@ widget_defaults = dict(
     fontsize=15,
     padding=2,
     background=colors[0],
-    decorations=[
-        BorderDecoration(
-            colour=colors[0],
-            border_width=[13.50, 0, 12.50, 0],
-        )
-    ],
 )
 
 extension_defaults = widget_defaults.copy()
 
+
+# Each status segment is drawn as one rounded RectDecoration spanning its
+# widgets, instead of separate cap glyph TextBoxes on either side. Only
+# called while a bar's widgets are built, so the decorations module isn't
+# imported before a bar is placed.
+def segment(colour=colors[14]):
+    from qtile_extras.widget.decorations import RectDecoration
+
+    return [
+        RectDecoration(
+            colour=colour,
+            radius=12,
+            filled=True,
+            padding_y=13,
+            group=True,
+        )
+    ]
+
+
 group_box_settings = {
     "padding": 4,
     "borderwidth": 1,
@@ -259,23 +309,19 @@ group_box_settings = {
     "other_current_screen_border": colors[14],
     "other_screen_border": colors[14],
     "foreground": colors[1],
-    "background": colors[14],
+    "background": colors[0],
     "urgent_border": colors[3],
 }
 
 # Define functions for bar
 
 
-def dunst():
-    return subprocess.check_output(["./.config/qtile/dunst.sh"]).decode("utf-8").strip()
-
-
 def toggle_dunst():
-    qtile.cmd_spawn("./.config/qtile/dunst.sh --toggle")
+    dunst_state.toggle()
 
 
 def toggle_notif_center():
-    qtile.cmd_spawn("./.config/qtile/dunst.sh --notif-center")
+    notification_center.open(qtile)
 
 
 # Mouse_callback functions
@@ -295,274 +341,205 @@ def open_powermenu():
     qtile.cmd_spawn("./.config/rofi/powermenu/powermenu.sh")
 
 
-screens = [
-    Screen(
-        wallpaper="~/Pictures/Wallpapers/nasa.jpg",
-        wallpaper_mode="fill",
-        top=bar.Bar(
-            [
-                widget.TextBox(
-                    text="",
-                    foreground=colors[13],
-                    background=colors[0],
-                    font="Font Awesome 6 Free Solid",
-                    fontsize=26,
-                    padding=10,
-                    mouse_callbacks={"Button1": open_launcher},
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.GroupBox(
-                    font="Font Awesome 6 Brands",
-                    visible_groups=[""],
-                    **group_box_settings,
-                ),
-                widget.GroupBox(
-                    font="Font Awesome 6 Free Solid",
-                    visible_groups=["", "", "", "", "", "", "", "", ""],
-                    **group_box_settings,
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    background=colors[0],
-                    padding=10,
-                    size_percent=40,
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.CurrentLayoutIcon(
-                    custom_icon_paths=[os.path.expanduser("~/.config/qtile/icons")],
-                    foreground=colors[2],
-                    background=colors[14],
-                    padding=-12,
-                    scale=0.35,
-                ),
-                widget.WindowCount(
-                    background=colors[14],
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    padding=10,
-                    size_percent=50,
-                ),
-                
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.TextBox(
-                    text=" ",
-                    foreground=colors[8],
-                    background=colors[14],
-                    font="Font Awesome 6 Free Solid",
-                    # fontsize=38,
-                ),
-                widget.PulseVolume(
-                    foreground=colors[8],
-                    background=colors[14],
-                    limit_max_volume="True",
-                    mouse_callbacks={"Button1": open_pavu},
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                
-                widget.Spacer(),
-                widget.TextBox(
-                    text=" ",
-                    foreground=colors[12],
-                    background=colors[0],
-                    #fontsize=20,
-                    font="Font Awesome 6 Free Solid",
-                ),
-                widget.WindowName(
-                    background=colors[0],
-                    foreground=colors[12],
-                    width=bar.CALCULATED,
-                    empty_group_string="Workstation",
-                    max_chars=45,
-                    mouse_callbacks={"Button2": kill_window},
-                ),
-                widget.Spacer(),
-                widget.Systray(
-                    icon_size=26,
-                    background=colors[0],
-                    padding=7,
-                ),
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    padding=10,
-                    size_percent=50,
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.GenPollText(
-                    func=dunst,
-                    update_interval=1,
-                    foreground=colors[11],
-                    background=colors[14],
-                    padding=8,
-                    mouse_callbacks={
-                        "Button1": toggle_dunst,
-                        "Button3": toggle_notif_center,
-                    },
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    padding=10,
-                    size_percent=50,
-                ),          
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.Battery(
-                    foreground=colors[4],
-                    background=colors[14],
-                    charge_char="",
-                    full_char="",
-                    discharge_char="",
-                    format= "{char} {percent:1.0%} [{hour:d}:{min:02d}]",
-                    empty_char="¯\_(ツ)_/¯",                    
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),         
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    padding=10,
-                    size_percent=50,
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.TextBox(
-                    text=" ",
-                    font="Font Awesome 6 Free Solid",
-                    foreground=colors[5],  # fontsize=38
-                    background=colors[14],
-                ),
-                widget.Clock(
-                    format="%a, %b %d",
-                    background=colors[14],
-                    foreground=colors[5],
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.Sep(
-                    linewidth=0,
-                    foreground=colors[2],
-                    padding=10,
-                    size_percent=50,
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.TextBox(
-                    text=" ",
-                    font="Font Awesome 6 Free Solid",
-                    foreground=colors[11],  # fontsize=38
-                    background=colors[14],
-                ),
-                widget.Clock(
-                    format="%I:%M %p",
-                    foreground=colors[11],
-                    background=colors[14],
-                ),
-                widget.TextBox(
-                    text="",
-                    foreground=colors[14],
-                    background=colors[0],
-                    fontsize=24,
-                    padding=0,
-                ),
-                widget.TextBox(
-                    text="⏻",
-                    foreground=colors[13],
-                    font="Font Awesome 6 Free Solid",
-                    fontsize=28,
-                    padding=10,
-                    mouse_callbacks={"Button1": open_powermenu},
-                ),
-            ],
+def main_widgets(primary=True):
+    return [
+        widget.TextBox(
+            text="",
+            foreground=colors[13],
+            background=colors[0],
+            font="Font Awesome 6 Free Solid",
+            fontsize=26,
+            padding=10,
+            mouse_callbacks={"Button1": open_launcher},
+        ),
+        widget.GroupBox(
+            font="Font Awesome 6 Brands",
+            visible_groups=[""],
+            decorations=segment(),
+            **group_box_settings,
+        ),
+        widget.GroupBox(
+            font="Font Awesome 6 Free Solid",
+            visible_groups=["", "", "", "", "", "", "", "", ""],
+            decorations=segment(),
+            **group_box_settings,
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            background=colors[0],
+            padding=10,
+            size_percent=40,
+        ),
+        widget.CurrentLayoutIcon(
+            custom_icon_paths=[os.path.expanduser("~/.config/qtile/icons")],
+            foreground=colors[2],
+            background=colors[0],
+            decorations=segment(),
+            padding=-12,
+            scale=0.35,
+        ),
+        widget.WindowCount(
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            padding=10,
+            size_percent=50,
+        ),
+
+        widget.TextBox(
+            text=" ",
+            foreground=colors[8],
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+            font="Font Awesome 6 Free Solid",
+            # fontsize=38,
+        ),
+        VolumeStatus(
+            foreground=colors[8],
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+            mouse_callbacks={"Button1": open_pavu},
+        ),
+
+        widget.Spacer(),
+        widget.TextBox(
+            text=" ",
+            foreground=colors[12],
+            background=colors[0],
+            #fontsize=20,
+            font="Font Awesome 6 Free Solid",
+        ),
+        StableWindowName(
+            background=colors[0],
+            foreground=colors[12],
+            empty_group_string="Workstation",
+            max_chars=45,
+            mouse_callbacks={"Button2": kill_window},
+        ),
+        widget.Spacer(),
+        # Only one systray can exist per X display.
+        *(
+            [widget.Systray(icon_size=26, background=colors[0], padding=7)]
+            if primary
+            else []
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            padding=10,
+            size_percent=50,
+        ),
+        DunstStatus(
+            foreground=colors[11],
+            paused_foreground=colors[15],
+            background=colors[0],
+            decorations=segment(),
+            padding=12,
+            mouse_callbacks={
+                "Button1": toggle_dunst,
+                "Button3": toggle_notif_center,
+            },
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            padding=10,
+            size_percent=50,
+        ),          
+        BatteryStatus(
+            foreground=colors[4],
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+            charge_char="",
+            full_char="",
+            discharge_char="",
+            format= "{char} {percent:1.0%} [{hour:d}:{min:02d}]",
+            empty_char="¯\_(ツ)_/¯",                    
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            padding=10,
+            size_percent=50,
+        ),
+        widget.TextBox(
+            text=" ",
+            font="Font Awesome 6 Free Solid",
+            foreground=colors[5],  # fontsize=38
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+        ),
+        ScheduledClock(
+            format="%a, %b %d",
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+            foreground=colors[5],
+        ),
+        widget.Sep(
+            linewidth=0,
+            foreground=colors[2],
+            padding=10,
+            size_percent=50,
+        ),
+        widget.TextBox(
+            text=" ",
+            font="Font Awesome 6 Free Solid",
+            foreground=colors[11],  # fontsize=38
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+        ),
+        ScheduledClock(
+            format="%I:%M %p",
+            foreground=colors[11],
+            background=colors[0],
+            padding=8,
+            decorations=segment(),
+        ),
+        widget.TextBox(
+            text="⏻",
+            foreground=colors[13],
+            font="Font Awesome 6 Free Solid",
+            fontsize=28,
+            padding=10,
+            mouse_callbacks={"Button1": open_powermenu},
+        ),
+    ]
+
+
+def main_screen(primary):
+    return Screen(
+        top=LazyBar(
+            lambda: main_widgets(primary),
             56,
             margin=[0, 0, 8, 0],
             border_width=[0, 0, 2, 0],
-            border_color="#3b4252",
+            border_color=colors[15][0],
         ),
         bottom=bar.Gap(4),
         left=bar.Gap(4),
-        right=bar.Gap(4),        
-    ),
-]
+        right=bar.Gap(4),
+    )
+
+
+# One bar per connected output, all from main_screen
+screens = screens_per_output(main_screen)
+load_timer.mark("bar")
+
+# Painted through wallpaper_cache rather than by Screen, so a config reload
+# only repaints an output when the image, its mtime or the output changed.
+wallpaper = "~/Pictures/Wallpapers/nasa.jpg"
+wallpaper_mode = "fill"
 
 # Drag floating layouts.
 mouse = [
@@ -573,56 +550,231 @@ mouse = [
 
 dgroups_key_binder = None
 dgroups_app_rules = []  # type: list
-follow_mouse_focus = True
+# Focus follows the mouse through focus_intent (see the hooks below), which
+# skips the windows a pointer only passes over.
+follow_mouse_focus = False
 bring_front_click = "floating_only"
 cursor_warp = False
-floating_layout = layout.Floating(
-    float_rules=[
-        # Run the utility of `xprop` to see the wm class and name of an X client.
-        *layout.Floating.default_float_rules,
-        Match(wm_class="confirmreset"),  # gitk
-        Match(wm_class="makebranch"),  # gitk
-        Match(wm_class="maketag"),  # gitk
-        Match(wm_class="ssh-askpass"),  # ssh-askpass
-        Match(title="branchdialog"),  # gitk
-        Match(title="pinentry"),  # GPG key password entry
-    ]
+float_rules = [
+    # Run the utility of `xprop` to see the wm class and name of an X client.
+    *layout.Floating.default_float_rules,
+    Match(wm_class="confirmreset"),  # gitk
+    Match(wm_class="makebranch"),  # gitk
+    Match(wm_class="maketag"),  # gitk
+    Match(wm_class="ssh-askpass"),  # ssh-askpass
+    Match(title="branchdialog"),  # gitk
+    Match(title="pinentry"),  # GPG key password entry
+]
+# Group matches and float rules compiled into one lookup.
+router = RuleEngine(
+    [(workspace["name"], workspace.get("matches")) for workspace in workspaces],
+    float_rules,
 )
+floating_layout = layout.Floating(float_rules=[Match(func=router.floats)])
 auto_fullscreen = True
 focus_on_window_activation = "smart"
 reconfigure_screens = True
 
-# Startup scripts
+# Startup services, launched concurrently and restarted if they crash
+
+autostart = Autostart(
+    [
+        Service("redshift", ["redshift"]),
+        Service("playerctld", ["playerctld", "daemon"], oneshot=True),
+        Service("blueman", ["blueman-applet"]),
+        Service("greenclip", ["greenclip", "daemon"]),
+        # Service("default_startup", ["default_startup.sh"], oneshot=True),
+    ]
+)
 
 
 @hook.subscribe.startup_once
 def start_once():
-    home = os.path.expanduser("~")
-    subprocess.call([home + "/.config/qtile/autostart.sh"])
-    
+    autostart.start()
+
+
+@hook.subscribe.startup_complete
+@hook.subscribe.screens_reconfigured
+def _paint_wallpaper():
+    for screen in qtile.screens:
+        wallpaper_cache.paint(screen, wallpaper, wallpaper_mode)
+
+
+# A reload rebuilds qtile.screens after this file has run, without firing
+# startup_complete, so paint once they are back. Outside a running session
+# (`qtile check`) qtile is a placeholder without an event loop.
+if hasattr(qtile, "call_soon"):
+    qtile.call_soon(_paint_wallpaper)
+
+
+@hook.subscribe.screens_reconfigured
+def _rebuild_bars():
+    # A monitor came or went: rebuild screens so each output gets its bar.
+    # qtile is still reconfiguring when this fires, so the reload waits for
+    # the loop, and is skipped if by then the loaded config (possibly from
+    # an earlier queued reload) has a screen for every output.
+    qtile.call_soon(_reload_for_outputs)
+
+
+def _reload_for_outputs():
+    if len(qtile.screens) != len(qtile.config.screens):
+        qtile.reload_config()
+
+
+# Wall time jumps across suspend, so catch the clocks up straight away.
+@hook.subscribe.resume
+def _resume():
+    scheduler.refresh()
+
+
+# Set QTILE_PROFILE_WIDGETS=1 to time every bar widget from startup;
+# mod+ctrl+p toggles it and writes ~/.cache/qtile/widget-profile.{json,csv}.
+# `qtile cmd-obj -o cmd -f profile_summary` returns the numbers so far.
+# Run on every config load: a reload brings a new profiler, which takes
+# over from the one before it.
+def _profile_widgets():
+    replace(qtile, "profiler", profiler, lambda previous: profiler.take_over(previous, qtile))
+    expose(qtile, "profile_summary", profiler.summary)
+    expose(qtile, "profile_dump", profiler.dump)
+    if os.environ.get("QTILE_PROFILE_WIDGETS"):
+        profiler.start(qtile)
+
+
+if hasattr(qtile, "call_soon"):
+    qtile.call_soon(_profile_widgets)
+
+
+def _watch_loop():
+    # QTILE_WATCHDOG=<ms> reports every loop stall longer than that;
+    # `qtile cmd-obj -o cmd -f stalls` lists them. As for the profiler, a
+    # reload's watchdog takes over from the one before it.
+    replace(qtile, "watchdog", watchdog, lambda previous: watchdog.take_over(previous, qtile))
+    expose(qtile, "stalls", watchdog.report)
+    expose(qtile, "loop_lag", watchdog.lag_report)
+    threshold = os.environ.get("QTILE_WATCHDOG")
+    if threshold:
+        watchdog.threshold = float(threshold) / 1000
+        watchdog.start(qtile)
+
+
+if hasattr(qtile, "call_soon"):
+    qtile.call_soon(_watch_loop)
+
+
+# QTILE_TRACE=<path> records the session for `harness.py replay`;
+# mod+ctrl+t starts and stops recording to ~/.cache/qtile/trace.jsonl.
+@hook.subscribe.startup_complete
+def _trace_session():
+    path = os.environ.get("QTILE_TRACE")
+    if path:
+        session_trace.path = path
+        session_trace.start(qtile)
+
+
+@hook.subscribe.client_new
+def _trace_map(window):
+    session_trace.map(window)
+
+
+@hook.subscribe.client_killed
+def _trace_unmap(window):
+    session_trace.unmap(window)
+
+
+@hook.subscribe.setgroup
+def _trace_group():
+    session_trace.group(qtile.current_group.name)
+
+
+@hook.subscribe.client_mouse_enter
+def _trace_enter(window):
+    session_trace.enter(window)
+
+
+@hook.subscribe.client_name_updated
+def _trace_title(window):
+    session_trace.title(window)
+
+
+@hook.subscribe.client_mouse_enter
+def _focus_intent(window):
+    focus_intent.enter(window)
+
+
+@hook.subscribe.client_killed
+def _forget_focus_intent(window):
+    focus_intent.forget(window)
+
+
+def _notification_history():
+    replace(qtile, "notification_history", notification_history, lambda previous: previous.stop())
+    notification_history.start()
+
+
+def _prewarm():
+    terminal_pool.start(qtile)
+    dropdown_prewarm.start(qtile)
+
+
+# A reload does not fire startup_complete and brings new objects, so these
+# start from every config load, once qtile is done with it.
+if hasattr(qtile, "call_soon"):
+    qtile.call_soon(_notification_history)
+    qtile.call_soon(_prewarm)
+
+
+# Parked terminals must get here before the routing hooks below see them.
+@hook.subscribe.client_new
+def _claim_prewarmed(window):
+    terminal_pool.client_new(window)
+
+
+@hook.subscribe.client_managed
+def _map_prewarmed(window):
+    terminal_pool.client_managed(window)
+    dropdown_prewarm.client_managed(window)
+
+
+@hook.subscribe.client_killed
+def _release_prewarmed(window):
+    terminal_pool.client_killed(window)
+
+
+# Pending hook stages are cancelled with the loop; let them go quietly.
+@hook.subscribe.shutdown
+def _stop_pipeline():
+    hook_pipeline.shutdown()
+
+
+@hook.subscribe.shutdown
+def _stop_notification_history():
+    notification_history.stop()
+
+
 # Window swallowing ;)
+swallow_index = SwallowIndex()
+session_trace.ancestors = swallow_index.ancestors
+
+
 @hook.subscribe.client_new
 def _swallow(window):
-    pid = window.window.get_net_wm_pid()
-    ppid = psutil.Process(pid).ppid()
-    cpids = {
-        c.window.get_net_wm_pid(): wid for wid, c in window.qtile.windows_map.items()
-    }
-    for i in range(5):
-        if not ppid:
-            return
-        if ppid in cpids:
-            parent = window.qtile.windows_map.get(cpids[ppid])
-            parent.minimized = True
-            window.parent = parent
-            return
-        ppid = psutil.Process(ppid).ppid()
+    # The /proc walk runs on a hook worker so the new window maps at once;
+    # the parent is hidden a moment later, back on the event loop.
+    swallow_index.seed(window.qtile.windows_map)
+    pid = swallow_index.add(window)
+
+    def commit(ancestors):
+        parent = swallow_index.parent_in(ancestors)
+        if parent is not None and window.wid in window.qtile.windows_map:
+            swallow_registry.swallow(window, parent)
+
+    hook_pipeline.submit("swallow", swallow_index.ancestors, pid, commit=commit)
 
 
 @hook.subscribe.client_killed
 def _unswallow(window):
-    if hasattr(window, "parent"):
-        window.parent.minimized = False
+    swallow_index.remove(window)
+    swallow_registry.release(window)
 
 
 # Go to group when app opens on matched group
@@ -631,14 +783,17 @@ def modify_window(client):
     # if (client.window.get_wm_transient_for() or client.window.get_wm_type() in floating_types):
     #    client.floating = True
 
-    for group in groups:  # follow on auto-move
-        match = next((m for m in group.matches if m.compare(client)), None)
-        if match:
-            targetgroup = client.qtile.groups_map[
-                group.name
-            ]  # there can be multiple instances of a group
-            targetgroup.cmd_toscreen(toggle=False)
-            break
+    if terminal_pool.owns(client):
+        return
+    target, _floating = router.route(client)
+    if target is not None:  # follow on auto-move
+        client.togroup(target)
+        client.qtile.groups_map[target].cmd_toscreen(toggle=False)
+
+
+@hook.subscribe.client_killed
+def _forget_route(client):
+    router.forget(client)
 
 
 # If things like steam games want to auto-minimize themselves when losing
@@ -657,3 +812,6 @@ wl_input_rules = None
 # We choose LG3D to maximize irony: it is a 3D non-reparenting WM written in
 # java that happens to be on java's whitelist.
 wmname = "LG3D"
+
+load_timer.mark("hooks")
+load_timer.done()
@@ -0,0 +1,102 @@
+"""Focus follows mouse, committed only where the pointer means to stop."""
+
+import asyncio
+import math
+
+from libqtile import qtile
+
+
+class FocusIntent:
+    # Takes over from follow_mouse_focus (which config.py turns off): every
+    # client_mouse_enter is passed to enter(), and focus only moves once the
+    # pointer slows down on a window, or has stayed on it for ``dwell``
+    # seconds whatever its speed. Windows crossed on the way are never
+    # focused, so they fire no hooks and repaint nothing.
+    #
+    # Speed is sampled every ``probe`` seconds while a window is pending.
+    # Above ``fast`` (px/s) the pointer counts as sweeping and keeps doing so
+    # until it drops below ``slow``; in between it stays in whichever state
+    # it was in.
+
+    def __init__(self, dwell=0.3, probe=0.02, slow=400, fast=1200, position=None, focus=None):
+        self.dwell = dwell
+        self.probe = probe
+        self.slow = slow
+        self.fast = fast
+        self.position = position or (lambda: qtile.core.get_mouse_position())
+        self.focus = focus or focus_window
+        self.entered = 0
+        self.committed = 0
+        self.suppressed = 0
+        self.sweeping = False
+        self._pending = None
+        self._entered_at = 0.0
+        self._sample = None
+        self._handle = None
+
+    def enter(self, window):
+        loop = asyncio.get_event_loop()
+        self.entered += 1
+        if self._handle is not None:
+            self._handle.cancel()
+            self.suppressed += 1
+        self._pending = window
+        self._entered_at = loop.time()
+        self._sample = (*self.position(), self._entered_at)
+        self._handle = loop.call_later(self.probe, self._check)
+
+    def _check(self):
+        loop = asyncio.get_event_loop()
+        now = loop.time()
+        x, y = self.position()
+        last_x, last_y, last_time = self._sample
+        speed = math.hypot(x - last_x, y - last_y) / max(now - last_time, 1e-3)
+        if speed > self.fast:
+            self.sweeping = True
+        elif speed < self.slow:
+            self.sweeping = False
+        if self.sweeping and now - self._entered_at < self.dwell:
+            self._sample = (x, y, now)
+            self._handle = loop.call_later(self.probe, self._check)
+            return
+        self._commit()
+
+    def _commit(self):
+        window, self._pending, self._handle = self._pending, None, None
+        # The pointer may have left for the bar or the root window since.
+        x, y = self.position()
+        border = getattr(window, "borderwidth", 0) * 2
+        if not (
+            window.x <= x < window.x + window.width + border
+            and window.y <= y < window.y + window.height + border
+        ):
+            self.suppressed += 1
+            return
+        self.committed += 1
+        self.focus(window)
+
+    def forget(self, window):
+        if self._pending is window:
+            self._handle.cancel()
+            self._pending = self._handle = None
+
+    def report(self):
+        return {
+            "entered": self.entered,
+            "committed": self.committed,
+            "suppressed": self.suppressed,
+        }
+
+
+def focus_window(window):
+    # What qtile does on EnterNotify with follow_mouse_focus on.
+    group = window.group
+    if group is None:
+        return
+    if group.current_window != window:
+        group.focus(window, False)
+    if group.screen and qtile.current_screen != group.screen:
+        qtile.focus_screen(group.screen.index, False)
+
+
+focus_intent = FocusIntent()
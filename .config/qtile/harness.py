@@ -0,0 +1,2908 @@
+#!/usr/bin/env python3
+"""Load config.py against a stubbed libqtile and report where the time goes.
+
+    python harness.py startup [--repeat N] [--outputs N] [--reload] [--json]
+    python harness.py titles [--rate N] [--seconds S] [--latency S]
+    python harness.py textcache [--frames N]
+    python harness.py wallpaper
+    python harness.py ticks [--hours N] [--screens N]
+    python harness.py segments [--frames N]
+    python harness.py layouts [--windows N ...] [--ops N]
+    python harness.py focus [--path FILE] [--dwell S]
+    python harness.py hooks [--windows N] [--slow S] [--budget S]
+    python harness.py swallow [--windows N] [--max-growth BYTES]
+    python harness.py rules [--clients N]
+    python harness.py livereload [--repeat N]
+    python harness.py reload
+    python harness.py dunst [--toggles N] [--history N]
+    python harness.py ancestry [--windows N] [--lookups N]
+    python harness.py replay [TRACE] [--events N] [--speed X] [--json]
+
+Nothing here needs a display. Apart from textcache and layouts, libqtile and
+qtile_extras are replaced by permissive stand-ins before config.py runs;
+those two run the real thing and need qtile installed. segments only times
+its frames when cairocffi is installed.
+"""
+
+import argparse
+import ast
+import asyncio
+import gc
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import runpy
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import weakref
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONFIG = os.path.join(HERE, "config.py")
+
+
+# Stand-ins for libqtile / qtile_extras
+
+
+class Stub:
+    # Accepts any constructor call and keeps the keyword arguments as
+    # attributes, much like libqtile's Configurable does.
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.__dict__.update(kwargs)
+
+    def add_defaults(self, defaults):
+        for name, value, _doc in defaults:
+            self.__dict__.setdefault(name, value)
+
+    def add_callbacks(self, defaults):
+        callbacks = dict(defaults)
+        callbacks.update(self.__dict__.get("mouse_callbacks", {}))
+        self.mouse_callbacks = callbacks
+
+    def finalize(self):
+        pass
+
+
+class StubModule(types.ModuleType):
+    # Any missing attribute becomes a fresh Stub subclass, so config.py can
+    # both instantiate and subclass whatever widget or layout it names.
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        cls = type(name, (Stub,), {"__module__": self.__name__})
+        setattr(self, name, cls)
+        return cls
+
+
+class Match:
+    def __init__(self, **rules):
+        self._rules = {k: v for k, v in rules.items() if v is not None}
+
+    def compare(self, client):
+        for kind, rule in self._rules.items():
+            if kind == "func":
+                if not rule(client):
+                    return False
+                continue
+            if kind == "title":
+                values = [client.name]
+            elif kind == "wm_class":
+                values = client.get_wm_class() or []
+            elif kind == "wm_type":
+                values = [client.get_wm_type()]
+            else:
+                values = [getattr(client, kind, None)]
+            test = rule.match if isinstance(rule, re.Pattern) else rule.__eq__
+            if not any(v is not None and test(v) for v in values):
+                return False
+        return True
+
+
+class TextLayout:
+    text = property(lambda self: self._text, lambda self, value: setattr(self, "_text", value))
+
+    def draw(self, x, y):
+        pass
+
+
+class PangoLayout:
+    def set_alignment(self, alignment):
+        pass
+
+
+class UndefinedQtile:
+    # What `from libqtile import qtile` gives outside a running session.
+    core = types.SimpleNamespace(name=None)
+
+
+class Subscribe:
+    # hook.subscribe.<name>(func) records func under <name> in the "qtile"
+    # registry, nested as qtile's own hook.subscriptions is.
+
+    def __init__(self, subscriptions):
+        self._subscriptions = subscriptions
+
+    def __getattr__(self, name):
+        def subscribe(func):
+            self._subscriptions.setdefault("qtile", {}).setdefault(name, []).append(func)
+            return func
+
+        return subscribe
+
+
+class HookView:
+    # The "qtile" registry of the stub hook.subscriptions, looked up on
+    # every call: restoring subscriptions may swap the inner dict.
+
+    def __init__(self, subscriptions):
+        self._subscriptions = subscriptions
+
+    def _events(self):
+        return self._subscriptions.setdefault("qtile", {})
+
+    def get(self, name, default=None):
+        return self._events().get(name, default)
+
+    def setdefault(self, name, default):
+        return self._events().setdefault(name, default)
+
+    def clear(self):
+        self._events().clear()
+
+
+class LazyCall:
+    def __init__(self, path=(), args=(), kwargs=None):
+        self.path = path
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return LazyCall(self.path + (name,))
+
+    def __getitem__(self, key):
+        return LazyCall(self.path + ("[{!r}]".format(key),))
+
+    def __call__(self, *args, **kwargs):
+        return LazyCall(self.path, args, kwargs)
+
+    @property
+    def name(self):
+        return ".".join(self.path)
+
+    def __repr__(self):
+        return "lazy.{}".format(self.name)
+
+
+def install_stubs():
+    subscriptions = {}
+    modules = {}
+
+    def module(name, **attrs):
+        mod = StubModule(name)
+        mod.__dict__.update(attrs)
+        mod.__path__ = []
+        modules[name] = mod
+        return mod
+
+    logger = logging.getLogger("libqtile")
+
+    def create_task(coro):
+        coro.close()
+
+    async def add_signal_receiver(*args, **kwargs):
+        return True
+
+    libqtile = module("libqtile", qtile=UndefinedQtile())
+    module("libqtile.config", Match=Match)
+    module("libqtile.log_utils", logger=logger)
+    module("libqtile.utils", create_task=create_task, add_signal_receiver=add_signal_receiver)
+    module("libqtile.hook", subscribe=Subscribe(subscriptions), subscriptions=subscriptions)
+    module("libqtile.lazy", lazy=LazyCall())
+    layout = module("libqtile.layout")
+    layout.Floating.default_float_rules = [
+        Match(wm_type="utility"),
+        Match(wm_type="notification"),
+        Match(wm_type="toolbar"),
+        Match(wm_type="splash"),
+        Match(wm_type="dialog"),
+        Match(wm_class="file_progress"),
+        Match(wm_class="confirm"),
+        Match(wm_class="dialog"),
+        Match(wm_class="download"),
+        Match(wm_class="error"),
+        Match(wm_class="notification"),
+        Match(wm_class="splash"),
+        Match(wm_class="toolbar"),
+    ]
+    module("libqtile.bar", CALCULATED=-1, STRETCH=-2)
+    module("libqtile.backend")
+    module("libqtile.backend.base")
+    module("libqtile.backend.base.drawer", TextLayout=TextLayout)
+    module("libqtile.pangocffi", PangoLayout=PangoLayout)
+    module("libqtile.widget")
+    module("libqtile.widget.base")
+    module("qtile_extras")
+    module("qtile_extras.widget")
+    module("qtile_extras.widget.decorations")
+
+    for name, mod in modules.items():
+        sys.modules[name] = mod
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(modules[parent], child, mod)
+    return libqtile, HookView(subscriptions)
+
+
+def purge_modules():
+    for name in list(sys.modules):
+        if name.startswith(("libqtile", "qtile_extras")):
+            del sys.modules[name]
+        elif getattr(sys.modules[name], "__file__", None) and os.path.dirname(
+            os.path.abspath(sys.modules[name].__file__)
+        ) == HERE:
+            del sys.modules[name]
+
+
+def load_config(qtile=None, widgets=None):
+    # Fresh stubs and a fresh import of every helper module, so repeated
+    # runs measure a cold load the way reload_config sees it (modules of
+    # this directory included). ``qtile`` is what `from libqtile import
+    # qtile` hands the config and its modules, by default the placeholder
+    # it is outside a running session; ``widgets`` replaces
+    # qtile_extras widget classes the config's own widgets derive from.
+    purge_modules()
+    libqtile, hooks = install_stubs()
+    if qtile is not None:
+        libqtile.qtile = qtile
+    for name, cls in (widgets or {}).items():
+        setattr(sys.modules["qtile_extras.widget"], name, cls)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    importlib.invalidate_caches()
+
+    start = time.perf_counter()
+    namespace = runpy.run_path(CONFIG, run_name="config")
+    elapsed = (time.perf_counter() - start) * 1000
+    return namespace, hooks, elapsed
+
+
+def build_bars(namespace):
+    # What qtile would pay when it places each bar on a screen.
+    sections = []
+    for index, screen in enumerate(namespace.get("screens", [])):
+        for position in ("top", "bottom", "left", "right"):
+            bar = getattr(screen, position, None) or screen.kwargs.get(position)
+            factory = getattr(bar, "factory", None)
+            if factory is None:
+                continue
+            start = time.perf_counter()
+            widgets = factory()
+            sections.append(
+                (
+                    "screen{}.{} ({} widgets)".format(index, position, len(widgets)),
+                    (time.perf_counter() - start) * 1000,
+                )
+            )
+    return sections
+
+
+class TitleBar:
+    width = 2560
+
+    def __init__(self):
+        self.draws = 0
+
+    def draw(self):
+        self.draws += 1
+
+
+class TitleLayout:
+    # Roughly a 7px monospace font.
+
+    def __init__(self):
+        self.text = ""
+        self._width = None
+
+    @property
+    def width(self):
+        return len(self.text) * 7 if self._width is None else self._width
+
+    @width.setter
+    def width(self, value):
+        self._width = value
+
+    def reset_width(self):
+        self._width = None
+
+
+class TitleTextBox(Stub):
+    # Just enough of _TextBox for StableWindowName: text goes through a
+    # layout, draw() is counted and timeouts run on the current loop.
+
+    def __init__(self, width=None, **config):
+        Stub.__init__(self, **config)
+        self.layout = TitleLayout()
+        self.bar = TitleBar()
+        self.actual_padding = 3
+        self.draw_count = 0
+
+    @property
+    def text(self):
+        return self.layout.text
+
+    @text.setter
+    def text(self, value):
+        max_chars = self.__dict__.get("max_chars", 45)
+        if len(value) > max_chars:
+            value = value[:max_chars] + "\u2026"
+        self.layout.text = value
+
+    def draw(self):
+        self.draw_count += 1
+
+    def timeout_add(self, seconds, method):
+        return asyncio.get_event_loop().call_later(seconds, method)
+
+
+def retitles(rng):
+    # What a build running in a terminal looks like from the bar.
+    targets = ["src/{}.c".format("x" * rng.randint(1, 24)) for _ in range(50)]
+    percent = 0
+    while True:
+        percent = (percent + rng.randint(0, 2)) % 101
+        yield "make: [{:3d}%] Building C object {}".format(percent, rng.choice(targets))
+        if rng.random() < 0.05:
+            yield "vim {}".format(rng.choice(targets))
+
+
+# Commands
+
+
+def cmd_startup(args):
+    runs = []
+    for _ in range(args.repeat):
+        namespace, hooks, total = load_config()
+        if args.reload:
+            # What reload_config pays: config.py runs again, the modules it
+            # imports are already loaded.
+            hooks.clear()
+            start = time.perf_counter()
+            namespace = runpy.run_path(CONFIG, run_name="config")
+            total = (time.perf_counter() - start) * 1000
+        if args.outputs:
+            # As if qtile had reported that many monitors.
+            namespace["screens"] = sys.modules["bars"].screens_per_output(
+                namespace["main_screen"], [None] * args.outputs
+            )
+        timer = namespace["load_timer"]
+        sections = list(timer.sections) + build_bars(namespace)
+        runs.append({"total_ms": total, "sections": sections})
+
+    names = [name for name, _ in runs[0]["sections"]]
+    table = {
+        name: statistics.median(dict(run["sections"]).get(name, 0.0) for run in runs)
+        for name in names
+    }
+    total = statistics.median(run["total_ms"] for run in runs)
+    if args.json:
+        print(json.dumps({"total_ms": total, "sections_ms": table, "runs": args.repeat}, indent=2))
+        return
+    print("config.py {}, median of {} run(s)".format("reload" if args.reload else "load", args.repeat))
+    for name in names:
+        print("  {:<32} {:8.2f} ms".format(name, table[name]))
+    print("  {:<32} {:8.2f} ms".format("exec total", total))
+
+
+def cmd_titles(args):
+    load_config()
+    sys.modules["qtile_extras.widget"].WindowName = TitleTextBox
+    sys.modules.pop("windowname", None)
+    from windowname import StableWindowName
+
+    name = StableWindowName(latency=args.latency)
+    titles = retitles(random.Random(0))
+
+    async def run():
+        loop = asyncio.get_event_loop()
+        end = loop.time() + args.seconds
+        count = 0
+        widths = []
+        while loop.time() < end:
+            text = next(titles)
+            name.update(text)
+            widths.append(min(len(text), 45) * 7)
+            count += 1
+            await asyncio.sleep(1 / args.rate)
+        await asyncio.sleep(args.latency * 2)
+        return count, widths
+
+    count, widths = asyncio.run(run())
+
+    # A title past max_chars is shown cut short; seeing it again must not
+    # redraw, and the text must stay centred in the wider slot.
+    long_title = "x" * 60
+    name._last_draw = 0.0
+    name.update(long_title)
+    draws = name.draws
+    name._last_draw = 0.0
+    name.update(long_title)
+    repeat_ok = name.draws == draws
+    name._last_draw = 0.0
+    name.update("short")
+    centred = name.layout.width == name.slot - name.actual_padding * 2
+    # A CALCULATED-width WindowName relays out the bar whenever the width
+    # of the text changes.
+    stock = sum(1 for a, b in zip([0] + widths, widths) if a != b)
+    result = {
+        "retitles": count,
+        "draws": name.draws,
+        "relayouts": name.relayouts,
+        "stock_relayouts": stock,
+        "long_title_redrawn": not repeat_ok,
+        "centred": centred,
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print("{} retitles over {}s at {}/s, latency budget {}s".format(
+        count, args.seconds, args.rate, args.latency))
+    print("  widget draws     {:6d}".format(name.draws))
+    print("  bar relayouts    {:6d}".format(name.relayouts))
+    print("  stock relayouts  {:6d}".format(stock))
+    print("  long title repeat {}".format("skipped" if repeat_ok else "REDRAWN"))
+    print("  centred in slot   {}".format("yes" if centred else "NO"))
+    if not (repeat_ok and centred):
+        sys.exit(1)
+
+
+# What one frame of the top bar draws: icons, labels and a clock, with the
+# palette slot each is coloured from in config.py.
+BAR_TEXT = [
+    ("Font Awesome 6 Free Solid", 24, "\uf303", 13),
+    ("Font Awesome 6 Free Solid", 24, " ", 2),
+    ("Font Awesome 6 Free Solid", 22, "\uf0f3", 8),
+    ("Font Awesome 6 Free Solid", 22, "\uf028", 12),
+    ("Font Awesome 6 Free Solid", 22, "\uf240", 4),
+    ("Font Awesome 6 Free Solid", 22, "\uf017", 11),
+    ("FiraCode Nerd Font", 16, "Workstation", 1),
+    ("FiraCode Nerd Font", 16, "64%", 12),
+    ("FiraCode Nerd Font", 16, "87%", 4),
+    ("FiraCode Nerd Font", 16, "Sat 18 Oct", 11),
+] + [("FiraCode Nerd Font", 16, str(n), 9) for n in range(1, 10)]
+
+
+def cmd_textcache(args):
+    # Against the stubs first: without a drawer module install() must leave
+    # the stock classes alone, and with one at qtile's path it must patch.
+    purge_modules()
+    install_stubs()
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    stock = {
+        (cls, name): cls.__dict__[name]
+        for cls, name in ((TextLayout, "draw"), (TextLayout, "text"), (PangoLayout, "set_alignment"))
+    }
+
+    def is_stock():
+        return all(cls.__dict__.get(name) is value for (cls, name), value in stock.items())
+
+    # Neither qtile >= 0.23's drawer module nor 0.22's backend.base exports.
+    backend = sys.modules["libqtile.backend.base"], sys.modules["libqtile.backend.base.drawer"]
+    sys.modules["libqtile.backend.base"] = types.ModuleType("libqtile.backend.base")
+    sys.modules["libqtile.backend.base.drawer"] = None
+    logging.getLogger("libqtile").disabled = True
+    broken = importlib.import_module("textcache").TextCache()
+    broken.install()
+    logging.getLogger("libqtile").disabled = False
+    untouched = is_stock() and broken._draw is None
+    sys.modules["libqtile.backend.base"], sys.modules["libqtile.backend.base.drawer"] = backend
+    sys.modules["textcache"].TextCache().install()
+    patched = not is_stock()
+    for (cls, name), value in stock.items():
+        setattr(cls, name, value)
+    del TextLayout._uncached
+    print("install() without a drawer module leaves qtile stock  {}".format(untouched))
+    print("install() patches libqtile.backend.base.drawer        {}".format(patched))
+    if not (untouched and patched):
+        sys.exit(1)
+
+    purge_modules()
+    try:
+        import cairocffi
+        from libqtile import pangocffi
+        from libqtile.utils import rgb
+
+        try:
+            drawer = importlib.import_module("libqtile.backend.base.drawer")
+        except ImportError:
+            # qtile 0.22
+            drawer = importlib.import_module("libqtile.backend.base")
+    except (ImportError, OSError) as e:
+        print("frame timings skipped, they need qtile and cairocffi: {}".format(e))
+        return
+
+    from textcache import TextCache
+    from theme import THEMES
+
+    # The [hex, hex] entries config.py's widgets are given.
+    colors = [[colour, colour] for colour in THEMES["super"]["colors"]]
+
+    class BenchDrawer:
+        def __init__(self):
+            self.surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 2560, 56)
+            self.ctx = pangocffi.patch_cairo_context(cairocffi.Context(self.surface))
+
+        def set_source_rgb(self, colour):
+            self.ctx.set_source_rgba(*rgb(colour))
+
+    def frames():
+        target = BenchDrawer()
+        layouts = [
+            drawer.TextLayout(target, text, colors[slot], font, size, None, markup=True)
+            for font, size, text, slot in BAR_TEXT
+        ]
+        clock = drawer.TextLayout(target, "", colors[11], "FiraCode Nerd Font", 16, None)
+        times = []
+        for frame in range(args.frames):
+            start = time.perf_counter()
+            x = 0
+            for layout in layouts:
+                layout.draw(x, 10)
+                x += layout.width + 16
+            clock.text = "{:02d}:{:02d}".format(frame // 60 % 24, frame % 60)
+            clock.draw(x, 10)
+            target.surface.flush()
+            times.append((time.perf_counter() - start) * 1000)
+        return times
+
+    before = frames()
+    cache = TextCache()
+    cache.install()
+    after = frames()
+    for name, times in (("uncached", before), ("cached", after)):
+        times.sort()
+        print("  {:<10} p50 {:7.3f} ms  p99 {:7.3f} ms per frame".format(
+            name, times[len(times) // 2], times[int(len(times) * 0.99)]))
+    report = cache.report()
+    print("  {}".format(report))
+
+    # Same text in a wider slot, once centred and once left-aligned: two
+    # different renders, so two entries.
+    target = BenchDrawer()
+    aligned = []
+    for alignment in (pangocffi.ALIGN_CENTER, pangocffi.ALIGN_LEFT):
+        layout = drawer.TextLayout(target, "Workstation", colors[1], "FiraCode Nerd Font", 16, None)
+        layout.width = 200
+        layout.layout.set_alignment(alignment)
+        aligned.append(cache._key(layout))
+    print("  alignment keyed separately  {}".format(aligned[0] != aligned[1]))
+    if report["hit_rate"] < 0.9 or aligned[0] == aligned[1]:
+        sys.exit(1)
+
+
+class WallScreen:
+    def __init__(self, qtile, index, width, height):
+        self.qtile = qtile
+        self.index = index
+        self.x = self.y = 0
+        self.width, self.height = width, height
+        self.painted = []
+
+    def cmd_set_wallpaper(self, path, mode=None):
+        self.painted.append((path, mode))
+
+
+class WallQtile:
+    def __init__(self, sizes, painter=None):
+        self.screens = [WallScreen(self, index, *size) for index, size in enumerate(sizes)]
+        self.soon = []
+        self.core = types.SimpleNamespace(
+            get_screen_info=lambda: [(s.x, s.y, s.width, s.height) for s in self.screens]
+        )
+        if painter is not None:
+            self.core.painter = painter
+
+    def call_soon(self, func, *args):
+        self.soon.append((func, args))
+
+    def reload_config(self):
+        pass
+
+
+class WallPainter:
+    # xcbq.Painter's root pixmap, as a plain image surface.
+
+    def __init__(self, cairocffi, width, height):
+        self.cairocffi = cairocffi
+        self.size = width, height
+        self.updates = 0
+
+    def _get_root_pixmap_and_surface(self, screen):
+        # A new pixmap each time, as when qtile finds no root pixmap yet.
+        root = self.cairocffi.ImageSurface(self.cairocffi.FORMAT_ARGB32, *self.size)
+        return root, root
+
+    def _update_root_pixmap(self, root_pixmap):
+        self.updates += 1
+
+
+def cmd_wallpaper(args):
+    # What painting the wallpaper costs across config reloads: startup, a
+    # reload with nothing changed, the image touched, the config pointing
+    # at another image, one output changing resolution, and a restart.
+    # Reloads go through every module of this directory and config.py
+    # twice, the way reload_config does. Then the disk tier of the cache,
+    # which has to outlive the session.
+    logging.getLogger("libqtile").setLevel(logging.ERROR)
+    try:
+        import cairocffi
+    except (ImportError, OSError):
+        cairocffi = None
+    home = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory() as tmp:
+        # WallpaperCache keeps its files under ~/.cache.
+        os.environ["HOME"] = tmp
+        try:
+            steps, tier, timings = wallpaper_steps(tmp, cairocffi)
+        finally:
+            if home is None:
+                del os.environ["HOME"]
+            else:
+                os.environ["HOME"] = home
+
+    wrong = 0
+    for name, expected, count, elapsed in steps:
+        wrong += count != expected
+        print("  {:<22} {} paints (expected {})  {:8.1f} us".format(name, count, expected, elapsed))
+    for name, ok in tier:
+        wrong += not ok
+        print("  {:<40} {}".format(name, ok))
+    print("  " + timings)
+    if cairocffi is None:
+        print("  surfaces not painted: cairocffi unavailable, qtile painted the files")
+    if wrong:
+        sys.exit(1)
+
+
+def wallpaper_steps(tmp, cairocffi):
+    sizes = [(2560, 1440), (1920, 1080)]
+    images = []
+    for name in ("a.png", "b.png"):
+        images.append(os.path.join(tmp, name))
+        if cairocffi is None:
+            with open(images[-1], "wb") as f:
+                f.write(b"\x89PNG\r\n\x1a\n")
+        else:
+            image = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 64, 36)
+            context = cairocffi.Context(image)
+            context.set_source_rgb(0.2 * len(images), 0.4, 0.6)
+            context.paint()
+            image.write_to_png(images[-1])
+    with open(CONFIG) as f:
+        source = f.read()
+    config = os.path.join(tmp, "config.py")
+
+    def config_with(image):
+        with open(config, "w") as f:
+            f.write(re.sub(r"^wallpaper = .*$", "wallpaper = {!r}".format(image), source, flags=re.M))
+        return config
+
+    def session():
+        painter = None if cairocffi is None else WallPainter(cairocffi, 2560 + 1920, 1440)
+        qtile = WallQtile(sizes, painter)
+        purge_modules()
+        libqtile, hooks = install_stubs()
+        libqtile.qtile = qtile
+        if HERE not in sys.path:
+            sys.path.insert(0, HERE)
+        runpy.run_path(config_with(images[0]), run_name="config")
+        return qtile, hooks
+
+    def painted(qtile):
+        painter = getattr(qtile.core, "painter", None)
+        return sum(len(s.painted) for s in qtile.screens) + (painter.updates if painter else 0)
+
+    def paints(qtile, hooks, *fire):
+        before = painted(qtile)
+        start = time.perf_counter()
+        for name in fire:
+            for func in hooks.get(name, ()):
+                if func.__name__ == "_paint_wallpaper":
+                    func()
+        while qtile.soon:
+            func, call_args = qtile.soon.pop(0)
+            if func.__name__ == "_paint_wallpaper":
+                func(*call_args)
+        elapsed = (time.perf_counter() - start) * 1e6
+        return painted(qtile) - before, elapsed
+
+    def reload(qtile, hooks, image):
+        reload_like_qtile(hooks, config_with(image))
+        # Only the second run's call_soon work is left to matter; both
+        # queue a paint, and the first one paints if anything does.
+        return paints(qtile, hooks)
+
+    steps = []
+    qtile, hooks = session()
+    steps.append(("startup", 2) + paints(qtile, hooks, "startup_complete"))
+    steps.append(("reload, unchanged", 0) + reload(qtile, hooks, images[0]))
+    os.utime(images[0], ns=(0, os.stat(images[0]).st_mtime_ns + 10**9))
+    steps.append(("reload, image touched", 2) + reload(qtile, hooks, images[0]))
+    steps.append(("reload, other image", 2) + reload(qtile, hooks, images[1]))
+    qtile.screens[1].width, qtile.screens[1].height = 2560, 1440
+    steps.append(("output resized", 1) + paints(qtile, hooks, "screens_reconfigured"))
+    scaled = sys.modules["wallpaper"].wallpaper_cache.misses
+    qtile, hooks = session()
+    steps.append(("restart", 2) + paints(qtile, hooks, "startup_complete"))
+    restarted = sys.modules["wallpaper"].wallpaper_cache
+
+    tier = []
+    if cairocffi is not None:
+        tier.append(("session scaled each new key once", scaled == 1 + 2 + 2 + 1))
+        tier.append(("restart mapped both outputs from disk", (restarted.hits, restarted.misses) == (2, 0)))
+
+    # The raw files themselves, written by one session and mapped by the
+    # next. Nothing of this needs cairo.
+    wallpaper = sys.modules["wallpaper"]
+    raw = os.path.join(tmp, "raw")
+    os.makedirs(raw)
+    width, height = 2560, 1440
+    stride = width * 4
+    pixels = os.urandom(stride * height)
+    start = time.perf_counter()
+    wallpaper.write_raw(os.path.join(raw, "screen.argb"), width, height, stride, pixels)
+    written = (time.perf_counter() - start) * 1000
+    purge_modules()
+    install_stubs()
+    wallpaper = importlib.import_module("wallpaper")
+    start = time.perf_counter()
+    hit = wallpaper.read_raw(os.path.join(raw, "screen.argb"), width, height)
+    mapped = (time.perf_counter() - start) * 1000
+    tier.append(("raw surface mapped after a restart", hit is not None and hit[0] == stride))
+    if hit is not None:
+        tier.append(("mapped pixels intact", hit[1][wallpaper.HEADER.size:] == pixels))
+        hit[1].close()
+    tier.append(("other resolution is a miss", wallpaper.read_raw(os.path.join(raw, "screen.argb"), 1920, 1080) is None))
+    with open(os.path.join(raw, "screen.argb"), "r+b") as f:
+        f.truncate(wallpaper.HEADER.size + stride * (height - 1))
+    tier.append(("truncated file is a miss", wallpaper.read_raw(os.path.join(raw, "screen.argb"), width, height) is None))
+    open(os.path.join(raw, "empty.argb"), "wb").close()
+    tier.append(("empty file is a miss", wallpaper.read_raw(os.path.join(raw, "empty.argb"), width, height) is None))
+    tier.append(("missing file is a miss", wallpaper.read_raw(os.path.join(raw, "none.argb"), width, height) is None))
+    timings = "2560x1440 raw surface: written in {:.1f} ms, mapped in {:.3f} ms".format(written, mapped)
+    return steps, tier, timings
+
+
+def cmd_ticks(args):
+    # Bar clocks on the shared TickScheduler over a stretch of virtual time,
+    # against stock Clocks polling every update_interval (1s). Then wall
+    # time jumps forward, as after a suspend, and the minute clock has to
+    # catch up within max_sleep.
+    load_config()
+    scheduler_module = sys.modules["scheduler"]
+    loop = VirtualLoop()
+    epoch = [round(time.time() / 86400) * 86400 + 0.5]
+    clock = virtual_time(loop, 0)
+    clock.time = lambda: epoch[0] + loop.now
+    scheduler_module.time = clock
+    scheduler = scheduler_module.TickScheduler()
+    formats = ["%a, %b %d", "%I:%M %p"] * args.screens
+    seen = [[] for _ in formats]
+
+    def clock_for(fmt, shown):
+        def tick():
+            shown.append(clock.strftime(fmt, clock.localtime(clock.time())))
+
+        return tick
+
+    async def run():
+        for fmt, shown in zip(formats, seen):
+            scheduler.register(clock_for(fmt, shown), scheduler_module.granularity(fmt))
+        await loop.advance(args.hours * 3600)
+        wakeups, shown = scheduler.wakeups, len(seen[1])
+        # Suspended for an hour and a half: the loop's clock stands still.
+        epoch[0] += 5400
+        await loop.advance(loop.now + scheduler.max_sleep + 1)
+        return wakeups, shown
+
+    asyncio.set_event_loop(loop)
+    try:
+        wakeups, shown = loop.run_until_complete(run())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    seconds = args.hours * 3600
+    stock = len(formats) * seconds
+    minutes = seen[1]
+    # Every value the minute clock showed differs from the one before it,
+    # and none of the hour's minutes was skipped.
+    repeats = sum(a == b for a, b in zip(minutes, minutes[1:]))
+    skipped = seconds // 60 - shown
+    caught_up = minutes[-1] == clock.strftime("%I:%M %p", clock.localtime(clock.time()))
+    print("{} clocks over {}h of virtual time".format(len(formats), args.hours))
+    print("  stock wakeups      {:7d}".format(stock))
+    print("  scheduler wakeups  {:7d}  ({} ticks)".format(wakeups, scheduler.ticks))
+    print("  repeated minutes   {:7d}".format(repeats))
+    print("  skipped minutes    {:7d}".format(skipped))
+    print("  after suspend      {}".format("caught up" if caught_up else "STALE"))
+    if repeats or skipped or not caught_up or wakeups > seconds // 60 * 1.1 + 2:
+        sys.exit(1)
+
+
+class OpCounter:
+    # A cairo context that only counts what it is asked to do.
+
+    def __init__(self):
+        self.ops = 0
+
+    def __getattr__(self, name):
+        def op(*args):
+            self.ops += 1
+
+        return op
+
+
+def bar_segments(widgets):
+    # Runs of adjacent widgets sharing a grouped RectDecoration, as
+    # qtile_extras joins them, and the widgets between them.
+    segments, loose, run = [], [], []
+    for widget in widgets:
+        decorations = widget.kwargs.get("decorations") or ()
+        if any(d.kwargs.get("group") for d in decorations):
+            run.append(widget)
+            continue
+        if run:
+            segments.append(run)
+            run = []
+        loose.append(widget)
+    if run:
+        segments.append(run)
+    return segments, loose
+
+
+def paint_bar(ctx, segments, loose, capped):
+    # One frame of the top bar. ``capped`` is the old style: every widget
+    # under a BorderDecoration (two bands) and each segment between two cap
+    # glyph TextBoxes. Otherwise each widget paints its clip of the
+    # segment's rounded rectangle.
+    x = 0
+
+    def widget(text, width, pill=None):
+        nonlocal x
+        ctx.rectangle(x, 0, width, 56)
+        ctx.fill()
+        if capped:
+            for y, band in ((0, 13.5), (56 - 12.5, 12.5)):
+                ctx.rectangle(x, y, width, band)
+                ctx.fill()
+        elif pill is not None:
+            left, right = pill
+            ctx.save()
+            ctx.rectangle(x, 0, width, 56)
+            ctx.clip()
+            ctx.new_sub_path()
+            for cx, cy, a in ((right - 12, 25, -math.pi / 2), (right - 12, 31, 0),
+                              (left + 12, 31, math.pi / 2), (left + 12, 25, math.pi)):
+                ctx.arc(cx, cy, 12, a, a + math.pi / 2)
+            ctx.close_path()
+            ctx.fill()
+            ctx.restore()
+        ctx.move_to(x + 4, 36)
+        ctx.show_text(text)
+        x += width
+
+    def text_of(w):
+        return w.kwargs.get("text") or "64% 2:41"
+
+    for w in loose:
+        widget(text_of(w), len(text_of(w)) * 9 + 8)
+    for run in segments:
+        widths = [len(text_of(w)) * 9 + 16 for w in run]
+        pill = (x + (24 if capped else 0), x + sum(widths))
+        if capped:
+            widget("\ue0b6", 24)
+        for w, width in zip(run, widths):
+            widget(text_of(w), width, pill)
+        if capped:
+            widget("\ue0b4", 24)
+
+
+def cmd_segments(args):
+    # Before/after cost of one top-bar frame: status segments framed by cap
+    # glyph TextBoxes under BorderDecorations, against one grouped rounded
+    # RectDecoration per segment. Both are painted from the segments and
+    # widgets config.py builds today; draw calls are counted here, and
+    # timed on a real cairo surface when cairocffi is installed.
+    namespace, _hooks, _ = load_config()
+    screen = namespace["screens"][0]
+    widgets = (getattr(screen, "top", None) or screen.kwargs["top"]).factory()
+    segments, loose = bar_segments(widgets)
+    try:
+        import cairocffi
+    except (ImportError, OSError):
+        cairocffi = None
+
+    print("{} widgets, {} segments".format(len(widgets), len(segments)))
+    for name, capped in (("caps", True), ("grouped", False)):
+        counter = OpCounter()
+        paint_bar(counter, segments, loose, capped)
+        line = "  {:<8} {:3d} widgets  {:4d} draw calls".format(
+            name, len(widgets) + 2 * len(segments) * capped, counter.ops)
+        if cairocffi is not None:
+            surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, 2560, 56)
+            ctx = cairocffi.Context(surface)
+            times = []
+            for _ in range(args.frames):
+                start = time.perf_counter()
+                paint_bar(ctx, segments, loose, capped)
+                surface.flush()
+                times.append((time.perf_counter() - start) * 1000)
+            times.sort()
+            line += "  p50 {:6.3f} ms  p99 {:6.3f} ms".format(
+                times[len(times) // 2], times[int(len(times) * 0.99)])
+        print(line)
+    if cairocffi is None:
+        print("  (cairocffi not available: draw calls counted, frames not timed)")
+
+
+class BenchWindow:
+    def __init__(self, wid):
+        self.wid = wid
+        self.name = "kitty {}".format(wid)
+        self.has_focus = False
+        self.floating = False
+        self.geometry = None
+
+    def place(self, x, y, width, height, borderwidth, bordercolor, **kwargs):
+        self.geometry = (x, y, width, height)
+
+    def hide(self):
+        self.geometry = None
+
+    def unhide(self):
+        pass
+
+    def __repr__(self):
+        return self.name
+
+
+class BenchGroup:
+    # What a layout sees of its group: a relayout of every window after
+    # each change, the way Group.layout_all does it.
+
+    def __init__(self, screen_rect):
+        self.screen_rect = screen_rect
+        self.windows = []
+        self.current_window = None
+        self.layout = None
+
+    def layout_all(self, warp=False, focus=True):
+        self.layout.layout(self.windows, self.screen_rect)
+
+    def focus(self, win, warp=True, force=False):
+        if self.current_window is not None:
+            self.current_window.has_focus = False
+        self.current_window = win
+        if win is not None:
+            win.has_focus = True
+            self.layout.focus(win)
+        self.layout_all()
+
+
+def layout_command(target, name, *args):
+    # qtile before 0.24 prefixes commands with cmd_.
+    method = getattr(target, name, None) or getattr(target, "cmd_" + name)
+    return method(*args)
+
+
+def drive(layout_cls, config, count, ops, rng):
+    from libqtile.config import ScreenRect
+
+    group = BenchGroup(ScreenRect(0, 56, 2560, 1384))
+    tiler = layout_cls(**config).clone(group)
+    group.layout = tiler
+    add = getattr(tiler, "add_client", None) or tiler.add
+    timings = {name: [] for name in ("add", "focus", "grow", "remove")}
+
+    geometry = []
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        timings[name].append((time.perf_counter() - start) * 1e6)
+        geometry.append([win.geometry for win in group.windows])
+
+    def add_window(wid):
+        win = BenchWindow(wid)
+        group.windows.append(win)
+        add(win)
+        group.focus(win)
+
+    for wid in range(count):
+        timed("add", add_window, wid)
+    if isinstance(tiler, (sys.modules["libqtile.layout"].Columns,)):
+        grows = [("grow_right", "grow_left"), ("grow_down", "grow_up")]
+    else:
+        grows = [("grow_main", "shrink_main"), ("increase_ratio", "decrease_ratio")]
+    for _ in range(ops):
+        timed("focus", group.focus, rng.choice(group.windows))
+    for _ in range(ops // 4):
+        for grow, shrink in grows:
+            timed("grow", lambda: (layout_command(tiler, grow), group.layout_all()))
+            timed("grow", lambda: (layout_command(tiler, shrink), group.layout_all()))
+    while group.windows:
+        win = group.windows.pop(rng.randrange(len(group.windows)))
+
+        def remove(win=win):
+            tiler.remove(win)
+            group.focus(group.windows[-1] if group.windows else None)
+
+        timed("remove", remove)
+    return timings, geometry
+
+
+def import_layouts():
+    # The real libqtile.layout in place of the stubs. Layouts never draw,
+    # but importing them pulls in cairo and pango through the drawer; where
+    # those libraries are missing, stubs stand in for the two modules.
+    # None without libqtile itself.
+    for stubbed in (False, True):
+        purge_modules()
+        sys.modules.pop("cairocffi", None)
+        if stubbed:
+            cairocffi = StubModule("cairocffi")
+            cairocffi.__path__ = []
+            cairocffi.pixbuf = sys.modules["cairocffi.pixbuf"] = StubModule("cairocffi.pixbuf")
+            sys.modules["cairocffi"] = cairocffi
+            sys.modules["libqtile.pangocffi"] = StubModule("libqtile.pangocffi")
+        if HERE not in sys.path:
+            sys.path.insert(0, HERE)
+        try:
+            from libqtile import layout
+        except ModuleNotFoundError as e:
+            if e.name == "libqtile":
+                return None
+            error = e
+        except (ImportError, OSError) as e:
+            # cairocffi raises OSError when libcairo is missing.
+            error = e
+        else:
+            if stubbed:
+                print("cairo/pango stubbed for the layouts: {}".format(error))
+            return layout
+    raise error
+
+
+def cmd_layouts(args):
+    # The layout configurations are read from config.py itself.
+    namespace, _hooks, _ = load_config()
+    configs = [
+        (type(tiler).__name__, dict(tiler.kwargs))
+        for tiler in namespace["layouts"]
+        if type(tiler).__name__ in ("Columns", "Spiral")
+    ]
+    # Another Spiral orientation sharing the same geometry cache, which
+    # must not be handed the first one's rectangles.
+    configs += [
+        (name, dict(config, main_pane="top", clockwise=False))
+        for name, config in list(configs)
+        if name == "Spiral"
+    ]
+    layout = import_layouts()
+    if layout is None:
+        print("layouts skipped: libqtile is not installed")
+        return
+    import tiling
+
+    # Cleared once: every configuration and size shares the cache, as the
+    # groups of a session do.
+    tiling.geometry_cache.clear()
+    mismatches = 0
+    for name, config in configs:
+        orientation = "" if name == "Columns" else " ({main_pane}, {clockwise})".format(
+            main_pane=config.get("main_pane", "left"), clockwise=config.get("clockwise", True))
+        for count in args.windows:
+            print("{}{} with {} windows (p50 / p99 per operation, us)".format(name, orientation, count))
+            placed = {}
+            for label, cls in (("stock", getattr(layout, name)), ("memoized", getattr(tiling, name))):
+                timings, placed[label] = drive(cls, config, count, args.ops, random.Random(count))
+                cells = []
+                for op, samples in timings.items():
+                    samples.sort()
+                    cells.append("{} {:.0f}/{:.0f}".format(
+                        op, samples[len(samples) // 2], samples[int(len(samples) * 0.99)]))
+                print("  {:<9} {}".format(label, "  ".join(cells)))
+            same = placed["stock"] == placed["memoized"]
+            mismatches += not same
+            print("  geometry matches stock  {}".format(same))
+    print("geometry cache {}".format(tiling.geometry_cache.report()))
+    if mismatches:
+        sys.exit(1)
+
+
+class PointerWindow:
+    def __init__(self, name, x, y, width, height):
+        self.name = name
+        self.x, self.y, self.width, self.height = x, y, width, height
+        self.borderwidth = 2
+
+    def __repr__(self):
+        return self.name
+
+
+def pointer_paths(rng):
+    # (seconds, x, y) samples at 125Hz: fast sweeps across the screen, each
+    # ending in a slow approach and a rest on the window actually wanted.
+    t, x, y = 0.0, 1280.0, 720.0
+    samples = []
+
+    def move(to_x, to_y, speed):
+        nonlocal t, x, y
+        steps = max(int(math.hypot(to_x - x, to_y - y) / speed * 125), 1)
+        for step in range(1, steps + 1):
+            samples.append((t + step / 125, x + (to_x - x) * step / steps, y + (to_y - y) * step / steps))
+        t, x, y = t + steps / 125, to_x, to_y
+
+    for _ in range(12):
+        target_x, target_y = rng.uniform(20, 2540), rng.uniform(76, 1420)
+        move(rng.uniform(20, 2540), rng.uniform(76, 1420), rng.uniform(2500, 5000))
+        move(target_x, target_y, rng.uniform(2500, 5000))
+        move(target_x + rng.uniform(-30, 30), target_y + rng.uniform(-30, 30), 150)
+        samples.append((t + 0.5, x, y))
+        t += 0.5
+    return samples
+
+
+def cmd_focus(args):
+    load_config()
+    sys.modules.pop("focus", None)
+    from focus import FocusIntent
+
+    # A full Columns group: four columns of three windows below the bar.
+    windows = [
+        PointerWindow("w{}{}".format(col, row), col * 640, 56 + row * 461, 636, 457)
+        for col in range(4)
+        for row in range(3)
+    ]
+    if args.path:
+        with open(args.path) as f:
+            samples = [tuple(json.loads(line)) for line in f if line.strip()]
+    else:
+        samples = pointer_paths(random.Random(0))
+
+    pointer = [0.0, 0.0]
+    focused = []
+    intent = FocusIntent(
+        dwell=args.dwell, position=lambda: tuple(pointer), focus=focused.append
+    )
+
+    def under(x, y):
+        for window in windows:
+            if window.x <= x < window.x + window.width + 4 and window.y <= y < window.y + window.height + 4:
+                return window
+        return None
+
+    async def replay():
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        current = None
+        rests = correct = 0
+        previous = 0.0
+        for t, x, y in samples:
+            await asyncio.sleep(max(start + t - loop.time(), 0))
+            pointer[:] = [x, y]
+            window = under(x, y)
+            if window is not None and window is not current:
+                intent.enter(window)
+            current = window
+            if t - previous >= 0.4 and current is not None:
+                # The pointer rested: focus should be where it stopped.
+                rests += 1
+                correct += bool(focused) and focused[-1] is current
+            previous = t
+        await asyncio.sleep(args.dwell * 2)
+        return rests, correct
+
+    rests, correct = asyncio.run(replay())
+    report = intent.report()
+    print("{} pointer samples over {:.1f}s".format(len(samples), samples[-1][0]))
+    print("  window enters      {:5d}  (stock focus changes)".format(report["entered"]))
+    print("  committed          {:5d}".format(report["committed"]))
+    print("  suppressed         {:5d}".format(report["suppressed"]))
+    print("  focused after rest {:5d} / {}".format(correct, rests))
+
+
+class RuleClient:
+    def __init__(self, wid, wm_class, name, wm_type="normal"):
+        self.wid = wid
+        self.name = name
+        self._wm_class = wm_class
+        self._wm_type = wm_type
+
+    def get_wm_class(self):
+        return self._wm_class
+
+    def get_wm_type(self):
+        return self._wm_type
+
+
+def cmd_rules(args):
+    # Route synthetic clients through config.py's RuleEngine and through a
+    # stock scan of every group's matches and every float rule, checking
+    # that both agree. Then route the same clients again (cache hits), and
+    # retitle a client onto a title rule to show the cached route is
+    # dropped when the title changes.
+    namespace, _hooks, _ = load_config()
+    router = namespace["router"]
+    workspaces = namespace["workspaces"]
+    float_rules = namespace["float_rules"]
+
+    def stock(client):
+        target = next(
+            (w["name"] for w in workspaces if any(m.compare(client) for m in w.get("matches") or ())),
+            None,
+        )
+        return target, any(m.compare(client) for m in float_rules)
+
+    matches = [m._rules["wm_class"] for w in workspaces for m in w.get("matches") or ()]
+    known = matches + [m._rules["wm_class"] for m in float_rules if isinstance(m._rules.get("wm_class"), str)]
+    rng = random.Random(0)
+    clients = []
+    for wid in range(args.clients):
+        if rng.random() < 0.5:
+            wm_class = rng.choice(known)
+        else:
+            wm_class = "app{}".format(rng.randrange(args.clients))
+        wm_type = "dialog" if rng.random() < 0.05 else "normal"
+        clients.append(RuleClient(wid, [wm_class.lower(), wm_class], "{} {}".format(wm_class, wid), wm_type))
+
+    times = {"stock": [], "engine": [], "cached": []}
+    wrong = 0
+    for client in clients:
+        for kind, route in (("stock", stock), ("engine", router.route)):
+            start = time.perf_counter()
+            result = route(client)
+            times[kind].append(time.perf_counter() - start)
+        wrong += result != stock(client)
+    for client in clients:
+        start = time.perf_counter()
+        router.route(client)
+        times["cached"].append(time.perf_counter() - start)
+
+    client = next(c for c in clients if not router.route(c)[1])
+    before = router.route(client)
+    client.name = "pinentry"
+    after = router.route(client)
+    retitled = after == stock(client) and after[1]
+
+    print("{} clients, {} group matches, {} float rules".format(
+        len(clients), len(matches), len(float_rules)))
+    for kind, ts in times.items():
+        ts.sort()
+        print("  {:<7} p50 {:6.2f} us  p99 {:6.2f} us  total {:7.2f} ms".format(
+            kind, ts[len(ts) // 2] * 1e6, ts[int(len(ts) * 0.99)] * 1e6, sum(ts) * 1000))
+    print("  routes differing from stock  {}".format(wrong))
+    print("  retitled to pinentry         {} -> {} ({})".format(
+        before, after, "re-routed" if retitled else "STALE"))
+    if wrong or not retitled:
+        sys.exit(1)
+
+
+def reload_like_qtile(hooks, config=CONFIG):
+    # What reload_config does on current qtile: every module of this
+    # directory is reloaded and config.py run again, the hooks cleared, and
+    # then all of that once more from load_config(). Only hooks subscribed
+    # by the second run stay.
+    for _ in range(2):
+        hooks.clear()
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if module.__name__ != "__main__" and path and os.path.dirname(os.path.abspath(path)) == HERE:
+                importlib.reload(module)
+        namespace = runpy.run_path(config, run_name="config")
+    return namespace
+
+
+class ReloadHandle:
+    def __init__(self, func):
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class ReloadQtile:
+    # A session for config reloads: it hands out real pids, so the terminal
+    # pool's liveness checks pass, and runs call_soon work on demand.
+
+    def __init__(self):
+        self.screens = []
+        self.groups_map = {}
+        self.widgets_map = {"clock": ReloadWidget()}
+        self.core = types.SimpleNamespace(flush=lambda: None)
+        self.soon = []
+        self.later = []
+        self.spawned = []
+        self._pids = iter(sorted(int(name) for name in os.listdir("/proc") if name.isdigit()))
+
+    def call_soon(self, func, *args):
+        self.soon.append((func, args))
+
+    def call_later(self, delay, func, *args):
+        handle = ReloadHandle(lambda: func(*args))
+        self.later.append(handle)
+        return handle
+
+    def run_soon(self):
+        while self.soon:
+            func, args = self.soon.pop(0)
+            func(*args)
+
+    def cmd_spawn(self, command):
+        pid = next(self._pids)
+        self.spawned.append(pid)
+        return pid
+
+
+class ReloadWidget:
+    def draw(self):
+        pass
+
+
+class ReloadWindow:
+    def __init__(self, wid, pid):
+        self.wid = wid
+        self.pid = pid
+        self.window = self
+        self.group = None
+
+    def get_net_wm_pid(self):
+        return self.pid
+
+    def togroup(self, name):
+        self.group = name
+
+    def kill(self):
+        self.group = None
+
+
+def cmd_reload(args):
+    # Config reloads against a session that outlives them, as qtile's own
+    # reload_config does it: what the config started before the reload has
+    # to carry on, or be stopped, afterwards.
+    qtile = ReloadQtile()
+    # The watchdog schedules its heartbeat on the current loop.
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    namespace, hooks, _ = load_config(qtile)
+    qtile.run_soon()
+    for func in hooks.get("startup_complete", ()):
+        func()
+
+    # Terminals parked before the reload are the new pool's to hand out.
+    pool = namespace["terminal_pool"]
+    pool.fill()
+    parked = [ReloadWindow(0x400001 + n, pid) for n, pid in enumerate(qtile.spawned)]
+    for window in parked:
+        pool.client_new(window)
+    spawned = len(qtile.spawned)
+    # Profiling switched on from the keyboard before the reload.
+    old_profiler = namespace["profiler"]
+    old_widget = qtile.widgets_map["clock"]
+    namespace["toggle_profiling"](qtile)
+    # And the watchdog.
+    old_watchdog = namespace["watchdog"]
+    namespace["toggle_watchdog"](qtile)
+    old_history = namespace["notification_history"]
+    namespace = reload_like_qtile(hooks)
+    # reload_config finalizes the widgets and builds the bars anew.
+    qtile.widgets_map = {"clock": ReloadWidget()}
+    qtile.run_soon()
+    pool = namespace["terminal_pool"]
+    # Nothing fires startup_complete again; the config's own call_soon work
+    # has to start the new objects.
+    started = {
+        "notification history": namespace["notification_history"]._started,
+        "terminal pool": pool._refill_handle is not None,
+    }
+    pool.fill()
+    adopted = all(pool.owns(window) for window in parked)
+    respawned = len(qtile.spawned) - spawned
+    profiler = namespace["profiler"]
+    carried = {
+        "old history stopped": old_history._stopped and not namespace["notification_history"]._stopped,
+        "old profiler unwrapped": not old_profiler.enabled and "draw" not in vars(old_widget),
+        "new profiler running": profiler.enabled and "draw" in vars(qtile.widgets_map["clock"]),
+        "profile_summary rebound": qtile.cmd_profile_summary.__self__ is profiler,
+        "old watchdog stopped": not old_watchdog.running,
+        "new watchdog running": namespace["watchdog"].running,
+        "stalls rebound": qtile.cmd_stalls.__self__ is namespace["watchdog"],
+    }
+    namespace["watchdog"].stop()
+
+    print("config.py reloaded the way reload_config does")
+    print("  parked terminals adopted     {}/{}".format(
+        sum(pool.owns(window) for window in parked), len(parked)))
+    print("  terminals spawned again      {}".format(respawned))
+    for name, ok in started.items():
+        print("  {:<28} {}".format(name + " started", ok))
+    for name, ok in carried.items():
+        print("  {:<28} {}".format(name, ok))
+    if not adopted or respawned or not all(started.values()) or not all(carried.values()):
+        sys.exit(1)
+
+
+def cmd_livereload(args):
+    # What mod+r does to the hook subscriptions: config.py is evaluated
+    # aside, the live subscriptions are put back and the new ones diffed.
+    # Afterwards they must still have qtile's nested shape and the same
+    # functions, or the next hook.fire breaks.
+    live, _hooks, _ = load_config()
+    hook = sys.modules["libqtile.hook"]
+    sys.modules["config"] = module = types.ModuleType("config")
+    module.__dict__.update(live)
+    from livereload import _LiveConfig, compute, evaluate
+
+    before = {
+        registry: {event: list(funcs) for event, funcs in events.items()}
+        for registry, events in hook.subscriptions.items()
+    }
+    qtile = Stub(config=Stub(keys=[], screens=[], file_path=CONFIG))
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        namespace, new_hooks = evaluate(CONFIG)
+        namespace.pop("keys", None)
+        namespace.pop("screens", None)
+        diff = compute(qtile, _LiveConfig(qtile.config), namespace, new_hooks)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    nested = all(
+        isinstance(events, dict) and all(isinstance(funcs, list) for funcs in events.values())
+        for events in hook.subscriptions.values()
+    )
+    restored = nested and hook.subscriptions == before
+    changed = [name for name in diff.structural if name.startswith("hook ")]
+    # Looked up the way hook.fire does on qtile >= 0.23.
+    fired = sum(
+        len(hook.subscriptions["qtile"].get(event, [])) for event in hook.subscriptions.get("qtile", {})
+    )
+    print("{} incremental evaluation(s), median {:.1f} ms".format(args.repeat, statistics.median(timings)))
+    print("  subscriptions nested     {}".format(nested))
+    print("  live hooks restored      {}  ({} functions)".format(restored, fired))
+    print("  hooks seen as changed    {}".format(", ".join(changed) or "none"))
+    if not restored or changed:
+        sys.exit(1)
+
+
+class MonitorBus:
+    # A session bus connection that accepts BecomeMonitor and hands out
+    # Notify calls.
+
+    def __init__(self, buses):
+        self.handlers = []
+        self.closed = False
+        buses.append(self)
+
+    async def connect(self):
+        await asyncio.sleep(0.01)
+        return self
+
+    async def call(self, message):
+        await asyncio.sleep(0)
+
+    def add_message_handler(self, handler):
+        self.handlers.append(handler)
+
+    def remove_message_handler(self, handler):
+        self.handlers.remove(handler)
+
+    def disconnect(self):
+        self.closed = True
+
+    def deliver(self, app, summary, urgency):
+        hints = {"urgency": types.SimpleNamespace(value=urgency)}
+        message = types.SimpleNamespace(
+            member="Notify", body=[app, 0, "", summary, "", [], hints, -1]
+        )
+        for handler in list(self.handlers):
+            handler(message)
+
+
+def cmd_dunst(args):
+    # DunstState and the history seed driven through fake-dunstctl, picked
+    # up from QTILE_DUNSTCTL the way a session would. Listeners must only
+    # hear real flips, and only the toggles themselves may spawn dunstctl.
+    load_config()
+    utils = sys.modules["libqtile.utils"]
+    utils.create_task = lambda coro: asyncio.get_event_loop().create_task(coro)
+    sys.modules.pop("notifications", None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_file = os.path.join(tmp, "dunst")
+        os.environ["FAKE_DUNSTCTL_STATE"] = state_file
+        os.environ["QTILE_DUNSTCTL"] = os.path.join(HERE, "fake-dunstctl")
+        from notifications import DunstState, NotificationHistory
+
+        apps = ["firefox", "discord", "kitty", "spotify"]
+        with open(state_file + ".history", "w") as f:
+            json.dump({"type": "aaa{sv}", "data": [[
+                {
+                    "appname": {"data": apps[n % len(apps)]},
+                    "urgency": {"data": "CRITICAL" if n % 10 == 0 else "NORMAL"},
+                    "summary": {"data": "message {}".format(n)},
+                    "body": {"data": ""},
+                    "timestamp": {"data": n * 1000000},
+                }
+                for n in range(args.history)
+            ]]}, f)
+
+        state = DunstState(dbus=False)
+        history = NotificationHistory(state, dbus=False)
+        heard = []
+
+        async def settle():
+            while len(asyncio.all_tasks()) > 1:
+                await asyncio.sleep(0.01)
+
+        async def run():
+            state.subscribe(heard.append)
+            history.start()
+            await settle()
+            for _ in range(args.toggles):
+                state.toggle()
+                await settle()
+            # Another client flips dunst, then a query that finds no change.
+            await state.run("set-paused", "true" if not state.paused else "false")
+            await state.refresh()
+            await state.refresh()
+
+        asyncio.run(run())
+        with open(state_file + ".log") as f:
+            calls = [line.split()[0] for line in f]
+
+        # The monitor connection, on a session bus standing in for dbus_next's.
+        buses = []
+        monitor = NotificationHistory(state)
+        late = NotificationHistory(state)
+        sys.modules["dbus_next"] = types.SimpleNamespace(Message=types.SimpleNamespace)
+        sys.modules["dbus_next.aio"] = types.SimpleNamespace(MessageBus=lambda: MonitorBus(buses))
+
+        async def monitored():
+            monitor.start()
+            await settle()
+            for bus in buses:
+                bus.deliver("firefox", "download done", 2)
+            monitor.stop()
+            # A reload stops a history whose connection is still on its way.
+            late.start()
+            await asyncio.sleep(0)
+            late.stop()
+            await settle()
+
+        asyncio.run(monitored())
+        del sys.modules["dbus_next"], sys.modules["dbus_next.aio"]
+
+    expected = [n % 2 == 1 for n in range(args.toggles + 2)]
+    # The first query and the history dump, a toggle plus a query per
+    # toggle, then the outside set-paused and the two queries after it.
+    spawns = 2 + args.toggles * 2 + 3
+    critical, _ = history.page(limit=args.history, urgency="critical")
+    print("fake-dunstctl, {} toggles, {} history entries".format(args.toggles, args.history))
+    print("  listener calls  {:4d}  (flips {}, {})".format(
+        len(heard), len(expected), "ok" if heard == expected else "WRONG"))
+    print("  dunstctl runs   {:4d}  (expected {})".format(len(calls), spawns))
+    print("  history seeded  {:4d}  ({} critical)".format(len(history), len(critical)))
+    monitored = len(monitor) == args.history + 1 and monitor.page(limit=1)[0][0].urgency == "critical"
+    closed = [not bus.handlers and bus.closed for bus in buses]
+    print("  Notify monitored     {}".format(monitored))
+    print("  monitor buses closed {}/{} (expected 2)".format(sum(closed), len(closed)))
+    if heard != expected or len(calls) != spawns or len(history) != args.history:
+        sys.exit(1)
+    if not monitored or closed != [True, True]:
+        sys.exit(1)
+
+
+def write_sysfs(directory, **attributes):
+    os.makedirs(directory, exist_ok=True)
+    for name, value in attributes.items():
+        with open(os.path.join(directory, name), "w") as f:
+            f.write("{}\n".format(value))
+
+
+def uevent(action, devpath, **fields):
+    # A kernel uevent datagram as netlink delivers it.
+    fields = dict(ACTION=action, DEVPATH=devpath, **fields)
+    items = ["{}@{}".format(action, devpath)] + ["{}={}".format(k, v) for k, v in fields.items()]
+    return "\0".join(items).encode("utf-8") + b"\0"
+
+
+class SourceTextBox(Stub):
+    # widget.TextBox as the battery and volume widgets use it: configured
+    # without a bar, and every update recorded.
+
+    def __init__(self, text="", **config):
+        Stub.__init__(self, text, **config)
+        self.__dict__.setdefault("foreground", "ffffff")
+        self.layout = None
+        self.shown = []
+
+    def _configure(self, qtile, bar):
+        pass
+
+    def update(self, text):
+        self.shown.append(text)
+
+
+def cmd_battery(args):
+    # PowerSupply against a fake /sys/class/power_supply, with uevents
+    # written to a socket standing in for the netlink one. A plug burst has
+    # to come out as one read, steady readings have to back the polling off
+    # to max_interval, a low battery has to bring it back, and finalizing
+    # the last widget has to close the socket and stop the timer.
+    load_config(widgets={"TextBox": SourceTextBox})
+    from battery import BatteryStatus, PowerSupply
+
+    loop = VirtualLoop()
+    asyncio.set_event_loop(loop)
+    checks = []
+    with tempfile.TemporaryDirectory() as sysfs:
+        bat = os.path.join(sysfs, "BAT0")
+        write_sysfs(os.path.join(sysfs, "AC"), type="Mains", online=0)
+        write_sysfs(bat, type="Battery", status="Discharging",
+                    energy_now=30000000, energy_full=60000000, power_now=10000000)
+        supply = PowerSupply(sysfs=sysfs, min_interval=15, max_interval=300, uevents=False)
+        ours, kernel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        widget = BatteryStatus(source=supply)
+        seen = widget.shown
+
+        async def run():
+            widget._configure(None, None)
+            # What _listen() would have set up, on our end of the pair.
+            ours.setblocking(False)
+            supply._socket, supply._loop = ours, loop
+            loop.add_reader(ours.fileno(), supply._on_uevent)
+            checks.append(("first reading", seen[-1:] == ["V 50% 3:00 10.00 W"]))
+
+            # An hour of steady discharge: 15, 30, 60, 120, 240, then 300s.
+            polls = supply.polls
+            await loop.advance(loop.now + 3600)
+            backed_off = supply.polls - polls
+            checks.append(("steady hour polled {} times".format(backed_off),
+                           backed_off <= 15 and supply.interval == 300))
+
+            # Plugged in: the AC and the battery each send a few uevents.
+            write_sysfs(os.path.join(sysfs, "AC"), online=1)
+            write_sysfs(bat, status="Charging")
+            polls = supply.polls
+            for _ in range(3):
+                kernel.send(uevent("change", "/devices/AC", SUBSYSTEM="power_supply", POWER_SUPPLY_NAME="AC"))
+                kernel.send(uevent("change", "/devices/BAT0", SUBSYSTEM="power_supply", POWER_SUPPLY_NAME="BAT0"))
+            kernel.send(uevent("change", "/devices/card0", SUBSYSTEM="drm"))
+            for _ in range(10):
+                await asyncio.sleep(0)
+            checks.append(("plug burst read once", supply.polls - polls == 1))
+            checks.append(("charging shown", seen[-1].startswith("^ 50% 3:00")))
+            checks.append(("polling back at min_interval", supply.interval <= 30))
+
+            # Unplugged and nearly empty: polled every min_interval.
+            write_sysfs(os.path.join(sysfs, "AC"), online=0)
+            write_sysfs(bat, status="Discharging", energy_now=6000000)
+            supply.inject({"SUBSYSTEM": "power_supply"})
+            await loop.advance(loop.now + 600)
+            checks.append(("low battery polled every 15s", supply.interval == 15
+                           and widget.foreground == widget.low_foreground))
+
+            widget.finalize()
+            polls = supply.polls
+            await loop.advance(loop.now + 3600)
+            checks.append(("finalize closed the socket", supply._socket is None and ours.fileno() == -1))
+            checks.append(("finalize stopped polling", supply._handle is None and supply.polls == polls))
+
+        try:
+            loop.run_until_complete(run())
+        finally:
+            kernel.close()
+            loop.close()
+
+    print("PowerSupply on a fake sysfs, {} uevents".format(supply.events))
+    for name, ok in checks:
+        print("  {:<36} {}".format(name, ok))
+    if not all(ok for _, ok in checks):
+        sys.exit(1)
+
+
+class MockPulseServer:
+    # One PulseAudio server with one sink, behind the PulseAsync calls
+    # AudioControl makes. Every call takes ``latency`` seconds; changes,
+    # ours or another client's, are announced to every subscription.
+
+    def __init__(self, latency=0.004):
+        self.latency = latency
+        self.volume = 0.5
+        self.mute = False
+        self.clients = set()
+        self.connects = []
+        self.refuse = 0
+        self.calls = 0
+        self._subscriptions = []
+
+    def announce(self):
+        for queue in self._subscriptions:
+            queue.put_nowait("change")
+
+    def set_volume(self, volume):
+        # Another client (pavucontrol, a headset button).
+        self.volume = volume
+        self.announce()
+
+    def end_subscriptions(self):
+        for queue in self._subscriptions:
+            queue.put_nowait(None)
+
+    def module(self):
+        server = self
+
+        class PulseAsync:
+            def __init__(self, client_name, server=None):
+                self.connected = False
+
+            async def _call(self):
+                # The reply takes the latency; a change is made on arrival.
+                if not self.connected:
+                    raise ConnectionError("not connected")
+                server.calls += 1
+
+            async def connect(self):
+                server.connects.append(asyncio.get_event_loop().time())
+                await asyncio.sleep(server.latency)
+                if server.refuse:
+                    server.refuse -= 1
+                    raise ConnectionRefusedError("mock server refused")
+                self.connected = True
+                server.clients.add(self)
+
+            def disconnect(self):
+                self.connected = False
+                server.clients.discard(self)
+
+            async def server_info(self):
+                await self._call()
+                await asyncio.sleep(server.latency)
+                return types.SimpleNamespace(default_sink_name="mock")
+
+            async def get_sink_by_name(self, name):
+                await self._call()
+                sink = types.SimpleNamespace(
+                    volume=types.SimpleNamespace(value_flat=server.volume), mute=int(server.mute)
+                )
+                await asyncio.sleep(server.latency)
+                return sink
+
+            async def volume_set_all_chans(self, sink, volume):
+                await self._call()
+                server.volume = volume
+                server.announce()
+                await asyncio.sleep(server.latency)
+
+            async def mute(self, sink, mute):
+                await self._call()
+                server.mute = mute
+                server.announce()
+                await asyncio.sleep(server.latency)
+
+            async def subscribe_events(self, *masks):
+                queue = asyncio.Queue()
+                server._subscriptions.append(queue)
+                try:
+                    while self.connected:
+                        event = await queue.get()
+                        if event is None:
+                            return
+                        yield event
+                finally:
+                    server._subscriptions.remove(queue)
+
+        return types.SimpleNamespace(PulseAsync=PulseAsync)
+
+
+def cmd_audio(args):
+    # AudioControl and VolumeStatus against a mock pulse server. A held key
+    # has to apply far fewer changes than it requested, a change made
+    # elsewhere while ours is in flight has to reach the bar, a lost
+    # subscription has to come back with growing delays, and finalizing
+    # the last widget has to close the connection.
+    load_config(widgets={"TextBox": SourceTextBox})
+    # The refused connections below are logged as they would be in a session.
+    logging.getLogger("libqtile").setLevel(logging.CRITICAL)
+    utils = sys.modules["libqtile.utils"]
+    utils.create_task = lambda coro: asyncio.get_event_loop().create_task(coro)
+    server = MockPulseServer()
+    sys.modules["pulsectl_asyncio"] = server.module()
+    sys.modules.pop("audio", None)
+    from audio import AudioControl, VolumeStatus
+
+    control = AudioControl()
+    control.echo_window = 0.05
+    control.reconnect_min, control.reconnect_max = 0.02, 0.08
+    widget = VolumeStatus(control=control)
+    checks = []
+
+    async def until(condition, timeout=2.0):
+        deadline = asyncio.get_event_loop().time() + timeout
+        while not condition() and asyncio.get_event_loop().time() < deadline:
+            await asyncio.sleep(0.002)
+        return condition()
+
+    async def run():
+        widget._configure(None, None)
+        checks.append(("connected, 50% shown", await until(lambda: widget.shown[-1:] == ["50%"])))
+
+        # A key held for half a second at 40 repeats a second.
+        for _ in range(20):
+            control.change(0.01)
+            await asyncio.sleep(0.025)
+        await until(lambda: not control._busy)
+        checks.append(("held key: {} of {} applied".format(control.applied, control.requested),
+                       control.applied < control.requested and server.volume == 0.7))
+
+        # pavucontrol moves the volume while our change is in flight.
+        control.change(-0.1)
+        await asyncio.sleep(0)
+        server.set_volume(0.33)
+        await until(lambda: widget.shown[-1] == "33%")
+        checks.append(("change elsewhere mid-flight shown", widget.shown[-1] == "33%"))
+
+        # Two changes elsewhere during one slow sync: both read, by one more sync.
+        server.latency = 0.03
+        syncs = control.syncs
+        server.set_volume(0.4)
+        await asyncio.sleep(0.01)
+        server.set_volume(0.45)
+        server.set_volume(0.46)
+        await until(lambda: widget.shown[-1] == "46%")
+        server.latency = 0.004
+        checks.append(("events during a sync read once more", widget.shown[-1] == "46%"
+                       and control.syncs - syncs == 2))
+
+        # The server drops the subscription and refuses twice.
+        server.refuse = 2
+        connects = len(server.connects)
+        server.end_subscriptions()
+        await until(lambda: len(server.connects) == connects + 3 and server.clients)
+        waits = [b - a for a, b in zip(server.connects[connects:], server.connects[connects + 1:])]
+        checks.append(("reconnected after 2 refusals", len(server.clients) == 1))
+        checks.append(("backoff grew", len(waits) == 2 and waits[1] > waits[0]))
+        server.set_volume(0.6)
+        checks.append(("changes after reconnect shown", await until(lambda: widget.shown[-1] == "60%")))
+
+        widget.finalize()
+        await asyncio.sleep(0.05)
+        checks.append(("finalize closed the connection", not server.clients and control._watcher is None))
+        checks.append(("no tasks left", len(asyncio.all_tasks()) == 1))
+
+    asyncio.run(run())
+    print("AudioControl on a mock pulse server, {} server calls".format(server.calls))
+    for name, ok in checks:
+        print("  {:<40} {}".format(name, ok))
+    if not all(ok for _, ok in checks):
+        sys.exit(1)
+
+
+def cmd_backlight(args):
+    # Backlight against a fake /sys/class/backlight, in virtual time. A
+    # held key has to be one ramp with a handful of writes ending on the
+    # right value, levels have to clamp, a change made by another tool
+    # has to be picked up, and a device that disappears mid-ramp must not
+    # leave the keys dead.
+    load_config()
+    logging.getLogger("libqtile").setLevel(logging.ERROR)
+    qtile = types.SimpleNamespace(spawned=[])
+    qtile.cmd_spawn = qtile.spawned.append
+    sys.modules["libqtile"].qtile = qtile
+    from backlight import Backlight
+
+    loop = VirtualLoop()
+    asyncio.set_event_loop(loop)
+    checks = []
+
+    def brightness(device):
+        with open(os.path.join(device, "brightness")) as f:
+            return int(f.read())
+
+    with tempfile.TemporaryDirectory() as sysfs:
+        device = os.path.join(sysfs, "intel_backlight")
+        write_sysfs(device, max_brightness=1000, brightness=500)
+        light = Backlight(sysfs=sysfs)
+        levels = []
+
+        async def wait(seconds):
+            # change() starts a ramp with call_soon, which is no timer.
+            await asyncio.sleep(0)
+            await loop.advance(loop.now + seconds)
+
+        async def run():
+            light.subscribe(levels.append)
+            checks.append(("level read", levels == [0.5]))
+
+            # Held at 30 repeats a second for half a second.
+            for _ in range(15):
+                light.change(0.02)
+                await wait(1 / 30)
+            await wait(1)
+            checks.append(("held key: {} writes for 15 presses".format(light.writes),
+                           brightness(device) == 800 and light.writes < 15 * light.ramp_frames))
+            checks.append(("listeners end on the level", levels[-1] == 0.8))
+
+            light.change(0.5)
+            await wait(1)
+            light.change(-0.1)
+            await wait(1)
+            checks.append(("clamped to max_brightness", brightness(device) == 900))
+
+            # brightnessctl, or the firmware, moves it meanwhile.
+            write_sysfs(device, brightness=200)
+            light.change(0.1)
+            await wait(1)
+            checks.append(("outside change picked up", brightness(device) == 300))
+
+            # The panel goes away (a dock, a GPU switch) mid-ramp and comes back.
+            light.change(0.3)
+            await wait(light.frame)
+            shutil.rmtree(device)
+            await wait(1)
+            checks.append(("ramp dropped with the device", light._handle is None and light.target is None))
+            write_sysfs(device, max_brightness=1000, brightness=400)
+            light.change(0.1)
+            await wait(1)
+            checks.append(("keys work once it is back", brightness(device) == 500))
+            checks.append(("never fell back to brightnessctl", not qtile.spawned))
+
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+    print("Backlight on a fake sysfs, {} writes".format(light.writes))
+    for name, ok in checks:
+        print("  {:<36} {}".format(name, ok))
+    if not all(ok for _, ok in checks):
+        sys.exit(1)
+
+
+def cmd_hooks(args):
+    # New windows arrive while every swallow lookup takes up to --slow
+    # seconds; the client_new hook itself must still return within budget.
+    load_config()
+    utils = sys.modules["libqtile.utils"]
+    utils.create_task = lambda coro: asyncio.get_event_loop().create_task(coro)
+    sys.modules.pop("pipeline", None)
+    from pipeline import HookPipeline
+
+    pipeline = HookPipeline(workers=4)
+    rng = random.Random(0)
+    committed = []
+    hook_times = []
+
+    def slow_proc_walk(wid):
+        time.sleep(rng.uniform(args.slow / 4, args.slow))
+        return wid
+
+    def client_new(wid):
+        start = time.perf_counter()
+        pipeline.submit("swallow", slow_proc_walk, wid, commit=committed.append)
+        pipeline.submit("route", None, commit=lambda _result: committed.append(-wid - 1))
+        hook_times.append(time.perf_counter() - start)
+
+    async def run():
+        for wid in range(args.windows):
+            client_new(wid)
+            await asyncio.sleep(0.01)
+        while pipeline.pending:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    pipeline.shutdown()
+
+    # A read that hangs past the timeout and one raising something that
+    # isn't an Exception: the stages submitted after them still commit.
+    faulty = HookPipeline(workers=2, timeout=args.slow)
+    survivors = []
+
+    class Abort(BaseException):
+        pass
+
+    def abort():
+        raise Abort()
+
+    async def faults():
+        # One stage, so the commits after the faults wait for them.
+        faulty.submit("swallow", time.sleep, args.slow * 4, commit=survivors.append)
+        faulty.submit("swallow", abort, commit=survivors.append)
+        for n in range(3):
+            faulty.submit("swallow", None, commit=lambda _result, n=n: survivors.append(n))
+        while faulty.pending:
+            await asyncio.sleep(0.01)
+
+    logging.getLogger("libqtile").disabled = True
+    asyncio.run(asyncio.wait_for(faults(), args.slow * 3))
+    logging.getLogger("libqtile").disabled = False
+    faulty.shutdown()
+
+    swallowed = [n for n in committed if n >= 0]
+    routed = [-n - 1 for n in committed if n < 0]
+    in_order = swallowed == routed == list(range(args.windows))
+    # route has no read: it only waits for the loop, never for swallow.
+    route_lag = pipeline.report()["route"]["lag"]["p50_ms"]
+    worst = max(hook_times)
+    print("{} windows, swallow reads sleeping up to {}s".format(args.windows, args.slow))
+    print("  slowest client_new hook  {:8.3f} ms  (budget {:.0f} ms, {})".format(
+        worst * 1000, args.budget * 1000, "ok" if worst <= args.budget else "OVER"))
+    print("  commits in submit order  {}  (per stage)".format(in_order))
+    print("  route lag p50            {:8.2f} ms  ({})".format(
+        route_lag, "ok" if route_lag <= args.budget * 1000 else "held back by swallow"))
+    print("  commits past faults      {}".format(survivors == [0, 1, 2]))
+    for name, kinds in pipeline.report().items():
+        for kind, stats in kinds.items():
+            print("  {:<8} {:<7} p50 {:8.2f} ms  p99 {:8.2f} ms".format(
+                name, kind, stats["p50_ms"], stats["p99_ms"]))
+    if worst > args.budget or not in_order or route_lag > args.budget * 1000 or survivors != [0, 1, 2]:
+        sys.exit(1)
+
+
+class SoakWindow:
+    def __init__(self, wid):
+        self.wid = wid
+        self.minimized = False
+        # Stands in for the client's own state (geometry, hints, icons...).
+        self.state = bytearray(2048)
+
+
+def cmd_swallow(args):
+    # Open terminals with chains of swallowing children and close them in
+    # random order (parents often first), checking after every close that
+    # exactly the windows with a live swallower are minimized. Half the
+    # warm-up chains are closed by a reloaded swallow module's registry, as
+    # after a config reload, which keeps qtile's windows.
+    load_config()
+    sys.modules.pop("swallow", None)
+    import swallow
+
+    registry = swallow.SwallowRegistry()
+    rng = random.Random(0)
+    live = {}
+    closed = []
+    wids = iter(range(1, 1 << 30))
+    errors = 0
+
+    def check():
+        nonlocal errors
+        for window in live.values():
+            if window.minimized != bool(registry.swallowers(window)):
+                errors += 1
+
+    def cycle(reload):
+        nonlocal registry
+        chain = [SoakWindow(next(wids))]
+        for _ in range(rng.randint(1, 4)):
+            chain.append(SoakWindow(next(wids)))
+            registry.swallow(chain[-1], chain[-2])
+        live.update((w.wid, w) for w in chain)
+        check()
+        if reload:
+            importlib.reload(swallow)
+            registry = swallow.swallow_registry
+        rng.shuffle(chain)
+        for window in chain:
+            del live[window.wid]
+            registry.release(window)
+            check()
+        if len(closed) < 200:
+            closed.extend(weakref.ref(w) for w in chain)
+
+    for n in range(50):
+        cycle(n % 2)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    opened = 0
+    while opened < args.windows:
+        cycle(False)
+        opened = next(wids)
+    gc.collect()
+    growth = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    leaked = sum(ref() is not None for ref in closed)
+
+    print("{} windows opened and closed in swallow chains".format(opened))
+    print("  closed still alive    {}".format(leaked))
+    print("  wrong minimized state {}".format(errors))
+    print("  memory growth         {} bytes (limit {})".format(growth, args.max_growth))
+    if errors or leaked or growth > args.max_growth:
+        sys.exit(1)
+
+
+class ProcTree:
+    # A fake /proc holding just the stat files PpidCache reads.
+
+    def __init__(self, root):
+        self.root = root
+        self.clock = 0
+
+    def spawn(self, pid, ppid, comm="proc"):
+        # starttime goes up with every spawn, as it would in clock ticks.
+        self.clock += 1
+        os.makedirs(os.path.join(self.root, str(pid)), exist_ok=True)
+        fields = ["S", str(ppid)] + ["0"] * 17 + [str(self.clock), "0", "0"]
+        with open(os.path.join(self.root, str(pid), "stat"), "w") as f:
+            f.write("{} ({}) {}\n".format(pid, comm, " ".join(fields)))
+        return pid
+
+    def exit(self, pid):
+        os.remove(os.path.join(self.root, str(pid), "stat"))
+
+
+class PidWindow:
+    def __init__(self, wid, pid):
+        self.wid = wid
+        self.pid = pid
+        self.window = self
+
+    def get_net_wm_pid(self):
+        return self.pid
+
+
+def cmd_ancestry(args):
+    # Swallow lookups against a synthetic process tree: terminals (one of
+    # them single-instance, owning several windows) with shells, and
+    # programs started from those shells, directly or through `sh -c`.
+    # Stock rebuilds the pid -> window map from every window and reads
+    # /proc once per ancestor; the index and PpidCache don't, and only read
+    # the stat of processes they have not seen. Then pids wrap around and a
+    # shell's pid is reused under another terminal, which has to be seen.
+    load_config()
+    sys.modules.pop("swallow", None)
+    from swallow import PpidCache, SwallowIndex
+
+    print("{} swallow lookups per window count".format(args.lookups))
+    print("  {:>7}  {:>21}  {:>21}  {:>17}  {:>5}  {}".format(
+        "windows", "stock p50/p99 us", "index p50/p99 us", "reads stock/index", "wrong", "reuse seen"))
+    failed = False
+    for count in args.windows:
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as proc:
+            tree = ProcTree(proc)
+            pids = iter(range(100, 1 << 22))
+            wids = iter(range(0x400001, 1 << 30))
+            for pid, ppid in ((1, 0), (2, 1), (3, 2)):
+                tree.spawn(pid, ppid)
+            windows = {}
+            shells = {}
+
+            def window(pid):
+                w = PidWindow(next(wids), pid)
+                windows[w.wid] = w
+                return w
+
+            kitty = tree.spawn(next(pids), 3, "kitty")
+            for _ in range(4):
+                shells[tree.spawn(next(pids), kitty, "fish")] = window(kitty)
+            while len(windows) < count:
+                pid = tree.spawn(next(pids), 3, rng.choice(["alacritty", "firefox", "code"]))
+                terminal = window(pid)
+                if rng.random() < 0.5:
+                    shells[tree.spawn(next(pids), pid, "fish")] = terminal
+
+            index = SwallowIndex(ppid=PpidCache(proc=proc))
+            for w in windows.values():
+                index.add(w)
+            stock_reads = PpidCache(proc=proc)
+
+            def stock_parent(pid):
+                cpids = {w.window.get_net_wm_pid(): w for w in windows.values()}
+                ppid = stock_reads._read(pid)[0]
+                for _ in range(5):
+                    if not ppid:
+                        return None
+                    if ppid in cpids:
+                        return cpids[ppid]
+                    ppid = stock_reads._read(ppid)[0]
+                return None
+
+            times = {"stock": [], "index": []}
+            wrong = 0
+            shell_pids = sorted(shells)
+            for _ in range(args.lookups):
+                shell = rng.choice(shell_pids)
+                parent = shell
+                if rng.random() < 0.3:
+                    parent = tree.spawn(next(pids), shell, "sh")
+                child = tree.spawn(next(pids), parent, "mpv")
+                for kind, lookup in (("stock", stock_parent), ("index", index.find_parent)):
+                    start = time.perf_counter()
+                    found = lookup(child)
+                    times[kind].append(time.perf_counter() - start)
+                    # Any window of the terminal's process will do.
+                    wrong += getattr(found, "pid", None) != shells[shell].pid
+                tree.exit(child)
+                if parent != shell:
+                    tree.exit(parent)
+            reads = (stock_reads.reads / args.lookups, index.ppid.reads / args.lookups)
+
+            # The shell of one terminal exits. Allocation wraps around
+            # pid_max and hands its pid to the shell of another terminal,
+            # then the next free pids to what runs in it.
+            reused, old_terminal = shell_pids[0], shells[shell_pids[0]]
+            new_terminal = next(w for w in windows.values() if w.pid != old_terminal.pid)
+            index.find_parent(tree.spawn(next(pids), reused, "mpv"))
+            tree.exit(reused)
+            wrapped = (pid for pid in range(reused, 1 << 22) if not os.path.exists(os.path.join(proc, str(pid), "stat")))
+            tree.spawn(next(wrapped), new_terminal.pid, "fish")
+            found = index.find_parent(tree.spawn(next(wrapped), reused, "mpv"))
+            reuse_ok = getattr(found, "pid", None) == new_terminal.pid
+
+        for ts in times.values():
+            ts.sort()
+        print("  {:>7}  {:>9.1f} / {:>9.1f}  {:>9.1f} / {:>9.1f}  {:>7.2f} / {:>7.2f}  {:>5}  {}".format(
+            len(windows),
+            *(t[i] * 1e6 for t in times.values() for i in (len(t) // 2, int(len(t) * 0.99))),
+            *reads, wrong, "yes" if reuse_ok else "NO"))
+        failed |= bool(wrong) or not reuse_ok or reads[1] >= reads[0]
+    if failed:
+        sys.exit(1)
+
+
+# Modules whose key bindings write outside the replay (theme files, config
+# reloads, profiles, traces); their lazy.function keys are not replayed.
+REPLAY_SKIPS = ("livereload", "loopwatch", "profiling", "sessiontrace", "theme")
+
+
+class ReplayBar:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def draw(self):
+        self.stats["bar draws"] += 1
+
+
+class ReplayScreen:
+    def __init__(self, qtile, index, width=2560, height=1440):
+        self.qtile = qtile
+        self.index = index
+        self.x, self.y, self.width, self.height = 0, 0, width, height
+        self.group = None
+        self.top = ReplayBar(qtile.stats)
+
+
+class ReplayGroup:
+    # Group as the hooks and lazy commands see it. A plain grid stands in
+    # for the layout; what is counted is how often the config makes qtile
+    # relayout and redraw.
+
+    def __init__(self, qtile, name, layouts=("columns",)):
+        self.qtile = qtile
+        self.name = name
+        self.layouts = list(layouts)
+        self.layout = self.layouts[0]
+        self.windows = []
+        self.current_window = None
+        self.screen = None
+
+    def layout_all(self, warp=False, focus=True):
+        if self.screen is None:
+            return
+        self.qtile.stats["relayouts"] += 1
+        tiled = [w for w in self.windows if not w.minimized]
+        for index, window in enumerate(tiled):
+            width = self.screen.width // len(tiled)
+            window.place(index * width, 56, width - 4, self.screen.height - 60, 2, None)
+        self.screen.top.draw()
+
+    def add(self, window, focus=True):
+        window.group = self
+        self.windows.append(window)
+        if focus:
+            self.focus(window)
+        else:
+            self.layout_all()
+
+    def remove(self, window):
+        self.windows.remove(window)
+        window.group = None
+        if self.current_window is window:
+            self.current_window = None
+            self.focus(self.windows[-1] if self.windows else None)
+        else:
+            self.layout_all()
+
+    def focus(self, window, warp=True, force=False):
+        if window is self.current_window and not force:
+            return
+        self.current_window = window
+        if window is not None:
+            self.qtile.fire("client_focus", window)
+        self.qtile.fire("focus_change")
+        self.layout_all()
+
+    def next_window(self):
+        if self.windows:
+            index = self.windows.index(self.current_window) if self.current_window in self.windows else -1
+            self.focus(self.windows[(index + 1) % len(self.windows)])
+
+    def next_layout(self):
+        self.layout = self.layouts[(self.layouts.index(self.layout) + 1) % len(self.layouts)]
+        self.qtile.fire("layout_change", self.layout, self)
+        self.layout_all()
+
+    def cmd_toscreen(self, screen=None, toggle=False):
+        screen = self.qtile.current_screen
+        if screen.group is self:
+            return
+        if screen.group is not None:
+            screen.group.screen = None
+        screen.group, self.screen = self, screen
+        self.qtile.fire("setgroup")
+        self.layout_all()
+
+
+class ReplayWindow:
+    def __init__(self, qtile, wid, wm_class, name, pid):
+        self.qtile = qtile
+        self.wid = wid
+        self.name = name
+        self.window = self
+        self.group = None
+        self.floating = False
+        self.borderwidth = 2
+        self.x = self.y = self.width = self.height = 0
+        self._wm_class = wm_class
+        self._pid = pid
+        self._minimized = False
+
+    def get_wm_class(self):
+        return self._wm_class
+
+    def get_wm_type(self):
+        return "normal"
+
+    def get_net_wm_pid(self):
+        return self._pid
+
+    @property
+    def minimized(self):
+        return self._minimized
+
+    @minimized.setter
+    def minimized(self, value):
+        self._minimized = value
+        if self.group is not None:
+            self.group.layout_all()
+
+    def place(self, x, y, width, height, borderwidth, bordercolor, **kwargs):
+        self.x, self.y, self.width, self.height = x, y, width, height
+
+    def togroup(self, name, switch_group=False):
+        group = self.qtile.groups_map[name]
+        if group is self.group:
+            return
+        if self.group is not None:
+            self.group.remove(self)
+        group.add(self, focus=group.screen is not None)
+
+    def kill(self):
+        # The trace's unmap event does the rest.
+        pass
+
+
+class ReplayClock(Stub):
+    # widget.Clock for ScheduledClock: poll() formats the replay's clock
+    # and every update() is a counted draw.
+
+    clock = time
+
+    def __init__(self, **config):
+        Stub.__init__(self, **config)
+        self.draws = 0
+
+    def poll(self):
+        return self.clock.strftime(self.format, self.clock.localtime(self.clock.time()))
+
+    def update(self, text):
+        self.draws += 1
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    # Loop time only moves when advance() is told to, jumping from timer
+    # to timer, so timeouts see the trace's own timing at no wall-clock
+    # cost. Work handed to threads (pipeline reads) still runs for real.
+
+    def __init__(self):
+        asyncio.SelectorEventLoop.__init__(self)
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    async def advance(self, until):
+        while self._scheduled and self._scheduled[0].when() <= until:
+            self.now = max(self.now, self._scheduled[0].when())
+            # One pass to run the timer, one for what it scheduled at once.
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+        self.now = max(self.now, until)
+
+
+def virtual_time(loop, epoch):
+    # The time module as windowname and scheduler see it during a replay.
+    clock = types.ModuleType("time")
+    clock.__dict__.update(time.__dict__)
+    clock.monotonic = lambda: loop.now
+    clock.time = lambda: epoch + loop.now
+    return clock
+
+
+class TracePpid(dict):
+    # pid -> ppid from the ancestry recorded with each map event, standing
+    # in for swallow.PpidCache's /proc reads.
+
+    def __call__(self, pid, depth):
+        chain = []
+        pid = self.get(pid, 0)
+        while pid and len(chain) < depth:
+            chain.append(pid)
+            pid = self.get(pid, 0)
+        return chain
+
+
+class ReplayQtile:
+    # The parts of qtile that config.py's hooks, lazy.function callables and
+    # singletons touch, driving the config's own hook subscriptions.
+
+    def __init__(self):
+        self.stats = {name: 0 for name in ("relayouts", "bar draws", "spawns", "ignored commands")}
+        self.hooks = {}
+        self.windows_map = {}
+        self.groups = []
+        self.groups_map = {}
+        self.screens = [ReplayScreen(self, 0)]
+        self.current_screen = self.screens[0]
+        self.pointer = (0, 0)
+        self.core = types.SimpleNamespace(
+            get_screen_info=lambda: [(s.x, s.y, s.width, s.height) for s in self.screens],
+            get_mouse_position=lambda: self.pointer,
+            flush=lambda: None,
+        )
+        self._pids = iter(range(1 << 22, 1 << 30))
+
+    def setup(self, namespace, hooks):
+        self.hooks = hooks
+        for group in namespace["groups"]:
+            name = group.args[0]
+            self.groups.append(ReplayGroup(self, name, (group.kwargs.get("layout", "columns"), "spiral")))
+            self.groups_map[name] = self.groups[-1]
+        self.groups[1].cmd_toscreen()
+
+    @property
+    def current_group(self):
+        return self.current_screen.group
+
+    @property
+    def current_window(self):
+        return self.current_group.current_window
+
+    def fire(self, name, *args):
+        for func in self.hooks.get(name, ()):
+            func(*args)
+
+    def call_later(self, delay, func, *args):
+        return asyncio.get_event_loop().call_later(delay, func, *args)
+
+    def call_soon(self, func, *args):
+        # Only asked for at config load (the wallpaper), which isn't replayed.
+        self.stats["ignored commands"] += 1
+
+    def cmd_spawn(self, cmd, shell=False):
+        self.stats["spawns"] += 1
+        return next(self._pids)
+
+    def focus_screen(self, index, warp=True):
+        self.current_screen = self.screens[index]
+
+    def reload_config(self):
+        self.stats["ignored commands"] += 1
+
+    def run(self, call):
+        # One lazy command from a Key, the way qtile would dispatch it.
+        path, args = call.path, call.args
+        group, window = self.current_group, self.current_window
+        if path == ("function",):
+            if args[0].__module__ in REPLAY_SKIPS:
+                self.stats["ignored commands"] += 1
+            else:
+                args[0](self, *args[1:], **call.kwargs)
+        elif path == ("spawn",):
+            self.cmd_spawn(*args)
+        elif path[0] == "layout":
+            group.layout_all()
+        elif path == ("next_layout",):
+            group.next_layout()
+        elif path == ("group", "next_window"):
+            group.next_window()
+        elif path[0] == "group" and path[-1] == "toscreen":
+            self.groups_map[ast.literal_eval(path[1][1:-1])].cmd_toscreen(**call.kwargs)
+        elif path == ("window", "togroup") and window is not None:
+            window.togroup(*args)
+        elif path == ("window", "kill") and window is not None:
+            window.kill()
+        else:
+            self.stats["ignored commands"] += 1
+
+    # Trace events
+
+    def map(self, wid, wm_class, title, pid, ancestors):
+        window = ReplayWindow(self, wid, wm_class, title, pid)
+        self.fire("client_new", window)
+        self.windows_map[wid] = window
+        if window.group is None:
+            self.current_group.add(window)
+        self.fire("client_managed", window)
+
+    def unmap(self, wid):
+        window = self.windows_map.get(wid)
+        if window is None:
+            return
+        self.fire("client_killed", window)
+        if window.group is not None:
+            window.group.remove(window)
+        del self.windows_map[wid]
+
+    def key(self, name):
+        for call in self.keys.get(name, ()):
+            self.run(call)
+
+    def group(self, name):
+        self.groups_map[name].cmd_toscreen(toggle=False)
+
+    def enter(self, wid):
+        window = self.windows_map.get(wid)
+        if window is None or window.group is None or window.group.screen is None:
+            return
+        self.pointer = (window.x + window.width // 2, window.y + window.height // 2)
+        self.fire("client_mouse_enter", window)
+
+    def title(self, wid, name):
+        window = self.windows_map.get(wid)
+        if window is None:
+            return
+        window.name = name
+        self.fire("client_name_updated", window)
+
+
+def synthetic_session(rng, events, keys, groups):
+    # A recorded trace's shape: terminals with programs started from them
+    # (swallowed), a browser and an editor, keyboard-driven focus and
+    # layout changes, pointer enters and group switches.
+    apps = [
+        (["kitty", "kitty"], "fish"),
+        (["Navigator", "firefox"], "Mozilla Firefox"),
+        (["code", "Code"], "config.py - Visual Studio Code"),
+        (["thunar", "Thunar"], "~ - Thunar"),
+    ]
+    children = [(["mpv", "mpv"], "video.mkv - mpv"), (["org.pwmt.zathura", "Zathura"], "paper.pdf")]
+    titles = retitles(rng)
+    live, terminals = [], []
+    wids = iter(range(0x400001, 1 << 30))
+    pids = iter(range(2000, 1 << 22))
+    t = 0
+    trace = []
+    while len(trace) < events:
+        t += round(rng.expovariate(1 / 300))
+        roll = rng.random()
+        if roll < 0.12 or not live:
+            wid, pid = next(wids), next(pids)
+            if terminals and rng.random() < 0.4:
+                terminal_pid = rng.choice(terminals)
+                wm_class, title = rng.choice(children)
+                ancestors = [next(pids), terminal_pid, 1]
+            else:
+                wm_class, title = rng.choice(apps)
+                ancestors = [1]
+                if wm_class[0] == "kitty":
+                    terminals.append(pid)
+            live.append((wid, pid))
+            trace.append([t, "map", wid, wm_class, title, pid, ancestors])
+        elif roll < 0.22 and len(live) > 2:
+            wid, pid = live.pop(rng.randrange(len(live)))
+            if pid in terminals:
+                terminals.remove(pid)
+            trace.append([t, "unmap", wid])
+        elif roll < 0.55:
+            trace.append([t, "enter", rng.choice(live)[0]])
+        elif roll < 0.62:
+            trace.append([t, "group", rng.choice(groups)])
+        elif roll < 0.72:
+            # A build in a terminal retitles it in bursts.
+            wid = rng.choice(live)[0]
+            for _ in range(rng.randint(1, 12)):
+                trace.append([t, "title", wid, next(titles)])
+                t += rng.randint(5, 60)
+        else:
+            trace.append([t, "key", rng.choice(keys)])
+    return trace
+
+
+def cmd_replay(args):
+    # Every event goes through config.py's own hooks and key bindings on a
+    # headless qtile; an event's latency runs until its hook pipeline
+    # stages (swallow's ancestry lookup, trace writes) have committed.
+    #
+    # By default the loop runs on the trace's clock: it jumps straight to
+    # each event's timestamp, firing whatever timers fall due on the way
+    # (FocusIntent's dwell, the title debounce, scheduler ticks), so the
+    # deferred work lands where it would have. --speed X instead replays
+    # in real time, X times faster.
+    #
+    # Layouts are a plain grid and the bar is not rendered: relayouts and
+    # widget draws are counted, not timed, apart from the top bar's
+    # StableWindowName and ScheduledClocks, which run for real.
+    qtile = ReplayQtile()
+    namespace, hooks, _ = load_config(qtile, {"WindowName": TitleTextBox, "Clock": ReplayClock})
+    key_name = sys.modules["sessiontrace"].key_name
+    qtile.keys = {key_name(key.args[0], key.args[1]): key.args[2:] for key in namespace["keys"]}
+    qtile.setup(namespace, hooks)
+
+    if args.trace:
+        with open(args.trace) as f:
+            trace = [json.loads(line) for line in f if line.strip()]
+        source = args.trace
+    else:
+        groups = [group.name for group in qtile.groups[1:]]
+        trace = synthetic_session(random.Random(0), args.events, sorted(qtile.keys), groups)
+        source = "synthetic session"
+
+    # Swallowing sees the recorded process tree, not this machine's.
+    ppid = TracePpid()
+    for event in trace:
+        if event[1] == "map":
+            chain = [event[5], *event[6]]
+            ppid.update(zip(chain, chain[1:]))
+    namespace["swallow_index"].ppid = ppid
+    pipeline = sys.modules["pipeline"]
+    pipeline.create_task = lambda coro: asyncio.get_event_loop().create_task(coro)
+
+    loop = VirtualLoop() if not args.speed else asyncio.new_event_loop()
+    if not args.speed:
+        clock = virtual_time(loop, time.time())
+        ReplayClock.clock = clock
+        for module in ("windowname", "scheduler"):
+            sys.modules[module].time = clock
+
+    latency = {}
+
+    def timed(kind, func):
+        def wrapper(*a):
+            start = time.perf_counter()
+            func(*a)
+            latency.setdefault(kind, []).append(time.perf_counter() - start)
+
+        return wrapper
+
+    # The deferred work, timed when its timer fires.
+    intent = namespace["focus_intent"]
+    intent.focus = timed("focus commit", intent.focus)
+    scheduler = sys.modules["scheduler"].scheduler
+    scheduler._fire = timed("clock tick", scheduler._fire)
+
+    # The top bar as qtile would place it on the first screen.
+    screen = namespace["screens"][0]
+    widgets = (getattr(screen, "top", None) or screen.kwargs["top"]).factory()
+    names = [w for w in widgets if isinstance(w, sys.modules["windowname"].StableWindowName)]
+    clocks = [w for w in widgets if isinstance(w, sys.modules["scheduler"].ScheduledClock)]
+    for name in names:
+        name._flush = timed("title draw", name._flush)
+
+        # WindowName's own hooks, which the stand-in doesn't subscribe.
+        def show(*_args, name=name):
+            window = qtile.current_window
+            name.update(window.name if window is not None else name.empty_group_string)
+
+        for hook_name in ("focus_change", "client_name_updated", "setgroup"):
+            hooks.setdefault(hook_name, []).append(show)
+
+    async def replay():
+        for widget in clocks:
+            widget.timer_setup()
+        busy = 0.0
+        previous = origin = trace[0][0] if trace else 0
+        for event in trace:
+            if args.speed:
+                await asyncio.sleep((event[0] - previous) / 1000 / args.speed)
+            else:
+                await loop.advance((event[0] - origin) / 1000)
+            previous = event[0]
+            start = time.perf_counter()
+            getattr(qtile, event[1])(*event[2:])
+            while pipeline.hook_pipeline.pending:
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - start
+            busy += elapsed
+            latency.setdefault(event[1], []).append(elapsed)
+            await asyncio.sleep(0)
+        # Let the last pointer rest and title change commit.
+        settle = max([intent.dwell] + [name.latency for name in names]) * 2
+        if args.speed:
+            await asyncio.sleep(settle)
+        else:
+            await loop.advance(loop.now + settle)
+        for widget in clocks:
+            widget.finalize()
+        return busy
+
+    with tempfile.TemporaryDirectory() as sysfs:
+        # Brightness keys ramp a fake backlight instead of the real one.
+        os.makedirs(os.path.join(sysfs, "replay"))
+        for name, value in (("max_brightness", 1000), ("brightness", 500)):
+            with open(os.path.join(sysfs, "replay", name), "w") as f:
+                f.write(str(value))
+        backlight = sys.modules["backlight"].backlight
+        backlight.sysfs, backlight.device = sysfs, None
+        asyncio.set_event_loop(loop)
+        try:
+            busy = loop.run_until_complete(replay())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+    pipeline.hook_pipeline.shutdown()
+
+    table = {}
+    for kind, times in latency.items():
+        times.sort()
+        table[kind] = {
+            "count": len(times),
+            "p50_ms": times[len(times) // 2] * 1000,
+            "p99_ms": times[min(int(len(times) * 0.99), len(times) - 1)] * 1000,
+        }
+    counts = dict(qtile.stats, swallowed=sum(w.minimized for w in qtile.windows_map.values()))
+    counts.update({
+        "title draws": sum(name.draws for name in names),
+        "title relayouts": sum(name.relayouts for name in names),
+        "clock draws": sum(widget.draws for widget in clocks),
+        "scheduler wakeups": scheduler.wakeups,
+    })
+    result = {
+        "source": source,
+        "events": len(trace),
+        "clock": "real x{}".format(args.speed) if args.speed else "virtual",
+        "trace_s": (trace[-1][0] - trace[0][0]) / 1000 if trace else 0.0,
+        "events_per_s": len(trace) / busy if busy else 0.0,
+        "latency": table,
+        "counts": counts,
+        "focus": intent.report(),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print("{} events from {} ({:.0f}s on the {} clock), {:.0f} events/s".format(
+        len(trace), source, result["trace_s"], result["clock"], result["events_per_s"]))
+    for kind, stats in table.items():
+        print("  {:<13} {:6d}  p50 {:8.3f} ms  p99 {:8.3f} ms".format(
+            kind, stats["count"], stats["p50_ms"], stats["p99_ms"]))
+    print("  {}".format(", ".join("{} {}".format(k, v) for k, v in counts.items())))
+    print("  focus intent {}".format(result["focus"]))
+    print("  (grid stand-in layout; bar draws counted, not rendered)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    startup = sub.add_parser("startup", help="time config load per section")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--outputs", type=int, default=0)
+    startup.add_argument("--reload", action="store_true", help="time a reload instead of a cold load")
+    startup.add_argument("--json", action="store_true")
+    startup.set_defaults(func=cmd_startup)
+
+    titles = sub.add_parser("titles", help="retitle StableWindowName at a high rate")
+    titles.add_argument("--rate", type=float, default=500)
+    titles.add_argument("--seconds", type=float, default=2)
+    titles.add_argument("--latency", type=float, default=0.1)
+    titles.add_argument("--json", action="store_true")
+    titles.set_defaults(func=cmd_titles)
+
+    textcache = sub.add_parser("textcache", help="per-frame text cost with and without the cache")
+    textcache.add_argument("--frames", type=int, default=2000)
+    textcache.set_defaults(func=cmd_textcache)
+
+    wallpaper = sub.add_parser("wallpaper", help="wallpaper paints across reloads and hotplug")
+    wallpaper.set_defaults(func=cmd_wallpaper)
+
+    ticks = sub.add_parser("ticks", help="count scheduler wakeups for the bar clocks")
+    ticks.add_argument("--hours", type=int, default=6)
+    ticks.add_argument("--screens", type=int, default=2)
+    ticks.set_defaults(func=cmd_ticks)
+
+    segments = sub.add_parser("segments", help="top bar frame cost with cap glyphs and grouped decorations")
+    segments.add_argument("--frames", type=int, default=2000)
+    segments.set_defaults(func=cmd_segments)
+
+    layouts = sub.add_parser("layouts", help="drive Columns and Spiral through add/focus/grow/remove")
+    layouts.add_argument("--windows", type=int, nargs="+", default=[5, 15, 30, 60])
+    layouts.add_argument("--ops", type=int, default=400)
+    layouts.set_defaults(func=cmd_layouts)
+
+    focus = sub.add_parser("focus", help="replay pointer paths through FocusIntent")
+    focus.add_argument("--path", help="JSON lines of [seconds, x, y]")
+    focus.add_argument("--dwell", type=float, default=0.3)
+    focus.set_defaults(func=cmd_focus)
+
+    battery = sub.add_parser("battery", help="PowerSupply against a fake sysfs and injected uevents")
+    battery.set_defaults(func=cmd_battery)
+
+    audio = sub.add_parser("audio", help="AudioControl against a mock pulse server")
+    audio.set_defaults(func=cmd_audio)
+
+    backlight = sub.add_parser("backlight", help="Backlight ramps against a fake sysfs")
+    backlight.set_defaults(func=cmd_backlight)
+
+    hooks = sub.add_parser("hooks", help="slow swallow reads must not delay client_new")
+    hooks.add_argument("--windows", type=int, default=20)
+    hooks.add_argument("--slow", type=float, default=0.2)
+    hooks.add_argument("--budget", type=float, default=0.005)
+    hooks.set_defaults(func=cmd_hooks)
+
+    swallow = sub.add_parser("swallow", help="soak the swallow registry")
+    swallow.add_argument("--windows", type=int, default=20000)
+    swallow.add_argument("--max-growth", type=int, default=64 * 1024)
+    swallow.set_defaults(func=cmd_swallow)
+
+    rules = sub.add_parser("rules", help="route synthetic clients through the rule engine and stock")
+    rules.add_argument("--clients", type=int, default=5000)
+    rules.set_defaults(func=cmd_rules)
+
+    livereload = sub.add_parser("livereload", help="evaluate config.py aside as mod+r does")
+    livereload.add_argument("--repeat", type=int, default=3)
+    livereload.set_defaults(func=cmd_livereload)
+
+    reload = sub.add_parser("reload", help="reload the config the way qtile does, state carried over")
+    reload.set_defaults(func=cmd_reload)
+
+    dunst = sub.add_parser("dunst", help="drive the dunst state and history with fake-dunstctl")
+    dunst.add_argument("--toggles", type=int, default=20)
+    dunst.add_argument("--history", type=int, default=2000)
+    dunst.set_defaults(func=cmd_dunst)
+
+    ancestry = sub.add_parser("ancestry", help="swallow lookups against a synthetic process tree")
+    ancestry.add_argument("--windows", type=int, nargs="+", default=[10, 50, 200, 1000])
+    ancestry.add_argument("--lookups", type=int, default=2000)
+    ancestry.set_defaults(func=cmd_ancestry)
+
+    replay = sub.add_parser("replay", help="replay a session trace through the whole config")
+    replay.add_argument("trace", nargs="?", help="JSON lines from sessiontrace; synthetic if omitted")
+    replay.add_argument("--events", type=int, default=5000)
+    replay.add_argument("--speed", type=float, default=0, help="times real time; 0 runs on the trace's clock")
+    replay.add_argument("--json", action="store_true")
+    replay.set_defaults(func=cmd_replay)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Reload config.py by applying only what changed to the running session."""
+
+import os
+import runpy
+import sys
+import time
+import types
+
+from libqtile import hook
+from libqtile.log_utils import logger
+
+
+# Plain options qtile reads at the moment it needs them.
+RUNTIME_OPTIONS = (
+    "follow_mouse_focus",
+    "bring_front_click",
+    "cursor_warp",
+    "auto_fullscreen",
+    "focus_on_window_activation",
+    "auto_minimize",
+)
+
+# Anything else differing in these means a full reload.
+STRUCTURAL = (
+    "groups",
+    "layouts",
+    "mouse",
+    "widget_defaults",
+    "workspaces",
+    "float_rules",
+    "dgroups_key_binder",
+    "dgroups_app_rules",
+    "wmname",
+)
+
+
+def norm(value):
+    # A comparable form of a config value. Objects from a fresh evaluation
+    # are never identical to the live ones, so compare what they were built
+    # from instead.
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple(norm(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), norm(v)) for k, v in value.items()))
+    if hasattr(value, "_user_config"):
+        return (type(value).__name__, norm(value._user_config))
+    if hasattr(value, "selectors") and hasattr(value, "name"):
+        # lazy calls
+        return ("lazy", norm(value.selectors), value.name, norm(value.args), norm(value.kwargs))
+    if hasattr(value, "_rules"):
+        return ("Match", norm(value._rules))
+    func = getattr(value, "__func__", value)
+    if getattr(func, "__code__", None) is not None:
+        return _func(func)
+    if callable(value):
+        return ("callable", getattr(value, "__qualname__", type(value).__name__))
+    if type(value).__repr__ is object.__repr__:
+        # The default repr is only an address.
+        return ("object", type(value).__qualname__)
+    return ("repr", repr(value))
+
+
+def _code(code):
+    # Bytecode alone misses edited literals ("pavucontrol", a step size),
+    # which live in co_consts, nested functions' included.
+    return (
+        code.co_code,
+        code.co_names,
+        tuple(_code(c) if isinstance(c, types.CodeType) else norm(c) for c in code.co_consts),
+    )
+
+
+def _func(func, depth=2):
+    closure = ()
+    if func.__closure__ and depth:
+        cells = []
+        for cell in func.__closure__:
+            try:
+                value = cell.cell_contents
+            except ValueError:
+                value = None
+            inner = getattr(value, "__func__", value)
+            # Only a couple of levels, so recursive closures terminate.
+            cells.append(_func(inner, depth - 1) if getattr(inner, "__code__", None) else norm(value))
+        closure = tuple(cells)
+    return (
+        "func",
+        func.__qualname__,
+        _code(func.__code__),
+        norm(func.__defaults__),
+        norm(func.__kwdefaults__),
+        closure,
+    )
+
+
+def key_id(key):
+    return (tuple(sorted(key.modifiers)), key.key)
+
+
+def key_sig(key):
+    return norm(key.commands), getattr(key, "desc", "")
+
+
+class Diff:
+    def __init__(self):
+        self.structural = []
+        self.keys_added = []
+        self.keys_removed = []
+        self.keys_changed = []
+        self.options = {}
+        self.widgets = []
+
+    @property
+    def empty(self):
+        return not (
+            self.structural
+            or self.keys_added
+            or self.keys_removed
+            or self.keys_changed
+            or self.options
+            or self.widgets
+        )
+
+    def summary(self):
+        if self.structural:
+            return "full reload ({} changed)".format(", ".join(self.structural))
+        parts = []
+        if self.keys_added or self.keys_removed or self.keys_changed:
+            parts.append(
+                "keys +{} -{} ~{}".format(
+                    len(self.keys_added), len(self.keys_removed), len(self.keys_changed)
+                )
+            )
+        if self.widgets:
+            parts.append("{} widget(s) updated".format(len(self.widgets)))
+        if self.options:
+            parts.append("options: {}".format(", ".join(sorted(self.options))))
+        return "; ".join(parts) or "no changes"
+
+
+def _singletons(directory):
+    # Module-level objects of the live config and of its helper modules:
+    # what running config.py again reconfigures in place (the terminal
+    # pool's route, session_trace.ancestors, ...).
+    modules = [
+        module
+        for module in list(sys.modules.values())
+        if getattr(module, "__file__", None)
+        and os.path.dirname(os.path.abspath(module.__file__)) == directory
+    ]
+    ours = {module.__name__ for module in modules}
+    objects = {}
+    for module in modules:
+        for value in vars(module).values():
+            if type(value).__module__ in ours and hasattr(value, "__dict__"):
+                objects[id(value)] = value
+    return [(obj, dict(vars(obj))) for obj in objects.values()]
+
+
+def _copy_hooks():
+    # hook.subscriptions is {registry: {event: [funcs]}}, qtile's own
+    # events being the "qtile" registry. Copied down to the lists, which
+    # later subscriptions append to.
+    return {
+        registry: {event: list(funcs) for event, funcs in events.items()}
+        for registry, events in hook.subscriptions.items()
+    }
+
+
+def evaluate(path):
+    # Run config.py into a fresh namespace without letting its hook
+    # subscriptions replace the live ones; they are returned for diffing.
+    # The shared singletons it touches get their state back afterwards,
+    # whatever the diff turns out to be: apply() only uses the namespace.
+    saved = _copy_hooks()
+    state = _singletons(os.path.dirname(os.path.abspath(path)))
+    try:
+        namespace = runpy.run_path(path, run_name="config_reload")
+        subscribed = _copy_hooks()
+    finally:
+        hook.subscriptions.clear()
+        hook.subscriptions.update(saved)
+        for obj, attrs in state:
+            vars(obj).clear()
+            vars(obj).update(attrs)
+    new_hooks = {
+        registry: {
+            event: [f for f in funcs if f not in saved.get(registry, {}).get(event, ())]
+            for event, funcs in events.items()
+        }
+        for registry, events in subscribed.items()
+    }
+    return namespace, new_hooks
+
+
+def _bar_widgets(bar):
+    widgets = getattr(bar, "widgets", None)
+    if not widgets and getattr(bar, "factory", None) is not None:
+        widgets = bar.factory()
+    return widgets or []
+
+
+def compute(qtile, live, namespace, new_hooks):
+    diff = Diff()
+
+    for name in STRUCTURAL:
+        if norm(getattr(live, name, None)) != norm(namespace.get(name)):
+            diff.structural.append(name)
+
+    # Hooks were already subscribed by the live config; only the new
+    # definitions' code can be compared.
+    live_hooks = {
+        (registry, event): sorted(
+            norm(f) for f in funcs if getattr(f, "__module__", None) == live.__name__
+        )
+        for registry, events in hook.subscriptions.items()
+        for event, funcs in events.items()
+    }
+    for registry, events in new_hooks.items():
+        for event, funcs in events.items():
+            if sorted(norm(f) for f in funcs) != live_hooks.get((registry, event), []):
+                diff.structural.append("hook " + event)
+
+    old_keys = {key_id(k): k for k in qtile.config.keys}
+    new_keys = {key_id(k): k for k in namespace.get("keys", [])}
+    for kid, key in new_keys.items():
+        if kid not in old_keys:
+            diff.keys_added.append(key)
+        elif key_sig(key) != key_sig(old_keys[kid]):
+            diff.keys_changed.append((old_keys[kid], key))
+    diff.keys_removed = [k for kid, k in old_keys.items() if kid not in new_keys]
+
+    for option in RUNTIME_OPTIONS:
+        if option in namespace and norm(getattr(qtile.config, option, None)) != norm(namespace[option]):
+            diff.options[option] = namespace[option]
+
+    live_screens = qtile.config.screens
+    new_screens = namespace.get("screens", [])
+    if len(live_screens) != len(new_screens):
+        diff.structural.append("screens")
+        return diff
+    for live_screen, new_screen in zip(live_screens, new_screens):
+        for position in ("top", "bottom", "left", "right"):
+            live_bar = getattr(live_screen, position, None)
+            new_bar = getattr(new_screen, position, None)
+            if type(live_bar) is not type(new_bar) or norm(getattr(live_bar, "_user_config", None)) != norm(
+                getattr(new_bar, "_user_config", None)
+            ) or getattr(live_bar, "size", None) != getattr(new_bar, "size", None):
+                diff.structural.append("bar")
+                return diff
+            live_widgets = _bar_widgets(live_bar)
+            new_widgets = _bar_widgets(new_bar)
+            if [type(w).__name__ for w in live_widgets] != [type(w).__name__ for w in new_widgets]:
+                diff.structural.append("bar widgets")
+                return diff
+            for old, new in zip(live_widgets, new_widgets):
+                old_config = getattr(old, "_user_config", {})
+                new_config = getattr(new, "_user_config", {})
+                changed = {
+                    k: v
+                    for k, v in new_config.items()
+                    if norm(v) != norm(old_config.get(k))
+                }
+                removed = set(old_config) - set(new_config)
+                if removed or "decorations" in changed or "width" in changed:
+                    diff.structural.append("widget " + old.name)
+                    return diff
+                if changed:
+                    diff.widgets.append((old, changed))
+    return diff
+
+
+def apply(qtile, diff, namespace):
+    for old, new in diff.keys_changed:
+        qtile.ungrab_key(old)
+        qtile.grab_key(new)
+    for key in diff.keys_removed:
+        qtile.ungrab_key(key)
+    for key in diff.keys_added:
+        qtile.grab_key(key)
+    qtile.config.keys = namespace["keys"]
+
+    for option, value in diff.options.items():
+        setattr(qtile.config, option, value)
+
+    bars = []
+    for widget, changed in diff.widgets:
+        for name, value in changed.items():
+            if name == "text" and hasattr(widget, "update"):
+                widget.update(value)
+            else:
+                setattr(widget, name, value)
+            widget._user_config[name] = value
+        if "format" in changed and hasattr(widget, "tick"):
+            widget.tick()
+        if widget.bar not in bars:
+            bars.append(widget.bar)
+    # One repaint per touched bar; untouched widgets keep their state.
+    for bar in bars:
+        bar.draw()
+
+
+def reload_incremental(qtile):
+    start = time.perf_counter()
+    try:
+        namespace, new_hooks = evaluate(qtile.config.file_path)
+        diff = compute(qtile, _LiveConfig(qtile.config), namespace, new_hooks)
+    except Exception as e:
+        logger.exception("Incremental reload failed to evaluate the config")
+        _notify(qtile, "Config error", str(e))
+        return
+
+    if diff.structural:
+        logger.info("Incremental reload: %s", diff.summary())
+        qtile.reload_config()
+        return
+    apply(qtile, diff, namespace)
+    elapsed = (time.perf_counter() - start) * 1000
+    summary = "{} in {:.0f}ms".format(diff.summary(), elapsed)
+    logger.info("Incremental reload: %s", summary)
+    _notify(qtile, "Config reloaded", summary)
+    return summary
+
+
+class _LiveConfig:
+    # The live values of the names compute() compares, read from the config
+    # module qtile loaded (which also has the helpers like ``workspaces``).
+
+    def __init__(self, config):
+        self._config = config
+        self._module = sys.modules.get("config")
+        self.__name__ = getattr(self._module, "__name__", "config")
+
+    def __getattr__(self, name):
+        if self._module is not None and hasattr(self._module, name):
+            return getattr(self._module, name)
+        return getattr(self._config, name, None)
+
+
+def _notify(qtile, title, body):
+    qtile.cmd_spawn(["notify-send", "-a", "Qtile", title, body])
@@ -0,0 +1,210 @@
+"""Event-loop stall watchdog that records what the loop was stuck in."""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from libqtile.log_utils import logger
+
+from profiling import Histogram
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (file suffix, function) of qtile's dispatchers -> what the code under them
+# was running as. The innermost match wins.
+DISPATCHERS = (
+    ("libqtile/hook.py", "fire", "hook"),
+    ("libqtile/bar.py", "process_button_click", "mouse callback"),
+    ("widget/base.py", "button_press", "mouse callback"),
+    ("widget/base.py", "timer_setup", "widget poll"),
+    ("widget/base.py", "tick", "widget poll"),
+    ("widget/base.py", "poll", "widget poll"),
+    ("widget/base.py", "_poll", "widget poll"),
+    ("libqtile/command/base.py", "command", "lazy command"),
+    ("libqtile/core/manager.py", "process_key_press", "lazy command"),
+    ("libqtile/core/manager.py", "server_call", "lazy command"),
+    ("libqtile/core/manager.py", "cmd_function", "lazy command"),
+)
+
+
+class Stall:
+    __slots__ = ("started", "duration", "kind", "culprit", "stack")
+
+    def __init__(self, started, kind="unknown", culprit=None, stack=None):
+        self.started = started
+        self.duration = None
+        self.kind = kind
+        self.culprit = culprit
+        self.stack = stack or []
+
+    def as_dict(self):
+        return {
+            "time": self.started,
+            "duration_ms": None if self.duration is None else round(self.duration * 1000, 1),
+            "kind": self.kind,
+            "culprit": self.culprit,
+            "stack": self.stack,
+        }
+
+
+def classify(frames):
+    # frames: innermost first, as (filename, lineno, function, qualname)
+    # tuples.
+    kind = "other"
+    dispatch = None
+    for index, (filename, _lineno, function, _qualname) in enumerate(frames):
+        for suffix, name, label in DISPATCHERS:
+            if function == name and filename.endswith(suffix):
+                kind, dispatch = label, index
+                break
+        if dispatch is not None:
+            break
+    # Blame the innermost frame from this config directory, else the first
+    # frame under the dispatcher, else the innermost frame.
+    for filename, lineno, _function, qualname in frames:
+        if filename.startswith(HERE):
+            break
+    else:
+        filename, lineno, _function, qualname = frames[dispatch - 1 if dispatch else 0]
+    return kind, "{} ({}:{})".format(qualname, os.path.basename(filename), lineno)
+
+
+class LoopWatchdog:
+    # The loop ticks a heartbeat every ``interval`` seconds and records how
+    # late each tick was. A thread watches the heartbeat; once it is more
+    # than ``threshold`` seconds overdue, the loop thread's stack is taken
+    # from sys._current_frames() while it is still stuck, classified (hook,
+    # widget poll, mouse callback, lazy command) and kept in a ring buffer
+    # of the last ``keep`` stalls. Only code objects and line numbers are
+    # read from the loop thread's frames, never their locals. config.py
+    # registers report() and lag_report() as qtile commands:
+    #
+    #     qtile cmd-obj -o cmd -f stalls
+
+    def __init__(self, threshold=0.1, interval=0.05, keep=64, depth=30):
+        self.threshold = threshold
+        self.interval = interval
+        self.depth = depth
+        self.stalls = deque(maxlen=keep)
+        self.lag = Histogram()
+        self._lock = threading.Lock()
+        self._open = None
+        self._beat = 0.0
+        self._loop = None
+        self._handle = None
+        self._thread = None
+        self._thread_id = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, qtile):
+        if self.running:
+            return
+        self._loop = asyncio.get_event_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._handle = self._loop.call_later(self.interval, self._tick)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="qtile-watchdog", daemon=True)
+        self._thread.start()
+        logger.info("Loop watchdog started, threshold %.0fms", self.threshold * 1000)
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._handle.cancel()
+        self._handle = None
+
+    def take_over(self, previous, qtile):
+        # A reloaded config's watchdog: the previous one's thread is
+        # stopped, and this one keeps its stalls and carries on if it was
+        # running.
+        running = previous.running
+        previous.stop()
+        self.stalls.extend(previous.stalls)
+        self.lag = previous.lag
+        if running:
+            self.threshold = previous.threshold
+            self.start(qtile)
+
+    def _tick(self):
+        now = time.monotonic()
+        with self._lock:
+            late = max(now - self._beat - self.interval, 0.0)
+            self._beat = now
+            stall, self._open = self._open, None
+        self.lag.add(late)
+        if late > self.threshold:
+            if stall is None:
+                # Over before the watchdog thread looked; no stack.
+                stall = Stall(time.time() - late)
+                with self._lock:
+                    self.stalls.append(stall)
+            stall.duration = late
+            logger.debug("Loop stalled %.0fms in %s: %s", late * 1000, stall.kind, stall.culprit)
+        self._handle = self._loop.call_later(self.interval, self._tick)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue <= self.threshold or self._open is not None:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.depth:
+                code = frame.f_code
+                frames.append(
+                    (
+                        code.co_filename,
+                        frame.f_lineno,
+                        code.co_name,
+                        getattr(code, "co_qualname", code.co_name),
+                    )
+                )
+                frame = frame.f_back
+            del frame
+            kind, culprit = classify(frames)
+            stall = Stall(
+                time.time() - overdue,
+                kind,
+                culprit,
+                ["{}:{} {}".format(f, line, name) for f, line, _function, name in frames],
+            )
+            with self._lock:
+                if time.monotonic() - self._beat - self.interval > self.threshold:
+                    self._open = stall
+                    self.stalls.append(stall)
+
+    def report(self, limit=None):
+        """Recent loop stalls, newest first"""
+        with self._lock:
+            stalls = [stall.as_dict() for stall in reversed(self.stalls)]
+        return stalls[:limit] if limit else stalls
+
+    def lag_report(self):
+        """Heartbeat lateness histogram"""
+        return self.lag.as_dict()
+
+
+watchdog = LoopWatchdog()
+
+
+# Callable for lazy.function
+def toggle_watchdog(qtile):
+    if watchdog.running:
+        watchdog.stop()
+        logger.info("Loop watchdog stopped")
+    else:
+        watchdog.start(qtile)
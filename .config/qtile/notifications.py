@@ -0,0 +1,400 @@
+"""Push-based dunst state, notification history and bar widget."""
+
+import asyncio
+import html
+import json
+import os
+import time
+from bisect import bisect_left
+
+from libqtile.log_utils import logger
+from libqtile.utils import add_signal_receiver, create_task
+from qtile_extras import widget
+
+from theme import SLOTS, theme_engine
+
+
+DUNST_PATH = "/org/freedesktop/Notifications"
+DUNST_INTERFACE = "org.dunstproject.cmd0"
+NOTIFY_RULE = "type='method_call',interface='org.freedesktop.Notifications',member='Notify'"
+URGENCIES = ("low", "normal", "critical")
+
+
+class DunstState:
+    # One shared view of dunst's paused flag. It is read once with dunstctl
+    # and then kept current from dunst's PropertiesChanged signal, so no
+    # process is spawned unless the state is toggled from the bar.
+    #
+    # Point QTILE_DUNSTCTL (or ``dunstctl=``) at fake-dunstctl and pass
+    # ``dbus=False`` to drive it without a running dunst; ``harness.py
+    # dunst`` does exactly that.
+
+    def __init__(self, dunstctl=None, dbus=True):
+        self.dunstctl = dunstctl or os.environ.get("QTILE_DUNSTCTL", "dunstctl")
+        self.dbus = dbus
+        self.paused = None
+        self._listeners = []
+        self._started = False
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+        if self.paused is not None:
+            callback(self.paused)
+        if not self._started:
+            self._started = True
+            create_task(self._start())
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def set(self, paused):
+        # Listeners only hear about real flips, which is what keeps redraws down.
+        if paused == self.paused:
+            return
+        self.paused = paused
+        for callback in list(self._listeners):
+            callback(paused)
+
+    async def _start(self):
+        if self.dbus:
+            try:
+                await add_signal_receiver(
+                    self._properties_changed,
+                    session_bus=True,
+                    signal_name="PropertiesChanged",
+                    dbus_interface="org.freedesktop.DBus.Properties",
+                    path=DUNST_PATH,
+                )
+            except Exception:
+                logger.exception("Unable to subscribe to dunst pause changes")
+        await self.refresh()
+
+    def _properties_changed(self, message):
+        interface, changed, _invalidated = message.body
+        if interface == DUNST_INTERFACE and "paused" in changed:
+            self.set(bool(changed["paused"].value))
+
+    # Output of ``dunstctl *args``, for anything else that needs dunst.
+    async def run(self, *args):
+        proc = await asyncio.create_subprocess_exec(
+            self.dunstctl,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        out, _ = await proc.communicate()
+        return out.decode("utf-8").strip()
+
+    async def refresh(self):
+        try:
+            self.set(await self.run("is-paused") == "true")
+        except OSError:
+            logger.exception("Unable to query dunst state")
+
+    async def _toggle(self):
+        try:
+            await self.run("set-paused", "toggle")
+        except OSError:
+            logger.exception("Unable to toggle dunst")
+            return
+        # The signal normally beats us here; the query covers older dunst.
+        await self.refresh()
+
+    def toggle(self):
+        create_task(self._toggle())
+
+
+dunst_state = DunstState()
+
+
+class Notification:
+    __slots__ = ("seq", "time", "app", "urgency", "summary", "body")
+
+    def __init__(self, seq, time, app, urgency, summary, body):
+        self.seq = seq
+        self.time = time
+        self.app = app
+        self.urgency = urgency
+        self.summary = summary
+        self.body = body
+
+
+class NotificationHistory:
+    # Every notification sent on the session bus, kept in arrival order and
+    # indexed by app and urgency. It is seeded once from ``dunstctl
+    # history`` and then fed by a D-Bus monitor connection watching Notify
+    # calls, so nothing is ever re-dumped or re-parsed.
+    #
+    # Entries are numbered by ``seq``; a page is the ``limit`` newest
+    # entries matching the filters with seq below ``before``, and the seq of
+    # its last entry is the cursor for the next page. Only the oldest
+    # entries past ``max_entries`` are dropped, in batches.
+
+    def __init__(self, state=None, max_entries=10000, dbus=True):
+        self.state = state or dunst_state
+        self.max_entries = max_entries
+        self.dbus = dbus
+        self.ingested = 0
+        self._entries = []
+        self._first = 0
+        self._next = 0
+        self._by_app = {}
+        self._by_urgency = {}
+        self._times = []
+        self._started = False
+        self._stopped = False
+        self._bus = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            create_task(self._start())
+
+    async def _start(self):
+        await self._seed()
+        if not self.dbus:
+            return
+        try:
+            from dbus_next import Message
+            from dbus_next.aio import MessageBus
+
+            bus = await MessageBus().connect()
+            await bus.call(
+                Message(
+                    destination="org.freedesktop.DBus",
+                    path="/org/freedesktop/DBus",
+                    interface="org.freedesktop.DBus.Monitoring",
+                    member="BecomeMonitor",
+                    signature="asu",
+                    body=[[NOTIFY_RULE], 0],
+                )
+            )
+        except Exception:
+            logger.exception("Unable to monitor notifications")
+            return
+        if self._stopped:
+            # Stopped (a reload) while the connection was being made.
+            bus.disconnect()
+            return
+        self._bus = bus
+        self._bus.add_message_handler(self._message)
+
+    def stop(self):
+        # Closes the monitor connection. A reload starts a new history in
+        # its place, so this one is never started again.
+        self._stopped = True
+        if self._bus is not None:
+            self._bus.remove_message_handler(self._message)
+            self._bus.disconnect()
+            self._bus = None
+
+    async def _seed(self):
+        # dunst's own history, oldest first. Its timestamps are monotonic
+        # microseconds.
+        try:
+            data = json.loads(await self.state.run("history"))
+        except (OSError, ValueError):
+            logger.exception("Unable to read dunst history")
+            return
+        offset = time.time() - time.monotonic()
+        entries = data.get("data", [[]])[0]
+        for entry in sorted(entries, key=lambda e: e["timestamp"]["data"]):
+            self.add(
+                entry["appname"]["data"],
+                entry.get("urgency", {}).get("data", "NORMAL").lower(),
+                entry["summary"]["data"],
+                entry["body"]["data"],
+                offset + entry["timestamp"]["data"] / 1e6,
+            )
+
+    def _message(self, message):
+        if message.member != "Notify":
+            return False
+        app, _replaces, _icon, summary, body, _actions, hints, _timeout = message.body
+        urgency = hints.get("urgency")
+        urgency = URGENCIES[urgency.value] if urgency is not None and urgency.value < 3 else "normal"
+        self.add(app, urgency, summary, body)
+        # Handled: a monitor connection must never reply.
+        return True
+
+    def add(self, app, urgency, summary, body, when=None):
+        when = time.time() if when is None else when
+        entry = Notification(self._next, when, app, urgency, summary, body)
+        self._next += 1
+        self.ingested += 1
+        self._entries.append(entry)
+        self._times.append(entry.time)
+        self._by_app.setdefault(app, []).append(entry.seq)
+        self._by_urgency.setdefault(urgency, []).append(entry.seq)
+        if len(self._entries) > self.max_entries * 1.1:
+            self._trim()
+        return entry
+
+    def _trim(self):
+        drop = len(self._entries) - self.max_entries
+        self._first += drop
+        del self._entries[:drop]
+        del self._times[:drop]
+        for index in (self._by_app, self._by_urgency):
+            for key in list(index):
+                seqs = index[key]
+                del seqs[: bisect_left(seqs, self._first)]
+                if not seqs:
+                    del index[key]
+
+    def apps(self):
+        return {app: len(seqs) for app, seqs in self._by_app.items()}
+
+    def page(self, limit=50, before=None, app=None, urgency=None, since=None):
+        # Walk the smallest applicable index backwards from the cursor.
+        if before is None or before > self._next:
+            before = self._next
+        if since is not None:
+            floor = self._first + bisect_left(self._times, since)
+        else:
+            floor = self._first
+        candidates = None
+        for index, key in ((self._by_app, app), (self._by_urgency, urgency)):
+            if key is not None:
+                seqs = index.get(key, [])
+                if candidates is None or len(seqs) < len(candidates):
+                    candidates = seqs
+        if candidates is None:
+            seqs = range(max(floor, self._first), before)
+            stop = len(seqs)
+        else:
+            seqs = candidates
+            stop = bisect_left(seqs, before)
+        results = []
+        for position in range(stop - 1, -1, -1):
+            seq = seqs[position]
+            if seq < floor:
+                break
+            entry = self._entries[seq - self._first]
+            if (app is None or entry.app == app) and (urgency is None or entry.urgency == urgency):
+                results.append(entry)
+                if len(results) == limit:
+                    break
+        cursor = results[-1].seq if len(results) == limit else None
+        return results, cursor
+
+
+notification_history = NotificationHistory()
+
+
+class NotificationCenter:
+    # rofi fed straight from the history: the first page is written as soon
+    # as rofi starts and the rest follows a page at a time while it is
+    # already on screen, so opening costs one page however long the
+    # history is. Critical entries take the theme's red, read at open so a
+    # theme switch applies.
+
+    def __init__(self, history=None, page_size=50, rofi="rofi", theme=None):
+        self.history = history or notification_history
+        self.theme = theme or theme_engine
+        self.page_size = page_size
+        self.rofi = rofi
+        self._proc = None
+
+    def open(self, qtile=None, **filters):
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.terminate()
+            return
+        create_task(self._run(filters))
+
+    def format(self, entry, now):
+        age = int(now - entry.time)
+        if age < 3600:
+            age = "{}m".format(age // 60)
+        elif age < 86400:
+            age = "{}h".format(age // 3600)
+        else:
+            age = "{}d".format(age // 86400)
+        line = "<b>{}</b>  {}  <i>{}</i>".format(
+            html.escape(entry.app), html.escape(entry.summary), age
+        )
+        if entry.urgency == "critical":
+            line = "<span foreground='{}'>{}</span>".format(
+                self.theme.color(SLOTS.index("red")), line
+            )
+        return line
+
+    async def _run(self, filters):
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                self.rofi,
+                "-dmenu",
+                "-i",
+                "-markup-rows",
+                "-p",
+                "Notifications",
+                "-async-pre-read",
+                str(self.page_size),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+            )
+        except OSError:
+            logger.exception("Unable to open the notification center")
+            return
+        proc = self._proc
+        now = time.time()
+        cursor = None
+        try:
+            while proc.returncode is None:
+                entries, cursor = self.history.page(self.page_size, cursor, **filters)
+                lines = (self.format(entry, now).replace("\n", " ") for entry in entries)
+                proc.stdin.write("".join(line + "\n" for line in lines).encode("utf-8"))
+                await proc.stdin.drain()
+                if cursor is None:
+                    break
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        await proc.wait()
+
+
+notification_center = NotificationCenter()
+
+
+class DunstStatus(widget.TextBox):
+    defaults = [
+        ("active_text", "", "Text shown while notifications are shown"),
+        ("paused_text", "", "Text shown while notifications are paused"),
+        ("paused_foreground", "#3b4252", "Colour of paused_text; palette lists follow the theme"),
+    ]
+
+    def __init__(self, state=None, **config):
+        widget.TextBox.__init__(self, "", **config)
+        self.add_defaults(DunstStatus.defaults)
+        self.state = state or dunst_state
+
+    def _configure(self, qtile, bar):
+        widget.TextBox._configure(self, qtile, bar)
+        self.state.subscribe(self._changed)
+
+    def _markup(self, paused):
+        if not paused:
+            return self.active_text
+        colour = self.paused_foreground
+        if isinstance(colour, list):
+            colour = colour[0]
+        return "<span foreground='{}'>{}</span>".format(colour, self.paused_text)
+
+    def _changed(self, paused):
+        self.update(self._markup(paused))
+
+    def draw(self):
+        # A theme switch refills paused_foreground in place and redraws.
+        if self.state.paused:
+            markup = self._markup(True)
+            if markup != self.text:
+                self.text = markup
+        widget.TextBox.draw(self)
+
+    def finalize(self):
+        self.state.unsubscribe(self._changed)
+        widget.TextBox.finalize(self)
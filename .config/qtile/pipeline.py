@@ -0,0 +1,117 @@
+"""Hook work split into off-loop reads and per-stage in-order commits on the loop."""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from libqtile.log_utils import logger
+from libqtile.utils import create_task
+
+from profiling import Histogram
+
+
+class HookPipeline:
+    # submit() returns at once, so the hook that called it never holds up
+    # the window being mapped. ``read`` runs on a worker thread and must
+    # only read (/proc, files), never touch qtile or X; ``commit`` then gets
+    # its result on the event loop. The commits of one stage name run
+    # strictly in submission order, whichever read finishes first. Stages
+    # don't wait for each other, so a slow swallow read never holds back
+    # the commits of another stage.
+    #
+    # A stage that raises anything, in its read or its commit, is logged
+    # and skipped; the stages after it still commit. A read is given up on
+    # after ``timeout`` seconds, so one hung on a wedged /proc entry can't
+    # hold back every later commit of its stage (its worker stays busy
+    # until the read does return). Only cancellation once shutdown() has
+    # been called is let through.
+    #
+    # Each stage name gets three histograms: ``read`` (worker time),
+    # ``commit`` (loop time) and ``lag`` (submit to commit).
+
+    def __init__(self, workers=2, budget=0.1, timeout=2.0):
+        self.workers = workers
+        self.budget = budget
+        self.timeout = timeout
+        self.latency = {}
+        self._closed = False
+        self._executor = None
+        # Per stage name: the next seq to hand out, the next to commit, and
+        # finished reads waiting for their turn.
+        self._next = {}
+        self._committed = {}
+        self._done = {}
+
+    def _histogram(self, name, kind):
+        return self.latency.setdefault(name, {}).setdefault(kind, Histogram())
+
+    def submit(self, name, read, *args, commit=None):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="qtile-hook")
+            self._closed = False
+        seq = self._next.get(name, 0)
+        self._next[name] = seq + 1
+        create_task(self._run(seq, name, read, args, commit, time.perf_counter()))
+
+    @staticmethod
+    def _read(read, args):
+        # Timed on the worker; histograms are only touched on the loop.
+        start = time.perf_counter()
+        result = read(*args)
+        return result, time.perf_counter() - start
+
+    async def _run(self, seq, name, read, args, commit, submitted):
+        result = error = None
+        if read is not None:
+            loop = asyncio.get_event_loop()
+            try:
+                result, elapsed = await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, self._read, read, args), self.timeout
+                )
+                self._histogram(name, "read").add(elapsed)
+            except BaseException as e:
+                if isinstance(e, asyncio.CancelledError) and self._closed:
+                    raise
+                error = e
+        done = self._done.setdefault(name, {})
+        done[seq] = (name, commit, result, error, submitted)
+        turn = self._committed.get(name, 0)
+        while turn in done:
+            self._commit(*done.pop(turn))
+            turn += 1
+            self._committed[name] = turn
+
+    def _commit(self, name, commit, result, error, submitted):
+        if error is not None:
+            logger.error("Hook stage %s failed", name, exc_info=error)
+            return
+        start = time.perf_counter()
+        try:
+            if commit is not None:
+                commit(result)
+        except BaseException:
+            logger.exception("Hook stage %s failed to commit", name)
+        end = time.perf_counter()
+        self._histogram(name, "commit").add(end - start)
+        self._histogram(name, "lag").add(end - submitted)
+        if end - submitted > self.budget:
+            logger.debug("Hook stage %s committed %.0fms after submit", name, (end - submitted) * 1000)
+
+    @property
+    def pending(self):
+        return sum(self._next.values()) - sum(self._committed.values())
+
+    def report(self):
+        return {
+            name: {kind: histogram.as_dict() for kind, histogram in kinds.items()}
+            for name, kinds in self.latency.items()
+        }
+
+    def shutdown(self):
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+hook_pipeline = HookPipeline()
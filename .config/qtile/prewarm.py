@@ -0,0 +1,254 @@
+"""Hidden, prewarmed terminal windows handed out on keypress."""
+
+import os
+import time
+from collections import deque
+
+from libqtile.log_utils import logger
+
+from reloads import kept
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def alive(pid):
+    return os.path.exists("/proc/{}".format(pid))
+
+
+def sync(qtile, window):
+    # One round trip to the X server: once it returns, every request sent
+    # before it (the map included) has been carried out.
+    qtile.core.flush()
+    get_attributes = getattr(window.window, "get_attributes", None)
+    if get_attributes is not None:
+        get_attributes()
+
+
+def rss(pid):
+    try:
+        with open("/proc/{}/statm".format(pid)) as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+class TerminalPool:
+    # Keeps ``size`` terminals spawned and parked in ``hidden_group``. open()
+    # moves one to where the terminal would have been routed anyway and
+    # focuses it, then tops the pool back up in the background. The pool is
+    # emptied after ``idle_timeout`` seconds without use and never grows past
+    # ``max_rss`` bytes of resident memory. Spawns whose process is gone, or
+    # that have not mapped a window within ``spawn_timeout`` seconds, are
+    # given up on.
+    #
+    # Latency runs from the keypress to the terminal being mapped on screen:
+    # after the warm window is shown, or once qtile has managed the cold
+    # one, a round trip to the X server confirms the map went through.
+
+    def __init__(
+        self,
+        command,
+        size=2,
+        hidden_group="scratchpad",
+        route=None,
+        idle_timeout=30 * 60,
+        max_rss=512 * 1024 * 1024,
+        refill_delay=1.0,
+        spawn_timeout=30.0,
+    ):
+        self.command = command
+        self.size = size
+        self.hidden_group = hidden_group
+        self.route = route
+        self.idle_timeout = idle_timeout
+        self.max_rss = max_rss
+        self.refill_delay = refill_delay
+        self.spawn_timeout = spawn_timeout
+        self.latencies = deque(maxlen=256)
+        self.qtile = None
+        # pid -> time.perf_counter() when it was spawned
+        self._pending = {}
+        self._ready = deque()
+        self._cold = {}
+        self._idle_handle = None
+        self._refill_handle = None
+
+    @classmethod
+    def get(cls, qtile, command, **config):
+        # The pool a reloaded config builds takes over the terminals the
+        # previous one had parked or on their way, rather than leaving them
+        # orphaned in the hidden group and spawning more.
+        pools = kept(qtile).setdefault("terminal_pools", {})
+        pool = cls(command, **config)
+        previous = pools.get(command)
+        if previous is not None:
+            pool._adopt(previous)
+        pools[command] = pool
+        return pool
+
+    def _adopt(self, previous):
+        previous._cancel()
+        self.qtile = previous.qtile
+        self._pending = previous._pending
+        self._ready = previous._ready
+        self._cold = previous._cold
+        self.latencies.extend(previous.latencies)
+
+    def _cancel(self):
+        for handle in (self._idle_handle, self._refill_handle):
+            if handle is not None:
+                handle.cancel()
+        self._idle_handle = self._refill_handle = None
+
+    def start(self, qtile, delay=5.0):
+        # Let the session settle before spawning anything.
+        self.qtile = qtile
+        if self._refill_handle is not None:
+            self._refill_handle.cancel()
+        self._refill_handle = qtile.call_later(delay, self.fill)
+        self._touch()
+
+    def _touch(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+        self._idle_handle = self.qtile.call_later(self.idle_timeout, self.evict)
+
+    def memory(self):
+        return sum(rss(pid) for pid in self._pending) + sum(
+            rss(pid) for _window, pid in self._ready
+        )
+
+    def _prune(self):
+        now = time.perf_counter()
+        for spawned in (self._pending, self._cold):
+            for pid, started in list(spawned.items()):
+                if now - started > self.spawn_timeout or not alive(pid):
+                    del spawned[pid]
+
+    def _spawn(self):
+        pid = self.qtile.cmd_spawn(self.command)
+        return pid if pid > 0 else None
+
+    def fill(self):
+        self._refill_handle = None
+        self._prune()
+        while len(self._ready) + len(self._pending) < self.size:
+            if self.memory() > self.max_rss:
+                logger.info("Terminal pool over its memory limit, not refilling")
+                return
+            pid = self._spawn()
+            if pid is None:
+                logger.warning("Unable to spawn %s for the terminal pool", self.command)
+                return
+            self._pending[pid] = time.perf_counter()
+
+    def evict(self, keep=0):
+        self._idle_handle = None
+        while len(self._ready) > keep:
+            window, _pid = self._ready.popleft()
+            window.kill()
+
+    def owns(self, window):
+        return any(w is window for w, _pid in self._ready)
+
+    def client_new(self, window):
+        # Called first on client_new. Returns True when the window is one of
+        # ours, in which case the other client_new hooks should leave it be.
+        pid = window.window.get_net_wm_pid()
+        if self._pending.pop(pid, None) is not None:
+            window.togroup(self.hidden_group)
+            self._ready.append((window, pid))
+            if self.memory() > self.max_rss:
+                self.evict(keep=len(self._ready) - 1)
+            return True
+        return False
+
+    def client_managed(self, window):
+        started = self._cold.pop(window.window.get_net_wm_pid(), None)
+        if started is not None:
+            sync(window.qtile, window)
+            self._record("cold", started)
+
+    def client_killed(self, window):
+        self._ready = deque((w, pid) for w, pid in self._ready if w is not window)
+
+    def _record(self, kind, started):
+        ms = (time.perf_counter() - started) * 1000
+        self.latencies.append((kind, ms))
+        logger.debug("terminal keypress-to-mapped (%s): %.1fms", kind, ms)
+
+    def open(self, qtile):
+        started = time.perf_counter()
+        self.qtile = qtile
+        self._touch()
+        self._prune()
+        if not self._ready:
+            pid = self._spawn()
+            if pid is not None:
+                self._cold[pid] = started
+        else:
+            window, _pid = self._ready.popleft()
+            target = (self.route(window) if self.route else None) or qtile.current_group.name
+            window.togroup(target)
+            group = qtile.groups_map[target]
+            group.cmd_toscreen(toggle=False)
+            group.focus(window, warp=False)
+            sync(qtile, window)
+            self._record("warm", started)
+        if self._refill_handle is None:
+            self._refill_handle = qtile.call_later(self.refill_delay, self.fill)
+
+    def report(self):
+        summary = {}
+        for kind in ("warm", "cold"):
+            samples = sorted(ms for k, ms in self.latencies if k == kind)
+            if samples:
+                summary[kind] = {
+                    "count": len(samples),
+                    "p50_ms": samples[len(samples) // 2],
+                    "max_ms": samples[-1],
+                }
+        summary["pooled"] = len(self._ready)
+        summary["pending"] = len(self._pending)
+        summary["rss_mb"] = self.memory() / (1024 * 1024)
+        return summary
+
+
+class DropdownPrewarm:
+    # Spawns a ScratchPad dropdown at startup through the ScratchPad's own
+    # commands and toggles it away again once qtile has managed its window,
+    # so the first real toggle finds it running. It is on screen only until
+    # the terminal has mapped, while the session is still starting. A spawn
+    # that hasn't mapped within ``timeout`` seconds is left alone, so a
+    # later, real toggle isn't hidden on arrival.
+
+    def __init__(self, scratchpad, name, timeout=30.0):
+        self.scratchpad = scratchpad
+        self.name = name
+        self.timeout = timeout
+        self._deadline = None
+
+    def start(self, qtile):
+        if self._deadline is not None and time.monotonic() < self._deadline:
+            # Already spawning it; qtile runs the config twice per reload.
+            return
+        group = qtile.groups_map.get(self.scratchpad)
+        if group is None or "window" in group.cmd_dropdown_info(self.name):
+            return
+        self._deadline = time.monotonic() + self.timeout
+        group.cmd_dropdown_toggle(self.name)
+
+    def client_managed(self, window):
+        if self._deadline is None:
+            return
+        if time.monotonic() > self._deadline:
+            self._deadline = None
+            return
+        group = window.qtile.groups_map[self.scratchpad]
+        info = group.cmd_dropdown_info(self.name)
+        if info.get("window", {}).get("id") != window.wid:
+            return
+        self._deadline = None
+        if info.get("visible"):
+            group.cmd_dropdown_toggle(self.name)
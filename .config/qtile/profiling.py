@@ -0,0 +1,153 @@
+"""Opt-in per-widget poll/draw timing for the bar."""
+
+import csv
+import json
+import os
+import time
+
+from libqtile.log_utils import logger
+
+
+class Histogram:
+    # Power-of-two microsecond buckets: bucket n holds samples < 2**n us.
+    size = 24
+
+    def __init__(self):
+        self.buckets = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = int(seconds * 1e6)
+        self.buckets[min(us.bit_length(), self.size - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile, in seconds.
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for n, hits in enumerate(self.buckets):
+            seen += hits
+            if seen >= target:
+                return (1 << n) / 1e6
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+            "buckets_us": {1 << n: hits for n, hits in enumerate(self.buckets) if hits},
+        }
+
+
+class WidgetProfiler:
+    # Widget method -> the column it is reported under. Nothing is wrapped
+    # until start(), so a disabled profiler costs nothing.
+    timed = {
+        "poll": "poll",
+        "draw": "draw",
+        "calculate_length": "layout",
+    }
+
+    def __init__(self):
+        self.stats = {}
+        self.started = None
+        self._wrapped = []
+
+    @property
+    def enabled(self):
+        return self.started is not None
+
+    def _wrap(self, name, kind, method):
+        hist = self.stats.setdefault(name, {}).setdefault(kind, Histogram())
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                hist.add(time.perf_counter() - start)
+
+        return timed
+
+    def start(self, qtile):
+        if self.enabled:
+            return
+        self.started = time.time()
+        for name, widget in qtile.widgets_map.items():
+            for method, kind in self.timed.items():
+                if callable(getattr(widget, method, None)):
+                    setattr(widget, method, self._wrap(name, kind, getattr(widget, method)))
+                    self._wrapped.append((widget, method))
+        logger.info("Widget profiling enabled for %d widgets", len(qtile.widgets_map))
+
+    def stop(self):
+        for widget, method in self._wrapped:
+            # Drop the instance attribute so the class method shows through.
+            widget.__dict__.pop(method, None)
+        self._wrapped = []
+        self.started = None
+
+    def take_over(self, previous, qtile):
+        # A reloaded config's profiler: the previous one's wrappers come off
+        # the finalized widgets, and profiling carries on over the new ones
+        # with the numbers so far.
+        enabled = previous.enabled
+        previous.stop()
+        self.stats = previous.stats
+        if enabled:
+            self.start(qtile)
+
+    def reset(self):
+        self.stats = {}
+
+    def summary(self):
+        return {
+            name: {kind: hist.as_dict() for kind, hist in kinds.items()}
+            for name, kinds in self.stats.items()
+        }
+
+    def dump(self, path=None):
+        path = path or os.path.expanduser("~/.cache/qtile/widget-profile")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        summary = self.summary()
+        with open(path + ".json", "w") as f:
+            json.dump(summary, f, indent=2)
+        with open(path + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["widget", "kind", "count", "total_ms", "mean_ms", "p50_ms", "p99_ms", "max_ms"])
+            for name, kinds in sorted(summary.items()):
+                for kind, row in sorted(kinds.items()):
+                    writer.writerow(
+                        [name, kind]
+                        + [row[k] for k in ("count", "total_ms", "mean_ms", "p50_ms", "p99_ms", "max_ms")]
+                    )
+        logger.info("Widget profile written to %s.{json,csv}", path)
+        return path
+
+
+profiler = WidgetProfiler()
+
+
+# Callables for lazy.function
+def toggle_profiling(qtile):
+    if profiler.enabled:
+        profiler.stop()
+        profiler.dump()
+    else:
+        profiler.reset()
+        profiler.start(qtile)
+
+
+def dump_profile(qtile):
+    profiler.dump()
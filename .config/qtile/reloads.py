@@ -0,0 +1,33 @@
+"""State kept on the qtile object, which outlives config reloads."""
+
+from libqtile.log_utils import logger
+
+
+# A reload re-imports every module of the config directory and runs
+# config.py again (twice, on current qtile), so module-level objects are new
+# each time. The qtile object is not, and neither are its windows.
+
+
+def kept(qtile):
+    # Outside a session qtile is a placeholder (or, in the harness, None)
+    # with nothing worth keeping; a throwaway dict stands in.
+    if not hasattr(qtile, "call_soon"):
+        return {}
+    store = getattr(qtile, "config_state", None)
+    if store is None:
+        store = qtile.config_state = {}
+    return store
+
+
+def replace(qtile, name, new, stop):
+    # Keep ``new`` as ``name``, stopping whatever an earlier config load
+    # kept there first.
+    store = kept(qtile)
+    old = store.get(name)
+    if old is not None and old is not new:
+        try:
+            stop(old)
+        except Exception:
+            logger.exception("Unable to stop the previous %s", name)
+    store[name] = new
+    return new
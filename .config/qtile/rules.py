@@ -0,0 +1,84 @@
+"""Window routing rules compiled into hash lookups with a regex fallback tier."""
+
+EXACT = ("wm_class", "title")
+
+
+def _exact_rule(match):
+    # A Match with a single plain-string wm_class or title rule can be
+    # answered with a dict lookup; anything else is kept for compare().
+    rules = getattr(match, "_rules", None)
+    if not rules or len(rules) != 1:
+        return None
+    (kind, value), = rules.items()
+    if kind in EXACT and isinstance(value, str):
+        return kind, value
+    return None
+
+
+class RuleEngine:
+    # Group matches and float rules, compiled once at config load. route()
+    # answers both questions for a client in one pass and remembers the
+    # answer until the client's title changes or it is killed.
+
+    def __init__(self, groups=(), float_rules=()):
+        self._group_exact = {kind: {} for kind in EXACT}
+        self._group_fallback = []
+        self._float_exact = {kind: set() for kind in EXACT}
+        self._float_fallback = []
+        self._routes = {}
+
+        # Earlier groups win, as they did when groups were scanned in order.
+        for priority, (name, matches) in enumerate(groups):
+            for match in matches or ():
+                exact = _exact_rule(match)
+                if exact is None:
+                    self._group_fallback.append((priority, name, match))
+                else:
+                    kind, value = exact
+                    self._group_exact[kind].setdefault(value, (priority, name))
+
+        for match in float_rules:
+            exact = _exact_rule(match)
+            if exact is None:
+                self._float_fallback.append(match)
+            else:
+                kind, value = exact
+                self._float_exact[kind].add(value)
+
+    def route(self, client):
+        title = client.name
+        cached = self._routes.get(client.wid)
+        if cached is not None and cached[0] == title:
+            return cached[1]
+
+        best = None
+        floating = False
+        for kind, values in (("wm_class", client.get_wm_class() or ()), ("title", (title,))):
+            groups = self._group_exact[kind]
+            floats = self._float_exact[kind]
+            for value in values:
+                hit = groups.get(value)
+                if hit is not None and (best is None or hit < best):
+                    best = hit
+                if value in floats:
+                    floating = True
+
+        for priority, name, match in self._group_fallback:
+            if best is not None and priority >= best[0]:
+                break
+            if match.compare(client):
+                best = (priority, name)
+                break
+
+        if not floating:
+            floating = any(match.compare(client) for match in self._float_fallback)
+
+        result = (best[1] if best else None, floating)
+        self._routes[client.wid] = (title, result)
+        return result
+
+    def floats(self, client):
+        return self.route(client)[1]
+
+    def forget(self, client):
+        self._routes.pop(client.wid, None)
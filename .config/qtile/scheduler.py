@@ -0,0 +1,117 @@
+"""One shared, boundary-aligned wakeup for every ticking bar widget."""
+
+import asyncio
+import time
+
+from qtile_extras import widget
+
+
+SECOND_CODES = ("%S", "%s", "%T", "%X", "%c", "%r", "%+")
+MINUTE_CODES = ("%M", "%R")
+HOUR_CODES = ("%H", "%I", "%k", "%l", "%p")
+
+
+def granularity(fmt):
+    # The coarsest boundary at which strftime(fmt) can change.
+    if any(code in fmt for code in SECOND_CODES):
+        return "second"
+    if any(code in fmt for code in MINUTE_CODES):
+        return "minute"
+    if any(code in fmt for code in HOUR_CODES):
+        return "hour"
+    return "day"
+
+
+def next_boundary(unit, now):
+    if unit == "second":
+        return int(now) + 1
+    if unit == "minute":
+        # Every real UTC offset is a whole number of minutes.
+        return (int(now) // 60 + 1) * 60
+    lt = time.localtime(now)
+    if unit == "hour":
+        return time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday, lt.tm_hour + 1, 0, 0, 0, 0, -1))
+    return time.mktime((lt.tm_year, lt.tm_mon, lt.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+
+
+class TickScheduler:
+    # Callbacks are registered against a boundary unit ("second", "minute",
+    # "hour", "day") or a plain period in seconds. Everything due at the same
+    # moment runs from one timer, and there is never more than one timer.
+
+    # Fire slightly after the boundary so strftime has definitely rolled over.
+    lag = 0.005
+    # Entries due this close together are run in the same wakeup.
+    slack = 0.05
+    # Wall-clock jumps (suspend, NTP) are caught up within this long.
+    max_sleep = 60.0
+
+    def __init__(self):
+        self._entries = {}
+        self._handle = None
+        self.wakeups = 0
+        self.ticks = 0
+
+    def _due(self, when, now):
+        if isinstance(when, str):
+            return next_boundary(when, now)
+        return now + when
+
+    def register(self, callback, when):
+        self._entries[callback] = [when, self._due(when, time.time())]
+        self._schedule()
+
+    def unregister(self, callback):
+        self._entries.pop(callback, None)
+        if not self._entries and self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if not self._entries:
+            return
+        soonest = min(due for _, due in self._entries.values())
+        delay = min(max(soonest - time.time(), 0) + self.lag, self.max_sleep)
+        self._handle = asyncio.get_event_loop().call_later(delay, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        self.wakeups += 1
+        now = time.time()
+        for callback, entry in list(self._entries.items()):
+            when, due = entry
+            if due <= now + self.slack:
+                entry[1] = self._due(when, now)
+                self.ticks += 1
+                callback()
+        self._schedule()
+
+    def refresh(self):
+        # Run everything now, e.g. after resuming from suspend.
+        now = time.time()
+        for callback, entry in list(self._entries.items()):
+            entry[1] = self._due(entry[0], now)
+            callback()
+        self._schedule()
+
+
+scheduler = TickScheduler()
+
+
+class ScheduledClock(widget.Clock):
+    # A Clock that ticks from the shared scheduler, only at the boundary its
+    # format needs (minute for "%I:%M %p", day for "%a, %b %d").
+
+    def timer_setup(self):
+        self.tick()
+        scheduler.register(self.tick, granularity(self.format))
+
+    def tick(self):
+        self.update(self.poll())
+
+    def finalize(self):
+        scheduler.unregister(self.tick)
+        widget.Clock.finalize(self)
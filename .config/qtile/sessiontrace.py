@@ -0,0 +1,133 @@
+"""Compact session traces, replayed headless by ``harness.py replay``."""
+
+import json
+import os
+import time
+
+from libqtile.log_utils import logger
+
+from pipeline import hook_pipeline
+
+
+def key_name(modifiers, key):
+    # ["mod4", "shift"], "Left" -> "mod4+shift+Left", the same for a trace
+    # and for the Key in config.py it has to be matched back to.
+    return "+".join((*sorted(modifiers), key))
+
+
+class SessionTrace:
+    # One JSON array per line, times in ms since start():
+    #
+    #     [t, "map", wid, [wm_class...], title, pid, [ppid, grandparent...]]
+    #     [t, "unmap", wid]
+    #     [t, "key", "mod4+shift+Left"]
+    #     [t, "group", name]
+    #     [t, "enter", wid]
+    #     [t, "title", wid, title]
+    #
+    # Map events carry the window's process ancestry, read from /proc off
+    # the loop, so swallowing replays the same way on another machine.
+    # Lines go through the hook pipeline, which keeps them in the order the
+    # events came in. Keys are seen by wrapping qtile.process_key_event
+    # between start() and stop(); the hook methods return at once when no
+    # trace is being recorded.
+
+    def __init__(self, path=None, ancestors=None, pipeline=None):
+        self.path = path or os.path.expanduser("~/.cache/qtile/trace.jsonl")
+        self.ancestors = ancestors
+        self.pipeline = pipeline or hook_pipeline
+        self.events = 0
+        self._file = None
+        self._start = 0.0
+        self._qtile = None
+        self._process_key_event = None
+
+    @property
+    def recording(self):
+        return self._file is not None
+
+    def start(self, qtile):
+        if self.recording:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "w", buffering=1)
+        except OSError as e:
+            logger.warning("Unable to record a trace to %s: %s", self.path, e)
+            return
+        self.events = 0
+        self._start = time.monotonic()
+        self._qtile = qtile
+        self._process_key_event = qtile.process_key_event
+
+        def process_key_event(keysym, mask):
+            key = qtile.keys_map.get((keysym, mask))
+            if key is not None:
+                self._record("key", key_name(key.modifiers, key.key))
+            return self._process_key_event(keysym, mask)
+
+        qtile.process_key_event = process_key_event
+        logger.info("Recording a session trace to %s", self.path)
+
+    def stop(self):
+        if not self.recording:
+            return
+        self._qtile.process_key_event = self._process_key_event
+        self._qtile = self._process_key_event = None
+        # Closed once the lines still in the pipeline are written.
+        trace, self._file = self._file, None
+        self.pipeline.submit("trace", None, commit=lambda _result: trace.close())
+        logger.info("Recorded %d events to %s", self.events, self.path)
+
+    def _now(self):
+        return round((time.monotonic() - self._start) * 1000)
+
+    def _record(self, *event, read=None, args=()):
+        trace = self._file
+        event = [self._now(), *event]
+        self.events += 1
+
+        def write(result):
+            line = event if read is None else event + [result]
+            trace.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+        self.pipeline.submit("trace", read, *args, commit=write)
+
+    # Called from config.py's hooks
+
+    def map(self, window):
+        if not self.recording:
+            return
+        pid = window.window.get_net_wm_pid() or 0
+        event = ("map", window.wid, window.get_wm_class() or [], window.name, pid)
+        if self.ancestors is not None and pid:
+            self._record(*event, read=self.ancestors, args=(pid,))
+        else:
+            self._record(*event, [])
+
+    def unmap(self, window):
+        if self.recording:
+            self._record("unmap", window.wid)
+
+    def group(self, name):
+        if self.recording:
+            self._record("group", name)
+
+    def enter(self, window):
+        if self.recording:
+            self._record("enter", window.wid)
+
+    def title(self, window):
+        if self.recording:
+            self._record("title", window.wid, window.name)
+
+
+session_trace = SessionTrace()
+
+
+# Callable for lazy.function
+def toggle_trace(qtile):
+    if session_trace.recording:
+        session_trace.stop()
+    else:
+        session_trace.start(qtile)
@@ -0,0 +1,30 @@
+"""Section timings for config load."""
+
+import time
+
+from libqtile.log_utils import logger
+
+
+class SectionTimer:
+    # config.py calls mark() after each section; the harness and the log
+    # both read the resulting (section, milliseconds) pairs.
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.sections = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.sections.append((name, (now - self._last) * 1000))
+        self._last = now
+
+    @property
+    def total(self):
+        return (self._last - self.started) * 1000
+
+    def done(self):
+        logger.debug(
+            "config loaded in %.1fms (%s)",
+            self.total,
+            ", ".join("{} {:.1f}ms".format(name, ms) for name, ms in self.sections),
+        )
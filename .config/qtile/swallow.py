@@ -0,0 +1,213 @@
+"""Incremental pid index and cached process ancestry for window swallowing."""
+
+import threading
+import weakref
+from collections import OrderedDict
+
+
+class PpidCache:
+    # Bounded LRU of process ancestry, keyed on (pid, starttime) from
+    # /proc/<pid>/stat, so a reused pid never hits the entry of the process
+    # that had it before. Lookups may come from a hook worker thread, hence
+    # the lock; /proc is read outside it.
+    #
+    # An ancestor whose starttime is known is not read again: a pid can
+    # only be reused once allocation wraps around pid_max, and a wrap shows
+    # as a process newer than any seen so far with a lower pid than the
+    # newest one. Each wrap starts a new generation, and starttimes learned
+    # in an earlier one are read again on their next use. So a lookup
+    # normally reads the new process's stat alone; its parent (a terminal,
+    # a shell) has usually been looked up already, with its chain. A wrap
+    # that goes unseen would take a whole cycle of pid_max spawns between
+    # two lookups.
+    #
+    # A cached chain is not revisited when one of its ancestors exits and
+    # the process is reparented; it ages out of the LRU instead.
+
+    def __init__(self, maxsize=4096, proc="/proc"):
+        self.maxsize = maxsize
+        self.proc = proc
+        self.reads = 0
+        self.generation = 0
+        self._cache = OrderedDict()
+        self._starts = {}
+        self._newest = (0, 0)
+        self._lock = threading.Lock()
+
+    def __call__(self, pid, depth):
+        # pid's ancestors, nearest first, at most ``depth`` of them. pid is
+        # a new window's process, so its stat is always read; that read is
+        # also what notices a wrap.
+        if depth <= 0:
+            return []
+        ppid, start = self._read(pid)
+        return self._chain(pid, ppid, start, depth)
+
+    def _chain(self, pid, ppid, start, depth):
+        if not ppid:
+            return []
+        key = (pid, start)
+        with self._lock:
+            self._starts[pid] = key
+            chain = self._cache.get(key)
+            if chain is not None:
+                self._cache.move_to_end(key)
+        if chain is None:
+            chain = [ppid, *self._ancestors(ppid, depth - 1)]
+            with self._lock:
+                self._cache[key] = chain
+                if len(self._cache) > self.maxsize:
+                    (old, _), _ = self._cache.popitem(last=False)
+                    if self._starts.get(old) not in self._cache:
+                        self._starts.pop(old, None)
+        return chain[:depth]
+
+    def _ancestors(self, pid, depth):
+        if depth <= 0:
+            return []
+        with self._lock:
+            key = self._starts.get(pid)
+            chain = self._cache.get(key) if key is not None else None
+            if chain is not None:
+                self._cache.move_to_end(key)
+        if chain is not None:
+            return chain[:depth]
+        ppid, start = self._read(pid)
+        return self._chain(pid, ppid, start, depth)
+
+    def _read(self, pid):
+        # (ppid, starttime), or (0, 0) once the process is gone.
+        self.reads += 1
+        try:
+            with open("{}/{}/stat".format(self.proc, pid), "rb") as f:
+                stat = f.read()
+        except OSError:
+            return 0, 0
+        # comm may contain spaces and parentheses, so split after the last ")".
+        fields = stat[stat.rfind(b")") + 2:].split()
+        try:
+            ppid, start = int(fields[1]), int(fields[19])
+        except (IndexError, ValueError):
+            return 0, 0
+        with self._lock:
+            if start >= self._newest[0]:
+                if pid < self._newest[1]:
+                    # Wrapped: every pid may have been handed out again.
+                    self.generation += 1
+                    self._starts.clear()
+                self._newest = (start, pid)
+        return ppid, start
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class SwallowIndex:
+    # pid -> windows for every managed client, kept up to date from
+    # client_new/client_killed instead of being rebuilt per window. One
+    # process can own several windows (single-instance terminals,
+    # browsers); the most recently mapped one is taken as the parent.
+
+    def __init__(self, depth=5, ppid=None):
+        self.depth = depth
+        self.ppid = ppid if ppid is not None else PpidCache()
+        self._windows = {}
+        self._pids = {}
+        self._seeded = False
+
+    def seed(self, windows_map):
+        # Windows managed before this config was loaded never went through
+        # our client_new hook, so pick them up once.
+        if self._seeded:
+            return
+        self._seeded = True
+        for wid, client in windows_map.items():
+            if wid not in self._pids and hasattr(client, "window"):
+                self.add(client)
+
+    def add(self, window):
+        pid = window.window.get_net_wm_pid()
+        if pid:
+            # A dict keyed by wid: a set that remembers mapping order.
+            self._windows.setdefault(pid, {})[window.wid] = window
+            self._pids[window.wid] = pid
+        return pid
+
+    def remove(self, window):
+        pid = self._pids.pop(window.wid, None)
+        if pid is None:
+            return
+        windows = self._windows.get(pid)
+        if windows is not None:
+            windows.pop(window.wid, None)
+            if not windows:
+                del self._windows[pid]
+
+    def ancestors(self, pid):
+        # Only reads /proc, so it can run off the event loop.
+        return self.ppid(pid, self.depth) if pid else []
+
+    def parent_in(self, ancestors):
+        for ppid in ancestors:
+            windows = self._windows.get(ppid)
+            if windows:
+                return next(reversed(windows.values()))
+        return None
+
+    def find_parent(self, pid):
+        return self.parent_in(self.ancestors(pid))
+
+    def __len__(self):
+        return len(self._pids)
+
+
+class SwallowRegistry:
+    # Which window swallowed which. The links are kept on the windows
+    # themselves, through weak references only: a config reload brings a
+    # new registry but leaves qtile's windows, and their links, as they
+    # were, and a killed client is never kept alive by a link.
+    #
+    # A parent stays minimized while any window that swallowed it is alive.
+    # When a swallowed window itself dies (a chain A <- B <- C losing B),
+    # its swallowers are relinked to its own parent, so A comes back when C
+    # closes rather than while C is still on screen.
+
+    @staticmethod
+    def _swallowers(window, create=False):
+        children = getattr(window, "swallow_children", None)
+        if children is None and create:
+            children = window.swallow_children = weakref.WeakSet()
+        return children
+
+    def swallow(self, child, parent):
+        child.swallow_parent = weakref.ref(parent)
+        self._swallowers(parent, create=True).add(child)
+        parent.minimized = True
+
+    def parent(self, window):
+        ref = getattr(window, "swallow_parent", None)
+        return ref() if ref is not None else None
+
+    def swallowers(self, window):
+        return len(self._swallowers(window) or ())
+
+    def release(self, window):
+        # client_killed: give the parent back, or hand it on to whoever
+        # swallowed this window.
+        parent = self.parent(window)
+        children = self._swallowers(window)
+        window.swallow_parent = window.swallow_children = None
+        if parent is not None:
+            self._swallowers(parent).discard(window)
+        for child in list(children or ()):
+            if parent is None:
+                child.swallow_parent = None
+                continue
+            child.swallow_parent = weakref.ref(parent)
+            self._swallowers(parent).add(child)
+        if parent is not None and not self._swallowers(parent):
+            parent.minimized = False
+        return parent
+
+
+swallow_registry = SwallowRegistry()
@@ -0,0 +1,174 @@
+"""Process-wide LRU cache of rendered bar text."""
+
+from collections import OrderedDict
+
+from libqtile.log_utils import logger
+
+
+# Room around the logical extents for glyph overhang and the font shadow.
+PAD = 4
+
+
+class TextCache:
+    # Every widget draws its text through a libqtile TextLayout, which has
+    # pango shape and rasterise it again on every frame even though most of
+    # the bar is the same few dozen icons and labels. install() wraps
+    # TextLayout.draw so a layout is rendered once into an ARGB surface,
+    # keyed by (font, size, markup, text, colour, shadow, width, alignment),
+    # and later frames only blit that surface. Entries are dropped least
+    # recently used first once they take more than ``max_bytes``.
+    #
+    # Palette colours are [hex, hex] lists and count as the solid colour
+    # they are; real gradients (lists of different colours) are drawn the
+    # normal way, uncached. Pango has no alignment getter in libqtile's
+    # bindings, so install() also records it as it is set.
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._draw = None
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def install(self):
+        if self._draw is not None:
+            return
+        try:
+            self._install()
+        except Exception:
+            # Nothing is patched until every piece was found, so the bar
+            # draws the stock way.
+            logger.exception("Bar text cache disabled")
+
+    def _install(self):
+        from libqtile import pangocffi
+
+        try:
+            from libqtile.backend.base.drawer import TextLayout
+        except ImportError:
+            # qtile 0.22 keeps the drawer in libqtile/backend/base.py.
+            from libqtile.backend.base import TextLayout
+
+        pango = pangocffi.PangoLayout
+        # A reloaded config brings a new cache; it wraps the originals, not
+        # the previous cache's wrappers.
+        originals = getattr(TextLayout, "_uncached", None)
+        if originals is None:
+            originals = (TextLayout.draw, TextLayout.text, pango.set_alignment)
+        draw_uncached, text, set_alignment = originals
+        cache = self
+
+        def align(self, alignment):
+            self._cache_alignment = alignment
+            set_alignment(self, alignment)
+
+        def set_text(self, value):
+            # The markup source, since layout.text only returns plain text.
+            self._cache_source = value
+            text.fset(self, value)
+
+        def draw(self, x, y):
+            cache.draw(self, x, y)
+
+        TextLayout._uncached = originals
+        TextLayout.text = property(text.fget, set_text)
+        TextLayout.draw = draw
+        pango.set_alignment = align
+        self._draw = draw_uncached
+
+    @staticmethod
+    def _colour(layout):
+        colour = layout.colour
+        if isinstance(colour, list):
+            return colour[0] if len(set(colour)) == 1 else None
+        return colour
+
+    def _key(self, layout):
+        colour = self._colour(layout)
+        if colour is None:
+            return None
+        source = getattr(layout, "_cache_source", None)
+        alignment = getattr(layout.layout, "_cache_alignment", None)
+        if source is None or alignment is None:
+            return None
+        return (
+            layout.font_family,
+            layout.font_size,
+            layout.markup,
+            source,
+            colour,
+            layout.font_shadow,
+            layout._width,
+            alignment,
+        )
+
+    def draw(self, layout, x, y):
+        key = self._key(layout)
+        if key is None:
+            return self._draw(layout, x, y)
+        surface = self._entries.get(key)
+        if surface is None:
+            self.misses += 1
+            surface = self._render(layout)
+            self._entries[key] = surface
+            self.bytes += surface.get_stride() * surface.get_height()
+            self._evict()
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        ctx = layout.drawer.ctx
+        ctx.save()
+        ctx.set_source_surface(surface, x - PAD, y - PAD)
+        ctx.rectangle(x - PAD, y - PAD, surface.get_width(), surface.get_height())
+        ctx.fill()
+        ctx.restore()
+
+    def _render(self, layout):
+        import cairocffi
+        from libqtile import pangocffi
+        from libqtile.utils import rgb
+
+        width, height = layout.layout.get_pixel_size()
+        surface = cairocffi.ImageSurface(
+            cairocffi.FORMAT_ARGB32, width + PAD * 2 + 1, height + PAD * 2 + 1
+        )
+        ctx = pangocffi.patch_cairo_context(cairocffi.Context(surface))
+        if layout.font_shadow is not None:
+            ctx.set_source_rgba(*rgb(layout.font_shadow))
+            ctx.move_to(PAD + 1, PAD + 1)
+            ctx.show_layout(layout.layout)
+        ctx.set_source_rgba(*rgb(self._colour(layout)))
+        ctx.move_to(PAD, PAD)
+        ctx.show_layout(layout.layout)
+        surface.flush()
+        return surface
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _key, surface = self._entries.popitem(last=False)
+            self.bytes -= surface.get_stride() * surface.get_height()
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def report(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+
+text_cache = TextCache()
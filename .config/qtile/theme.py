@@ -0,0 +1,262 @@
+"""Precompiled palettes switched live across the bar, layouts, kitty and dunst."""
+
+import os
+import time
+from collections import deque
+
+from libqtile.log_utils import logger
+
+
+# Bar palette slots, in the order config.py indexes ``colors``.
+SLOTS = (
+    "background",
+    "foreground",
+    "background lighter",
+    "red",
+    "green",
+    "yellow",
+    "blue",
+    "magenta",
+    "cyan",
+    "white",
+    "grey",
+    "orange",
+    "super cyan",
+    "super blue",
+    "super dark background",
+    "bar border",
+)
+
+# Layout attribute -> palette slot. Layouts take plain strings (a list
+# would mean several borders), so these are set on every layout instance.
+LAYOUT_ROLES = {
+    "border_focus": 13,
+    "border_normal": 2,
+    "border_focus_stack": 13,
+    "border_normal_stack": 2,
+}
+
+THEMES = {
+    "super": {
+        "colors": [
+            "#121216", "#EAF4F4", "#333D47", "#FE3D20", "#39FF14", "#FFFC47",
+            "#90E0EF", "#E2B6CF", "#79A9D1", "#FDFFFC", "#7A7D90", "#FA8638",
+            "#86E9CB", "#30A3E0", "#242831", "#3B4252",
+        ],
+        "kitty": {
+            "background": "#121216",
+            "foreground": "#ffffff",
+            "cursor": "#ffffff",
+            "colors": [
+                "#1b1d1e", "#f92672", "#82b414", "#fd971f", "#0066cc", "#8c54fe",
+                "#465457", "#ccccc6", "#505354", "#ff5995", "#b6e354", "#feed6c",
+                "#333399", "#9e6ffe", "#899ca1", "#f8f8f2",
+            ],
+            "selection_foreground": "#BD99FF",
+            "selection_background": "#333D47",
+            "url_color": "#6498EF",
+        },
+        "dunst": {
+            "background": "#121216",
+            "foreground": "#EAF4F4",
+            "frame": "#30A3E0",
+            "critical_frame": "#f92672",
+        },
+    },
+    "nord": {
+        "colors": [
+            "#2E3440", "#ECEFF4", "#3B4252", "#BF616A", "#A3BE8C", "#EBCB8B",
+            "#81A1C1", "#B48EAD", "#88C0D0", "#E5E9F0", "#4C566A", "#D08770",
+            "#8FBCBB", "#5E81AC", "#272C36", "#4C566A",
+        ],
+        "kitty": {
+            "background": "#2E3440",
+            "foreground": "#D8DEE9",
+            "cursor": "#D8DEE9",
+            "colors": [
+                "#3B4252", "#BF616A", "#A3BE8C", "#EBCB8B", "#81A1C1", "#B48EAD",
+                "#88C0D0", "#E5E9F0", "#4C566A", "#BF616A", "#A3BE8C", "#EBCB8B",
+                "#81A1C1", "#B48EAD", "#8FBCBB", "#ECEFF4",
+            ],
+            "selection_foreground": "#ECEFF4",
+            "selection_background": "#434C5E",
+            "url_color": "#88C0D0",
+        },
+        "dunst": {
+            "background": "#2E3440",
+            "foreground": "#ECEFF4",
+            "frame": "#5E81AC",
+            "critical_frame": "#BF616A",
+        },
+    },
+}
+
+
+def parse(colour):
+    # "#RRGGBB[AA]" or "RRGGBB[AA]" -> (r, g, b, a) in 0..1.
+    value = colour.lstrip("#")
+    if len(value) not in (6, 8):
+        raise ValueError("Bad colour {!r}".format(colour))
+    channels = [int(value[i:i + 2], 16) / 255 for i in range(0, len(value), 2)]
+    return tuple(channels) if len(channels) == 4 else (*channels, 1.0)
+
+
+class Theme:
+    # Everything a switch needs, worked out once: colours as hex and as
+    # parsed RGBA, the layout border strings, and the kitty and dunst files
+    # as text.
+
+    def __init__(self, name, spec):
+        if len(spec["colors"]) != len(SLOTS):
+            raise ValueError("Theme {} needs {} colours".format(name, len(SLOTS)))
+        self.name = name
+        self.rgba = [parse(colour) for colour in spec["colors"]]
+        self.colors = list(spec["colors"])
+        self.layout = {attr: self.colors[slot] for attr, slot in LAYOUT_ROLES.items()}
+        self.kitty = self._kitty(spec["kitty"])
+        self.dunst = self._dunst(spec["dunst"])
+
+    def _kitty(self, spec):
+        for colour in (spec["background"], spec["foreground"], *spec["colors"]):
+            parse(colour)
+        lines = ["# Generated by qtile's theme engine ({}); edit theme.py instead.".format(self.name)]
+        for key in ("background", "foreground", "cursor"):
+            lines.append("{:<10} {}".format(key, spec[key]))
+        for index, colour in enumerate(spec["colors"]):
+            lines.append("{:<10} {}".format("color{}".format(index), colour))
+        for key in ("selection_foreground", "selection_background", "url_color"):
+            lines.append("{} {}".format(key, spec[key]))
+        return "\n".join(lines) + "\n"
+
+    def _dunst(self, spec):
+        for colour in spec.values():
+            parse(colour)
+        return (
+            "# Written by qtile's theme engine ({name}).\n"
+            "[global]\n"
+            '    frame_color = "{frame}"\n'
+            "[urgency_low]\n"
+            '    background = "{background}"\n'
+            '    foreground = "{foreground}"\n'
+            "[urgency_normal]\n"
+            '    background = "{background}"\n'
+            '    foreground = "{foreground}"\n'
+            "[urgency_critical]\n"
+            '    background = "{background}"\n'
+            '    foreground = "{foreground}"\n'
+            '    frame_color = "{critical_frame}"\n'
+        ).format(name=self.name, **spec)
+
+
+class ThemeEngine:
+    # ``colors`` is the list config.py hands to widgets, decorations and
+    # GroupBox settings. Its [hex, hex] entries are never replaced, only
+    # refilled, so a switch reaches every widget holding one of them; the
+    # layouts' string colours are set directly. Everything is then repainted
+    # once: one draw per bar and one relayout per visible group. ``rgba``
+    # holds the same slots already parsed, for code drawing on its own
+    # (qtile's widgets and layouts only take hex).
+    #
+    # kitty and dunst get generated include files next to their tracked
+    # configs (kitty.conf includes theme.conf; dunst reads dunstrc.d), and
+    # are only told to reload when their file actually changed. The active
+    # theme name is kept in ``state`` so a restart or a full reload comes
+    # back up in it.
+
+    def __init__(self, themes=THEMES, state=None, kitty=None, dunst=None):
+        self.themes = {name: Theme(name, spec) for name, spec in themes.items()}
+        self.state = state or os.path.expanduser("~/.cache/qtile/theme")
+        self.kitty = kitty or os.path.expanduser("~/.config/kitty/theme.conf")
+        self.dunst = dunst or os.path.expanduser("~/.config/dunst/dunstrc.d/90-theme.conf")
+        self.latency = deque(maxlen=32)
+        self.active = self._load()
+        self.colors = [[colour, colour] for colour in self.themes[self.active].colors]
+        self.rgba = list(self.themes[self.active].rgba)
+
+    def _load(self):
+        try:
+            with open(self.state) as f:
+                name = f.read().strip()
+        except OSError:
+            name = None
+        return name if name in self.themes else next(iter(self.themes))
+
+    def color(self, slot):
+        return self.colors[slot][0]
+
+    def switch(self, qtile, name):
+        start = time.perf_counter()
+        theme = self.themes[name]
+        for pair, colour in zip(self.colors, theme.colors):
+            pair[:] = [colour, colour]
+        self.rgba[:] = theme.rgba
+
+        for group in qtile.groups:
+            for layout in (*group.layouts, group.floating_layout):
+                for attr, colour in theme.layout.items():
+                    if hasattr(layout, attr):
+                        setattr(layout, attr, colour)
+
+        border = self.color(SLOTS.index("bar border"))
+        for screen in qtile.screens:
+            for position in ("top", "bottom", "left", "right"):
+                bar = getattr(screen, position, None)
+                if not hasattr(bar, "widgets"):
+                    continue
+                if isinstance(bar.border_color, list):
+                    bar.border_color = [border] * len(bar.border_color)
+                else:
+                    bar.border_color = border
+                bar.draw()
+            if screen.group is not None:
+                screen.group.layout_all()
+        repaint = time.perf_counter()
+
+        changed = self._emit(theme)
+        if self.kitty in changed:
+            qtile.cmd_spawn(["pkill", "-USR1", "-x", "kitty"])
+        if self.dunst in changed:
+            qtile.cmd_spawn(["dunstctl", "reload"])
+        self.active = name
+        end = time.perf_counter()
+        self.latency.append((name, (repaint - start) * 1000, (end - start) * 1000))
+        logger.info(
+            "Theme %s: repainted in %.1fms, %.1fms with kitty/dunst files",
+            name,
+            (repaint - start) * 1000,
+            (end - start) * 1000,
+        )
+
+    def _emit(self, theme):
+        # Returns the paths whose contents changed.
+        changed = []
+        for path, text in ((self.kitty, theme.kitty), (self.dunst, theme.dunst), (self.state, theme.name)):
+            try:
+                with open(path) as f:
+                    if f.read() == text:
+                        continue
+            except OSError:
+                pass
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = path + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(text)
+                os.replace(tmp, path)
+            except OSError as e:
+                logger.warning("Unable to write %s: %s", path, e)
+                continue
+            changed.append(path)
+        return changed
+
+    def next(self, qtile):
+        names = list(self.themes)
+        self.switch(qtile, names[(names.index(self.active) + 1) % len(names)])
+
+
+theme_engine = ThemeEngine()
+
+
+# Callable for lazy.function
+def next_theme(qtile):
+    theme_engine.next(qtile)
@@ -0,0 +1,170 @@
+"""Columns and Spiral with their geometry memoized."""
+
+from collections import OrderedDict
+
+from libqtile import layout
+
+
+class GeometryCache:
+    # Shared by every group's copy of a layout. Keys carry everything the
+    # geometry depends on (layout parameters, window count, screen rect,
+    # ratios), never the windows themselves, so a layout that comes back to
+    # a shape it had before, or another group with the same shape, reuses it.
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self._entries[key] = compute()
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def report(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+geometry_cache = GeometryCache()
+
+
+class Columns(layout.Columns):
+    # Upstream works out each window's rectangle from scratch in configure(),
+    # walking the columns and the client's column on every call, which is
+    # quadratic per relayout (every focus change). Here layout() walks the
+    # columns once, looks the grid for that shape up in the cache, and
+    # configure() only reads its client's slot.
+
+    _frame = None
+
+    def layout(self, windows, screen_rect):
+        self._frame = self._prepare(screen_rect)
+        try:
+            layout.Columns.layout(self, windows, screen_rect)
+        finally:
+            self._frame = None
+
+    def _prepare(self, screen_rect):
+        slots = {}
+        shape = []
+        for index, col in enumerate(self.columns):
+            for row, client in enumerate(col):
+                slots[client] = (index, row)
+            shape.append((col.width, tuple(col.heights[c] for c in col) if col.split else None))
+        shape = tuple(shape)
+        key = ("columns", screen_rect.x, screen_rect.y, screen_rect.width, screen_rect.height, shape)
+        grid = geometry_cache.get(key, lambda: self._compute_grid(screen_rect, shape))
+        return screen_rect, grid, slots
+
+    @staticmethod
+    def _compute_grid(screen_rect, shape):
+        grid = []
+        pos = 0
+        for width, heights in shape:
+            x = screen_rect.x + int(0.5 + pos * screen_rect.width * 0.01 / len(shape))
+            w = int(0.5 + width * screen_rect.width * 0.01 / len(shape))
+            pos += width
+            rows = None
+            if heights is not None:
+                rows = []
+                row_pos = 0
+                for height in heights:
+                    y = screen_rect.y + int(0.5 + row_pos * screen_rect.height * 0.01 / len(heights))
+                    h = int(0.5 + height * screen_rect.height * 0.01 / len(heights))
+                    rows.append((y, h))
+                    row_pos += height
+            grid.append((x, w, rows))
+        return grid
+
+    def _single(self):
+        # Border and margin for a lone window. Older qtile has neither
+        # option; newer resolves single_border_width from border_on_single
+        # when the layout is built.
+        border = getattr(self, "single_border_width", None)
+        margin = getattr(self, "margin_on_single", None)
+        return (
+            self.border_width if border is None else border,
+            self.margin if margin is None else margin,
+        )
+
+    def configure(self, client, screen_rect):
+        frame = self._frame
+        if frame is None or frame[0] is not screen_rect:
+            # Called outside layout(), e.g. by a single-window refresh.
+            frame = self._prepare(screen_rect)
+        _rect, grid, slots = frame
+        slot = slots.get(client)
+        if slot is None:
+            client.hide()
+            return
+        index, row = slot
+        col = self.columns[index]
+
+        if client.has_focus:
+            color = self.border_focus if col.split else self.border_focus_stack
+        else:
+            color = self.border_normal if col.split else self.border_normal_stack
+
+        if len(self.columns) == 1 and (len(col) == 1 or not col.split):
+            border, margin_size = self._single()
+        else:
+            border, margin_size = self.border_width, self.margin
+
+        x, width, rows = grid[index]
+        if col.split:
+            y, height = rows[row]
+            client.place(
+                x, y, width - 2 * border, height - 2 * border, border, color, margin=margin_size
+            )
+            client.unhide()
+        elif client == col.cw:
+            client.place(
+                x,
+                screen_rect.y,
+                width - 2 * border,
+                screen_rect.height - 2 * border,
+                border,
+                color,
+                margin=margin_size,
+            )
+            client.unhide()
+        else:
+            client.hide()
+
+
+class Spiral(layout.Spiral):
+    # Spiral already keeps its last result until a window is added or
+    # removed or a ratio changes; the memo also covers returning to an
+    # earlier shape (closing the terminal just opened, undoing a grow) and
+    # the other groups' copies of the layout.
+
+    def get_spiral(self, x, y, width, height):
+        key = (
+            "spiral",
+            x,
+            y,
+            width,
+            height,
+            len(self.clients),
+            self.ratio,
+            self.main_pane_ratio,
+            tuple(self.splits),
+            self.main_pane,
+            self.clockwise,
+            self.border_width,
+            str(self.margin),
+        )
+        compute = super().get_spiral
+        return geometry_cache.get(key, lambda: compute(x, y, width, height))
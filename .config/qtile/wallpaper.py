@@ -0,0 +1,178 @@
+"""Wallpapers painted once per output, from raw surfaces pre-scaled on disk."""
+
+import hashlib
+import mmap
+import os
+import struct
+
+from libqtile.log_utils import logger
+
+from reloads import kept
+
+
+# magic, width, height, stride; ARGB32 rows follow.
+HEADER = struct.Struct("<4sIII")
+MAGIC = b"QWP1"
+
+
+def write_raw(path, width, height, stride, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, width, height, stride))
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_raw(path, width, height):
+    # (stride, mapping) of the surface written to ``path``, or None when it
+    # is missing, truncated or for another size. The mapping is
+    # copy-on-write, so cairo may take it as a writable buffer while the
+    # pages stay shared with the page cache.
+    try:
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    except (OSError, ValueError):
+        # ValueError: an empty file cannot be mapped.
+        return None
+    if len(mapping) >= HEADER.size:
+        magic, w, h, stride = HEADER.unpack_from(mapping)
+        if magic == MAGIC and (w, h) == (width, height) and len(mapping) == HEADER.size + stride * h:
+            return stride, mapping
+    mapping.close()
+    return None
+
+
+class WallpaperCache:
+    # Each output remembers the (path, mtime, width, height, mode) it was
+    # last painted with, so a config reload or a screens_reconfigured that
+    # leaves an output as it was costs one stat and no paint. A changed
+    # path, a touched file or a new resolution paints again. What was
+    # painted is kept on the qtile object, since a reload brings a new
+    # cache.
+    #
+    # The image is decoded and scaled to the output once, and the result
+    # kept on disk under the same key as a raw ARGB32 surface. Later paints
+    # of that key, in this session or the next, map the file and hand it to
+    # the painter as it is: no decode, no scaling. Painting a surface needs
+    # qtile's X11 painter; elsewhere qtile paints the file itself.
+
+    def __init__(self, directory=None, max_entries=6):
+        self.directory = directory or os.path.expanduser("~/.cache/qtile/wallpapers")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.paints = 0
+        self.skipped = 0
+
+    def target(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".argb")
+
+    # cairocffi is only imported once a wallpaper actually has to be painted.
+
+    def get(self, key):
+        import cairocffi
+
+        path, _mtime, width, height, mode = key
+        target = self.target(key)
+        raw = read_raw(target, width, height)
+        if raw is not None:
+            stride, mapping = raw
+            self.hits += 1
+            os.utime(target)
+            return cairocffi.ImageSurface.create_for_data(
+                memoryview(mapping)[HEADER.size:], cairocffi.FORMAT_ARGB32, width, height, stride
+            )
+        surface = self._render(path, width, height, mode)
+        surface.flush()
+        os.makedirs(self.directory, exist_ok=True)
+        write_raw(target, width, height, surface.get_stride(), bytes(surface.get_data()))
+        self.misses += 1
+        self._evict()
+        return surface
+
+    def _render(self, path, width, height, mode):
+        # The same placement as qtile's own painter.
+        import cairocffi
+        import cairocffi.pixbuf
+
+        with open(path, "rb") as f:
+            image, _ = cairocffi.pixbuf.decode_to_image_surface(f.read())
+        surface = cairocffi.ImageSurface(cairocffi.FORMAT_ARGB32, width, height)
+        context = cairocffi.Context(surface)
+        image_w, image_h = image.get_width(), image.get_height()
+        if mode == "fill":
+            width_ratio = width / image_w
+            if width_ratio * image_h >= height:
+                context.scale(width_ratio)
+            else:
+                height_ratio = height / image_h
+                context.translate(-(image_w * height_ratio - width) // 2, 0)
+                context.scale(height_ratio)
+            context.set_source_surface(image)
+        elif mode == "stretch":
+            context.scale(sx=width / image_w, sy=height / image_h)
+            context.set_source_surface(image)
+        elif mode == "center":
+            context.set_source_surface(image, x=(width - image_w) / 2, y=(height - image_h) / 2)
+        else:
+            context.set_source_surface(image)
+        context.paint()
+        return surface
+
+    def _evict(self):
+        try:
+            entries = [
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".argb")
+            ]
+        except OSError:
+            return
+        entries.sort(key=lambda p: os.stat(p).st_mtime, reverse=True)
+        for stale in entries[self.max_entries:]:
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _paint_surface(painter, screen, image):
+        # xcbq.Painter.paint() without the decode and the scaling.
+        import cairocffi
+
+        root_pixmap, surface = painter._get_root_pixmap_and_surface(screen)
+        context = cairocffi.Context(surface)
+        with context:
+            context.translate(screen.x, screen.y)
+            context.set_source_surface(image)
+            context.paint()
+        surface.finish()
+        painter._update_root_pixmap(root_pixmap)
+
+    def paint(self, screen, path, mode):
+        path = os.path.expanduser(path)
+        try:
+            key = (path, os.stat(path).st_mtime_ns, screen.width, screen.height, mode)
+        except OSError as e:
+            logger.warning("Wallpaper %s unavailable: %s", path, e)
+            return
+        painted = kept(screen.qtile).setdefault("wallpapers", {})
+        if painted.get(screen.index) == key:
+            self.skipped += 1
+            return
+        painter = getattr(screen.qtile.core, "painter", None)
+        if hasattr(painter, "_get_root_pixmap_and_surface"):
+            try:
+                self._paint_surface(painter, screen, self.get(key))
+            except (OSError, ImportError, ValueError) as e:
+                # ValueError covers cairocffi.pixbuf.ImageLoadingError.
+                logger.warning("Wallpaper cache unavailable, painting %s directly: %s", path, e)
+                screen.cmd_set_wallpaper(path, mode)
+        else:
+            screen.cmd_set_wallpaper(path, mode)
+        self.paints += 1
+        painted[screen.index] = key
+
+
+wallpaper_cache = WallpaperCache()
@@ -0,0 +1,84 @@
+"""A WindowName that coalesces title changes and keeps a stable width."""
+
+import time
+
+from libqtile import bar
+from qtile_extras import widget
+
+
+class StableWindowName(widget.WindowName):
+    # Title changes are drawn at most once per ``latency`` seconds: the
+    # first change after a quiet period is drawn at once, anything arriving
+    # while that budget runs is folded into one trailing draw carrying the
+    # latest title.
+    #
+    # The widget occupies a slot rounded up to ``slot_step`` pixels. It
+    # grows as soon as a title no longer fits, but only shrinks once the
+    # title would leave more than ``hysteresis`` of it empty, so most title
+    # changes repaint this widget alone instead of relaying out the bar.
+    # The title is centred in the slot, as the CALCULATED widget was
+    # between its spacers.
+    defaults = [
+        ("latency", 0.1, "Longest a title change waits before it is drawn"),
+        ("slot_step", 48, "Slot width is a multiple of this many pixels"),
+        ("hysteresis", 0.3, "Fraction of the slot left empty before it shrinks"),
+    ]
+
+    def __init__(self, width=bar.CALCULATED, **config):
+        widget.WindowName.__init__(self, width, **config)
+        self.add_defaults(StableWindowName.defaults)
+        self.slot = 0
+        self.draws = 0
+        self.relayouts = 0
+        self._pending = None
+        self._shown = None
+        self._handle = None
+        self._last_draw = 0.0
+
+    def update(self, text):
+        # Called by WindowName's hooks with every new title.
+        self._pending = "" if text is None else text
+        if self._handle is not None:
+            return
+        wait = self._last_draw + self.latency - time.monotonic()
+        if wait <= 0:
+            self._flush()
+        else:
+            self._handle = self.timeout_add(wait, self._flush)
+
+    def _flush(self):
+        self._handle = None
+        self._last_draw = time.monotonic()
+        # self.text is cut to max_chars, so compare against the raw title.
+        if self._pending == self._shown:
+            return
+        self._shown = self.text = self._pending
+        self.layout.reset_width()
+        needed = self.layout.width + self.actual_padding * 2 if self.text else 0
+        slot = self.fit(needed)
+        if needed and slot >= needed:
+            # The layout is created centre-aligned; a fixed width keeps it so.
+            self.layout.width = slot - self.actual_padding * 2
+        self.draws += 1
+        if slot != self.slot:
+            self.slot = slot
+            self.relayouts += 1
+            self.bar.draw()
+        else:
+            self.draw()
+
+    def fit(self, needed):
+        if not needed:
+            return 0
+        if self.slot >= needed >= self.slot * (1 - self.hysteresis):
+            return self.slot
+        return min(-(-needed // self.slot_step) * self.slot_step, self.bar.width)
+
+    def calculate_length(self):
+        return self.slot
+
+    def finalize(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        widget.WindowName.finalize(self)